@@ -0,0 +1,78 @@
+"""Opaque-cursor pagination over newest-first lists.
+
+A cursor encodes the sort key of the last item returned, not an offset, so
+pages stay consistent while new items arrive at the head of the list. Keys
+are built so ascending key order is newest first: transactions by
+(block, transaction index), DeFi swaps by timestamp, each with the hash or id
+as a tie-breaker.
+"""
+import base64
+import bisect
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+SortKey = Tuple[Any, ...]
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def _int(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def transaction_key(tx: Dict) -> SortKey:
+    return (-_int(tx.get("blockNumber")), -_int(tx.get("transactionIndex")), tx.get("hash") or "")
+
+def defi_key(swap: Dict) -> SortKey:
+    return (-_int(swap.get("timestamp")), swap.get("id") or "")
+
+# Types of each cursor kind's sort key fields, checked before a key is compared
+CURSOR_FIELDS = {
+    "transactions": (int, int, str),
+    "defi_transactions": (int, str)
+}
+
+def encode_cursor(kind: str, key: SortKey) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([kind, *key])).decode().rstrip("=")
+
+def decode_cursor(kind: str, cursor: str) -> SortKey:
+    """Sort key from a cursor; raises ValueError for malformed or foreign cursors"""
+    try:
+        decoded = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(decoded, list) or not decoded or decoded[0] != kind:
+        raise ValueError("Invalid cursor")
+    key = tuple(decoded[1:])
+    fields = CURSOR_FIELDS.get(kind)
+    if fields is not None and (
+        len(key) != len(fields)
+        # bool is an int subclass but never a valid key field
+        or not all(type(value) is field for value, field in zip(key, fields))
+    ):
+        raise ValueError("Invalid cursor")
+    return key
+
+def paginate(
+    items: List[Dict],
+    kind: str,
+    sort_key: Callable[[Dict], SortKey],
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[List[Dict], Optional[str]]:
+    """One page of items after cursor, newest first, and the cursor for the next page (None at the end)"""
+    # Upstream lists already arrive newest first, so this sort is a linear pass
+    ordered = sorted(items, key=sort_key)
+    start = 0
+    if cursor:
+        after = decode_cursor(kind, cursor)
+        try:
+            start = bisect.bisect_right(ordered, after, key=sort_key)
+        except TypeError:
+            raise ValueError("Invalid cursor")
+    page = ordered[start:start + limit]
+    has_more = start + limit < len(ordered)
+    return page, encode_cursor(kind, sort_key(page[-1])) if page and has_more else None
@@ -0,0 +1,181 @@
+"""Wallet analysis response bodies, pre-serialized for the cache.
+
+A cached hit on /wallet/{address} is served from bytes stored at analysis
+time: the formatted response orjson-encoded once, plus gzip and zstd variants
+when it is large enough to be worth compressing. The route picks the variant
+matching Accept-Encoding, falling back to the uncompressed body when only that
+is stored, and sends it after a single Redis round trip, with no unpickling or
+JSON encoding per request.
+
+Each stored value starts with one flag byte:
+
+    FLAG_WARMED     written by the cache warmer
+    FLAG_IDENTITY   body is uncompressed
+
+The request id travels in the X-Request-ID header only, since stored bodies
+are shared by every request; /wallet/{address} bodies leave it out on misses
+too, so hits and misses have the same shape.
+"""
+import gzip
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import orjson
+import zstandard
+from fastapi.responses import Response
+
+from config import settings
+from utils.cache import cache_wallet_response, get_cached_wallet_response
+
+FLAG_WARMED = 1
+FLAG_IDENTITY = 2
+
+_local = threading.local()
+
+def _zstd_compressor() -> zstandard.ZstdCompressor:
+    """Per-thread compressor; ZstdCompressor instances are not thread-safe"""
+    if not hasattr(_local, "zstd"):
+        _local.zstd = zstandard.ZstdCompressor(level=settings.response_zstd_level)
+    return _local.zstd
+
+def dumps(data) -> bytes:
+    return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+def format_wallet_response(result: dict, address: str) -> dict:
+    """Transform a wallet analysis result to match frontend expectations"""
+    summary = result.get("summary", {})
+    etherscan = result.get("data_sources", {}).get("etherscan", {})
+    transactions = etherscan.get("transactions", [])
+    # Calculate total value and avg transaction value
+    total_value = sum(float(tx.get("value", 0)) for tx in transactions) if transactions else 0
+    avg_transaction = total_value / len(transactions) if transactions else 0
+    # Prepare recent transactions (take up to 10 most recent)
+    recent_transactions = []
+    for tx in transactions[:10]:
+        recent_transactions.append({
+            "id": tx.get("hash", ""),
+            "hash": tx.get("hash", ""),
+            "type": "incoming" if tx.get("to", "").lower() == address.lower() else "outgoing",
+            "amount": tx.get("value", "0"),
+            "value": tx.get("value", "0"),
+            "to": tx.get("to", ""),
+            "from": tx.get("from", ""),
+            "timestamp": tx.get("timeStamp", ""),
+            "gas": tx.get("gas", "")
+        })
+    # Prepare activities (empty for now)
+    activities = []
+    # Prepare metrics (empty for now)
+    metrics = []
+    # Calculate activeSince (from oldest transaction)
+    if transactions:
+        oldest = min(transactions, key=lambda tx: int(tx.get("timeStamp", "0") or 0))
+        active_since = datetime.utcfromtimestamp(int(oldest.get("timeStamp", "0"))).strftime("%Y-%m-%d")
+    else:
+        active_since = ""
+    return {
+        "score": result.get("trust_score", 0),
+        "address": result.get("wallet_address", address),
+        "metrics": metrics,
+        "recentTransactions": recent_transactions,
+        "activities": activities,
+        "totalValue": str(total_value),
+        "transactionCount": summary.get("total_transactions", 0),
+        "avgTransaction": str(avg_transaction),
+        "activeSince": active_since,
+        # Optionally include other fields as needed
+    }
+
+# Fields a client can request with ?fields=, and the analysis stages or data
+# sources each needs (see blockchain.wallet_analyzer.resolve_stages)
+WALLET_FIELD_STAGES = {
+    "score": {"trust_score"},
+    "address": set(),
+    "metrics": set(),
+    "recentTransactions": {"etherscan"},
+    "activities": set(),
+    "totalValue": {"etherscan"},
+    "transactionCount": {"etherscan"},
+    "avgTransaction": {"etherscan"},
+    "activeSince": {"etherscan"},
+    "riskScore": {"risk"},
+    "anomalies": {"anomalies"},
+    "patterns": {"patterns"},
+    "clusterId": {"cluster"}
+}
+# Fields beyond the default response, taken from the analysis result
+_ANALYSIS_FIELDS = {
+    "riskScore": "risk_score",
+    "anomalies": "anomalies",
+    "patterns": "patterns",
+    "clusterId": "cluster_id"
+}
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Requested field names from a comma-separated list; raises ValueError for unknown fields"""
+    if fields is None:
+        return None
+    requested = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in WALLET_FIELD_STAGES]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if not requested:
+        raise ValueError("No fields requested")
+    return requested
+
+def stages_for_fields(fields: List[str]) -> Set[str]:
+    """Analysis stages and data sources needed to produce fields"""
+    return set().union(*(WALLET_FIELD_STAGES[field] for field in fields))
+
+def project_wallet_response(result: dict, address: str, fields: List[str]) -> dict:
+    """Only the requested fields of the formatted response"""
+    formatted = format_wallet_response(result, address)
+    return {
+        field: result.get(_ANALYSIS_FIELDS[field]) if field in _ANALYSIS_FIELDS else formatted[field]
+        for field in fields
+    }
+
+def encode_variants(body: bytes, warmed: bool = False) -> Dict[str, bytes]:
+    """Flagged body per cached encoding; small bodies are stored uncompressed only"""
+    flags = FLAG_WARMED if warmed else 0
+    identity = bytes([flags | FLAG_IDENTITY]) + body
+    if len(body) < settings.response_compress_min_bytes:
+        return {"identity": identity}
+    return {
+        "identity": identity,
+        "gzip": bytes([flags]) + gzip.compress(body, compresslevel=settings.response_gzip_level, mtime=0),
+        "zstd": bytes([flags]) + _zstd_compressor().compress(body)
+    }
+
+def store_wallet_response(address: str, network: str, result: dict, warmed: bool = False, ttl: int = 3600) -> bytes:
+    """Pre-serialize the cached-hit response for an analysis; returns the uncompressed body"""
+    body = dumps({"success": True, "data": format_wallet_response(result, address), "cached": True})
+    cache_wallet_response(address, network, encode_variants(body, warmed), ttl)
+    return body
+
+def choose_encoding(accept_encoding: Optional[str]) -> str:
+    """Best cached encoding the client accepts: zstd, then gzip, then identity"""
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip())
+    if "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return "identity"
+
+def cached_response(address: str, network: str, accept_encoding: Optional[str]) -> Optional[Tuple[Response, bool]]:
+    """Stored response for a wallet in the client's encoding, and whether the warmer wrote it"""
+    encoding = choose_encoding(accept_encoding)
+    value = get_cached_wallet_response(address, network, encoding)
+    if not value:
+        return None
+    flags = value[0]
+    headers = {"Vary": "Accept-Encoding"}
+    if not flags & FLAG_IDENTITY:
+        headers["Content-Encoding"] = encoding
+    return Response(content=value[1:], media_type="application/json", headers=headers), bool(flags & FLAG_WARMED)
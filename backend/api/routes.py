@@ -1,19 +1,32 @@
 import time
+import json
 from fastapi import APIRouter, HTTPException, Request, Query, Depends
+from fastapi.responses import Response, StreamingResponse
 from langchain_tools.assistant import handle_user_query
+from api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, defi_key, paginate, transaction_key
+from api.responses import (
+    cached_response, format_wallet_response, parse_fields,
+    project_wallet_response, stages_for_fields, store_wallet_response
+)
 from blockchain.wallet_analyzer import WalletAnalyzer
 from blockchain.data_fetcher import DataFetcher
-from typing import Optional
+from ml.features import FEATURE_SCHEMA_VERSION, features_from_analysis
+from ml.models import explain_features, score_wallet_async
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Iterator, Optional
 from config import settings
+from jobs.queue import get_job_queue
+from utils.address import is_valid_address
 from utils.logger import get_logger, log_wallet_analysis, log_api_call
 from utils.cache import (
-    cache_wallet_analysis, get_cached_wallet_analysis,
+    cache_wallet_analysis, get_cached_wallet_analysis, get_wallet_analysis_ttl,
     cache_transaction_data, get_cached_transaction_data,
     cache_defi_data, get_cached_defi_data
 )
+from utils.heavy_hitters import heavy_hitters
 from utils.monitoring import (
     WALLET_ANALYSIS_COUNT, WALLET_ANALYSIS_DURATION,
-    API_CALL_COUNT, API_CALL_DURATION
+    API_CALL_COUNT, API_CALL_DURATION, CACHE_WARM_HITS
 )
 
 logger = get_logger(__name__)
@@ -45,36 +58,59 @@ async def assistant_query(request: Request):
 async def analyze_wallet(
     address: str, 
     network: str = Query("ethereum", description="Blockchain network"),
+    explain: bool = Query(False, description="Include the top ML feature contributions"),
+    fields: Optional[str] = Query(None, description="Comma-separated response fields; only the stages they need are run"),
     request: Request = None
 ):
     """Analyze a wallet address and return comprehensive scoring"""
     start_time = time.time()
     
     try:
+        heavy_hitters.record(address, network)
+        requested_fields = parse_fields(fields)
+        if requested_fields is not None:
+            return await _analyze_wallet_fields(address, network, requested_fields, explain, start_time)
+        
+        # Pre-serialized body: one Redis GET and a socket write
+        if not explain:
+            hit = cached_response(address, network, request.headers.get("accept-encoding"))
+            if hit:
+                response, warmed = hit
+                WALLET_ANALYSIS_COUNT.labels(network=network, status="cached").inc()
+                if warmed:
+                    CACHE_WARM_HITS.labels(network=network).inc()
+                return response
+        
         # Check cache first
         cached_result = get_cached_wallet_analysis(address, network)
         if cached_result:
             logger.info("Returning cached wallet analysis", wallet_address=address, network=network)
             WALLET_ANALYSIS_COUNT.labels(network=network, status="cached").inc()
-            return {
-                "success": True,
-                "data": cached_result,
-                "cached": True,
-                "request_id": getattr(request.state, "request_id", "unknown")
-            }
+            warmed = cached_result.pop("cache_warmed_at", None) is not None
+            if warmed:
+                CACHE_WARM_HITS.labels(network=network).inc()
+            if explain:
+                wallet_data = format_wallet_response(cached_result, address)
+                wallet_data["explanation"] = await run_in_threadpool(_explain_analysis, cached_result)
+                return {"success": True, "data": wallet_data, "cached": True}
+            # Cached by a job without a stored body: serialize it once for the following hits
+            ttl = get_wallet_analysis_ttl(address, network)
+            body = store_wallet_response(address, network, cached_result, warmed, ttl if ttl > 0 else 3600)
+            return Response(content=body, media_type="application/json")
         
         logger.info("Starting wallet analysis", wallet_address=address, network=network)
         
-        # Perform analysis
+        # Perform analysis off the event loop
         analyzer = WalletAnalyzer()
-        result = analyzer.analyze_wallet(address, network)
+        result = await run_in_threadpool(analyzer.analyze_wallet, address, network)
         
         if not result.get("success", True):
             WALLET_ANALYSIS_COUNT.labels(network=network, status="failed").inc()
             raise HTTPException(status_code=400, detail=result.get("error", "Analysis failed"))
         
-        # Cache the result
+        # Cache the result, and the body later hits are served from
         cache_wallet_analysis(address, network, result)
+        store_wallet_response(address, network, result)
         
         # Record metrics
         duration = time.time() - start_time
@@ -86,56 +122,14 @@ async def analyze_wallet(
         log_wallet_analysis(address, network, trust_score, duration)
         
         # Transform result to match frontend expectations
-        summary = result.get("summary", {})
-        etherscan = result.get("data_sources", {}).get("etherscan", {})
-        transactions = etherscan.get("transactions", [])
-        # Calculate total value and avg transaction value
-        total_value = sum(float(tx.get("value", 0)) for tx in transactions) if transactions else 0
-        avg_transaction = total_value / len(transactions) if transactions else 0
-        # Prepare recent transactions (take up to 10 most recent)
-        recent_transactions = []
-        for tx in transactions[:10]:
-            recent_transactions.append({
-                "id": tx.get("hash", ""),
-                "hash": tx.get("hash", ""),
-                "type": "incoming" if tx.get("to", "").lower() == address.lower() else "outgoing",
-                "amount": tx.get("value", "0"),
-                "value": tx.get("value", "0"),
-                "to": tx.get("to", ""),
-                "from": tx.get("from", ""),
-                "timestamp": tx.get("timeStamp", ""),
-                "gas": tx.get("gas", "")
-            })
-        # Prepare activities (empty for now)
-        activities = []
-        # Prepare metrics (empty for now)
-        metrics = []
-        # Calculate activeSince (from oldest transaction)
-        if transactions:
-            oldest = min(transactions, key=lambda tx: int(tx.get("timeStamp", "0") or 0))
-            from datetime import datetime
-            active_since = datetime.utcfromtimestamp(int(oldest.get("timeStamp", "0"))).strftime("%Y-%m-%d")
-        else:
-            active_since = ""
-        wallet_data = {
-            "score": result.get("trust_score", 0),
-            "address": result.get("wallet_address", address),
-            "metrics": metrics,
-            "recentTransactions": recent_transactions,
-            "activities": activities,
-            "totalValue": str(total_value),
-            "transactionCount": summary.get("total_transactions", 0),
-            "avgTransaction": str(avg_transaction),
-            "activeSince": active_since,
-            # Optionally include other fields as needed
-        }
-        return {
-            "success": True,
-            "data": wallet_data,
-            "cached": False,
-            "request_id": getattr(request.state, "request_id", "unknown")
-        }
+        # Same shape as the stored body of a cached hit; the request id is in X-Request-ID
+        wallet_data = format_wallet_response(result, address)
+        if explain:
+            wallet_data["explanation"] = await run_in_threadpool(_explain_analysis, result)
+        return {"success": True, "data": wallet_data, "cached": False}
         
+    except HTTPException:
+        raise
     except ValueError as e:
         WALLET_ANALYSIS_COUNT.labels(network=network, status="failed").inc()
         logger.error("Wallet analysis validation error", wallet_address=address, error=str(e))
@@ -145,13 +139,195 @@ async def analyze_wallet(
         logger.error("Wallet analysis failed", wallet_address=address, error=str(e))
         raise HTTPException(status_code=500, detail="Internal server error")
 
+async def _analyze_wallet_fields(
+    address: str,
+    network: str,
+    fields: list,
+    explain: bool,
+    start_time: float
+) -> dict:
+    """Projected wallet analysis: served from a cached full analysis, or computed with only the needed stages"""
+    result = get_cached_wallet_analysis(address, network)
+    cached = result is not None
+    if cached:
+        WALLET_ANALYSIS_COUNT.labels(network=network, status="cached").inc()
+        if result.pop("cache_warmed_at", None) is not None:
+            CACHE_WARM_HITS.labels(network=network).inc()
+    else:
+        stages = stages_for_fields(fields)
+        logger.info("Starting projected wallet analysis", wallet_address=address, network=network, stages=sorted(stages))
+        # Unrequested sources are not fetched, and the partial history is kept out of the
+        # transfer graph, the aggregate and the feature store
+        analyzer = WalletAnalyzer(record=False)
+        result = await run_in_threadpool(analyzer.analyze_wallet, address, network, stages)
+        if not result.get("success", True):
+            WALLET_ANALYSIS_COUNT.labels(network=network, status="failed").inc()
+            raise HTTPException(status_code=400, detail=result.get("error", "Analysis failed"))
+        # Partial analyses are not cached; they would shadow the full one
+        duration = time.time() - start_time
+        WALLET_ANALYSIS_COUNT.labels(network=network, status="success").inc()
+        WALLET_ANALYSIS_DURATION.labels(network=network).observe(duration)
+    
+    wallet_data = project_wallet_response(result, address, fields)
+    if explain:
+        wallet_data["explanation"] = await run_in_threadpool(_explain_analysis, result)
+    return {"success": True, "data": wallet_data, "cached": cached}
+
+def _explain_analysis(result: dict) -> Optional[list]:
+    """Top ML feature contributions for an analysis result, or None if the model is unavailable"""
+    try:
+        return explain_features(features_from_analysis(result))[0]
+    except Exception as e:
+        logger.warning("Wallet explanation unavailable", error=str(e))
+        return None
+
+def _sse_event(event: str, data: Any) -> str:
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _summarize_stage(stage: str, payload: Any) -> Any:
+    """Reduce a pipeline stage payload to what a progressive client needs"""
+    if stage == "etherscan":
+        return {
+            "success": payload.get("success", False),
+            "count": payload.get("count", len(payload.get("transactions", []))),
+            "error": payload.get("error")
+        }
+    if stage == "alchemy":
+        return {
+            "success": payload.get("success", False),
+            "count": payload.get("count", len(payload.get("transfers", []))),
+            "error": payload.get("error")
+        }
+    if stage == "risk":
+        return {key: value for key, value in payload.items() if key != "pattern_analysis"}
+    if stage == "trust_score":
+        return {"score": payload}
+    if stage == "cluster":
+        return {"cluster_id": payload}
+    return payload
+
+def _wallet_event_stream(address: str, network: str, cached_result: Optional[dict]) -> Iterator[str]:
+    """Run the wallet analysis pipeline and render each stage as an SSE event"""
+    if cached_result:
+        WALLET_ANALYSIS_COUNT.labels(network=network, status="cached").inc()
+        yield _sse_event("result", {"data": format_wallet_response(cached_result, address), "cached": True})
+        return
+    
+    start_time = time.time()
+    try:
+        analyzer = WalletAnalyzer()
+        for stage, payload in analyzer.iter_analysis(address, network):
+            if stage != "result":
+                yield _sse_event(stage, _summarize_stage(stage, payload))
+                continue
+            
+            if not payload.get("success", True):
+                WALLET_ANALYSIS_COUNT.labels(network=network, status="failed").inc()
+                yield _sse_event("error", {"error": payload.get("error", "Analysis failed")})
+                return
+            
+            # Cache the result, and the body the next plain GET is served from
+            cache_wallet_analysis(address, network, payload)
+            store_wallet_response(address, network, payload)
+            
+            duration = time.time() - start_time
+            WALLET_ANALYSIS_COUNT.labels(network=network, status="success").inc()
+            WALLET_ANALYSIS_DURATION.labels(network=network).observe(duration)
+            log_wallet_analysis(address, network, payload.get("trust_score", 0), duration)
+            
+            yield _sse_event("result", {"data": format_wallet_response(payload, address), "cached": False})
+    except Exception as e:
+        WALLET_ANALYSIS_COUNT.labels(network=network, status="failed").inc()
+        logger.error("Streaming wallet analysis failed", wallet_address=address, error=str(e))
+        yield _sse_event("error", {"error": "Internal server error"})
+
+@router.get("/wallet/{address}/stream")
+async def stream_wallet_analysis(
+    address: str,
+    network: str = Query("ethereum", description="Blockchain network"),
+    request: Request = None
+):
+    """Stream wallet analysis progress as Server-Sent Events"""
+    if not is_valid_address(address):
+        raise HTTPException(status_code=400, detail="Invalid wallet address")
+    
+    logger.info("Starting streaming wallet analysis", wallet_address=address, network=network)
+    heavy_hitters.record(address, network)
+    cached_result = get_cached_wallet_analysis(address, network)
+    if cached_result and cached_result.pop("cache_warmed_at", None) is not None:
+        CACHE_WARM_HITS.labels(network=network).inc()
+    
+    # StreamingResponse drives the synchronous pipeline in a threadpool
+    return StreamingResponse(
+        _wallet_event_stream(address, network, cached_result),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Request-ID": getattr(request.state, "request_id", "unknown")
+        }
+    )
+
+@router.get("/wallet/{address}/ml-score")
+async def get_wallet_ml_score(
+    address: str,
+    network: str = Query("ethereum", description="Blockchain network"),
+    request: Request = None
+):
+    """Score a wallet with the ML model"""
+    if not is_valid_address(address):
+        raise HTTPException(status_code=400, detail="Invalid wallet address")
+    
+    try:
+        score = await score_wallet_async(address, network)
+    except RuntimeError as e:
+        logger.error("ML scoring unavailable", wallet_address=address, error=str(e))
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error("ML scoring failed", wallet_address=address, error=str(e))
+        raise HTTPException(status_code=500, detail="Internal server error")
+    
+    return {
+        "success": True,
+        "data": {
+            "address": address,
+            "network": network,
+            "score": score,
+            "feature_schema": FEATURE_SCHEMA_VERSION
+        },
+        "request_id": getattr(request.state, "request_id", "unknown")
+    }
+
+def _check_cursor(items_key: str, cursor: Optional[str]):
+    """Reject malformed cursors up front with a 400"""
+    if cursor:
+        try:
+            decode_cursor(items_key, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+def _paginate_result(result: dict, items_key: str, sort_key, limit: Optional[int], cursor: Optional[str]) -> dict:
+    """One page of result[items_key] with its next cursor; the full result when not paginating"""
+    if limit is None and cursor is None:
+        return result
+    items = result.get(items_key) or []
+    page, next_cursor = paginate(items, items_key, sort_key, limit or DEFAULT_PAGE_SIZE, cursor)
+    return dict(result, **{items_key: page}, count=len(page), total=len(items), next_cursor=next_cursor)
+
 @router.get("/wallet/{address}/transactions")
 async def get_wallet_transactions(
     address: str, 
     network: str = Query("ethereum", description="Blockchain network"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; paginates newest first"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the previous page's next_cursor"),
     request: Request = None
 ):
     """Get transaction history for a wallet"""
+    if not is_valid_address(address):
+        raise HTTPException(status_code=400, detail="Invalid wallet address")
+    _check_cursor("transactions", cursor)
+    
     start_time = time.time()
     
     try:
@@ -161,7 +337,7 @@ async def get_wallet_transactions(
             logger.info("Returning cached transaction data", wallet_address=address, network=network)
             return {
                 "success": True,
-                "data": cached_result,
+                "data": _paginate_result(cached_result, "transactions", transaction_key, limit, cursor),
                 "cached": True,
                 "request_id": getattr(request.state, "request_id", "unknown")
             }
@@ -186,11 +362,13 @@ async def get_wallet_transactions(
         
         return {
             "success": True,
-            "data": result,
+            "data": _paginate_result(result, "transactions", transaction_key, limit, cursor),
             "cached": False,
             "request_id": getattr(request.state, "request_id", "unknown")
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         API_CALL_COUNT.labels(api_name="etherscan", status="failed").inc()
         logger.error("Transaction fetch failed", wallet_address=address, error=str(e))
@@ -226,6 +404,8 @@ async def get_wallet_balance(
             "request_id": getattr(request.state, "request_id", "unknown")
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         API_CALL_COUNT.labels(api_name="rpc", status="failed").inc()
         logger.error("Balance fetch failed", wallet_address=address, error=str(e))
@@ -234,9 +414,15 @@ async def get_wallet_balance(
 @router.get("/wallet/{address}/defi")
 async def get_wallet_defi_activity(
     address: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; paginates newest first"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the previous page's next_cursor"),
     request: Request = None
 ):
     """Get DeFi activity for a wallet"""
+    if not is_valid_address(address):
+        raise HTTPException(status_code=400, detail="Invalid wallet address")
+    _check_cursor("defi_transactions", cursor)
+    
     start_time = time.time()
     
     try:
@@ -246,7 +432,7 @@ async def get_wallet_defi_activity(
             logger.info("Returning cached DeFi data", wallet_address=address)
             return {
                 "success": True,
-                "data": cached_result,
+                "data": _paginate_result(cached_result, "defi_transactions", defi_key, limit, cursor),
                 "cached": True,
                 "request_id": getattr(request.state, "request_id", "unknown")
             }
@@ -270,16 +456,75 @@ async def get_wallet_defi_activity(
         
         return {
             "success": True,
-            "data": result,
+            "data": _paginate_result(result, "defi_transactions", defi_key, limit, cursor),
             "cached": False,
             "request_id": getattr(request.state, "request_id", "unknown")
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         API_CALL_COUNT.labels(api_name="the_graph", status="failed").inc()
         logger.error("DeFi data fetch failed", wallet_address=address, error=str(e))
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/jobs", status_code=202)
+async def create_job(request: Request):
+    """Enqueue a wallet analysis job for the background workers"""
+    data = await request.json()
+    job_type = data.get("type", "wallet_analysis")
+    network = data.get("network", "ethereum")
+    
+    if job_type == "wallet_analysis":
+        addresses = [data.get("address")]
+        payload = {"address": data.get("address"), "network": network}
+    elif job_type == "batch_analysis":
+        addresses = data.get("addresses") or []
+        if len(addresses) > settings.job_max_batch_size:
+            raise HTTPException(status_code=400, detail=f"Batch exceeds {settings.job_max_batch_size} addresses")
+        payload = {"addresses": addresses, "network": network}
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported job type: {job_type}")
+    
+    if not addresses or not all(isinstance(a, str) and is_valid_address(a) for a in addresses):
+        raise HTTPException(status_code=400, detail="Invalid wallet address")
+    
+    job = get_job_queue().submit(job_type, payload)
+    logger.info("Job enqueued", job_id=job["id"], job_type=job_type, addresses=len(addresses))
+    
+    return {
+        "success": True,
+        "data": job,
+        "request_id": getattr(request.state, "request_id", "unknown")
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request = None):
+    """Get a job's status, progress and result"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return {
+        "success": True,
+        "data": job,
+        "request_id": getattr(request.state, "request_id", "unknown")
+    }
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, request: Request = None):
+    """Cancel a queued or running job"""
+    job = get_job_queue().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    logger.info("Job cancellation requested", job_id=job_id, status=job["status"])
+    return {
+        "success": True,
+        "data": job,
+        "request_id": getattr(request.state, "request_id", "unknown")
+    }
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -0,0 +1,244 @@
+"""Per-wallet streaming aggregates.
+
+A WalletAggregate summarizes a wallet's transaction history in constant
+space: Welford mean/variance of values, first/last timestamps, counters, and
+HyperLogLog sketches of counterparties. Applying new transactions costs
+O(new transactions), and the pattern statistics it reports are the ones
+DataFetcher.analyze_transaction_patterns computes from the full history, so
+risk and trust scores can be refreshed without refetching or rescanning it.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from utils.cache import cache_wallet_aggregate, get_cached_wallet_aggregate, update_cached_wallet_aggregate
+from utils.sketches import HyperLogLog
+from .transaction_sketch import iter_chunks
+
+class WalletAggregate:
+    """Incrementally maintained transaction statistics for one wallet"""
+
+    def __init__(self, wallet_address: str):
+        self.wallet_address = wallet_address
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.total_value = 0.0
+        self.max_value = 0.0
+        self.first_timestamp: Optional[int] = None
+        self.last_timestamp: Optional[int] = None
+        self.outgoing = 0
+        self.failed = 0
+        self.contract_calls = 0
+        self.unique_to = HyperLogLog()
+        self.unique_from = HyperLogLog()
+        # Highest block applied, and the hashes applied from it, so overlapping batches are not double-counted
+        self.last_block = -1
+        self.last_block_hashes: List[str] = []
+        # Latest values from the non-transaction sources, used when scoring without a full fetch
+        self.defi_transactions = 0
+        self.balance_data: Dict[str, Any] = {}
+        self.updated_at: Optional[str] = None
+
+    def checkpoint(self) -> Tuple[int, Set[str]]:
+        """The highest block applied and its hashes, which update() deduplicates against"""
+        return self.last_block, set(self.last_block_hashes)
+
+    def update(self, transactions: List[Dict], since: Optional[Tuple[int, Set[str]]] = None) -> int:
+        """Apply transactions not yet seen; returns how many were applied.
+
+        Long lists are applied in sketch-sized chunks so the per-batch arrays stay
+        bounded. since defaults to the current checkpoint(); pass the one from
+        before the first page to apply a newest-first history page by page.
+        """
+        last_block, last_block_hashes = since or self.checkpoint()
+
+        def is_new(tx: Dict) -> bool:
+            block = int(tx.get("blockNumber") or 0)
+            return block > last_block or (block == last_block and tx.get("hash") not in last_block_hashes)
+
+        applied = 0
+        for chunk in iter_chunks(transactions):
+            new = [tx for tx in chunk if is_new(tx)]
+            if new:
+                applied += self._apply(new)
+        if applied:
+            self.updated_at = datetime.now().isoformat()
+        return applied
+
+    def _apply(self, new: List[Dict]) -> int:
+        """Fold a batch of unseen transactions into the statistics"""
+        # Raw values, matching DataFetcher.analyze_transaction_patterns
+        values = np.array([float(tx.get("value", 0) or 0) for tx in new])
+        timestamps = np.array([int(tx.get("timeStamp", 0) or 0) for tx in new])
+
+        # Chan et al. merge of the batch into the running mean/variance
+        n, batch_mean = len(values), float(values.mean())
+        batch_m2 = float(((values - batch_mean) ** 2).sum())
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += batch_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+        self.total_value += float(values.sum())
+        self.max_value = max(self.max_value, float(values.max()))
+
+        first, last = int(timestamps.min()), int(timestamps.max())
+        self.first_timestamp = first if self.first_timestamp is None else min(self.first_timestamp, first)
+        self.last_timestamp = last if self.last_timestamp is None else max(self.last_timestamp, last)
+
+        wallet = self.wallet_address.lower()
+        self.outgoing += sum(1 for tx in new if (tx.get("from") or "").lower() == wallet)
+        self.failed += sum(1 for tx in new if tx.get("isError") == "1")
+        self.contract_calls += sum(1 for tx in new if tx.get("input") not in (None, "", "0x"))
+        self.unique_to.add_addresses(tx.get("to") for tx in new)
+        self.unique_from.add_addresses(tx.get("from") for tx in new)
+
+        newest = max(int(tx.get("blockNumber") or 0) for tx in new)
+        if newest > self.last_block:
+            self.last_block = newest
+            self.last_block_hashes = []
+        self.last_block_hashes.extend(tx.get("hash") for tx in new if int(tx.get("blockNumber") or 0) == newest)
+        return n
+
+    def update_context(self, wallet_data: Dict):
+        """Remember the latest DeFi count and balance from a full fetch"""
+        self.defi_transactions = wallet_data["summary"]["defi_transactions"]
+        self.balance_data = wallet_data["data_sources"]["balance"]
+
+    @property
+    def std(self) -> float:
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+    @property
+    def span_seconds(self) -> int:
+        if self.first_timestamp is None:
+            return 0
+        return self.last_timestamp - self.first_timestamp
+
+    def pattern_summary(self) -> Dict[str, Any]:
+        """Same shape as DataFetcher.analyze_transaction_patterns, computed from the aggregate"""
+        if self.count == 0:
+            return {"error": "No transactions to analyze"}
+        span = self.span_seconds
+        return {
+            "success": True,
+            "total_transactions": self.count,
+            "total_value_eth": self.total_value,
+            "average_value_eth": self.mean,
+            "average_daily_transactions": self.count / (span / 86400 + 1),
+            "unique_to_addresses": int(round(self.unique_to.count())),
+            "unique_from_addresses": int(round(self.unique_from.count())),
+            "transaction_span_days": span / 86400 if span > 0 else 0,
+            "value_std": self.std,
+            "unique_count_relative_error": self.unique_to.relative_error
+        }
+
+    def wallet_data(self) -> Dict[str, Any]:
+        """Minimal wallet data structure for assess_risk/calculate_trust_score"""
+        return {
+            "wallet_address": self.wallet_address,
+            "data_sources": {"balance": self.balance_data},
+            "summary": {
+                "total_transactions": self.count,
+                "defi_transactions": self.defi_transactions,
+                "has_balance": self.balance_data.get("success", False)
+            }
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        state["unique_to"] = self.unique_to.to_dict()
+        state["unique_from"] = self.unique_from.to_dict()
+        return state
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "WalletAggregate":
+        aggregate = cls(state["wallet_address"])
+        aggregate.__dict__.update(state)
+        aggregate.unique_to = HyperLogLog.from_dict(state["unique_to"])
+        aggregate.unique_from = HyperLogLog.from_dict(state["unique_from"])
+        return aggregate
+
+def load_wallet_aggregate(wallet_address: str, network: str) -> Optional[WalletAggregate]:
+    """Load a wallet's persisted aggregate"""
+    state = get_cached_wallet_aggregate(wallet_address, network)
+    return WalletAggregate.from_dict(state) if state else None
+
+def save_wallet_aggregate(aggregate: WalletAggregate, network: str) -> bool:
+    """Persist a wallet's aggregate"""
+    return cache_wallet_aggregate(aggregate.wallet_address, network, aggregate.to_dict())
+
+def update_wallet_aggregate(
+    wallet_address: str,
+    network: str,
+    transactions: List[Dict],
+    wallet_data: Optional[Dict] = None,
+    balance_data: Optional[Dict] = None,
+    create: bool = True,
+    save: bool = True
+) -> Tuple[Optional[WalletAggregate], int]:
+    """Apply transactions and the latest context to a wallet's aggregate.
+
+    Returns the aggregate (None if the wallet had none and create is off) and
+    how many transactions were new. Saving runs the load, update and save under
+    WATCH, so concurrent analyses of one wallet never drop each other's updates.
+    """
+    updated: Optional[WalletAggregate] = None
+    applied = 0
+
+    def apply(state: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        nonlocal updated, applied
+        if state is None and not create:
+            updated, applied = None, 0
+            return None
+        updated = WalletAggregate.from_dict(state) if state else WalletAggregate(wallet_address)
+        applied = updated.update(transactions)
+        if wallet_data is not None:
+            updated.update_context(wallet_data)
+        if balance_data is not None:
+            updated.balance_data = balance_data
+        return updated.to_dict()
+
+    if save:
+        update_cached_wallet_aggregate(wallet_address, network, apply)
+    else:
+        apply(get_cached_wallet_aggregate(wallet_address, network))
+    return updated, applied
+
+class AggregateStream:
+    """
+    Applies one fetched history to a wallet's aggregate page by page, for
+    histories too long to keep in memory.
+
+    save() stores the result only if no other analysis saved the wallet since
+    it was loaded. That analysis covered the same history, so keeping its
+    aggregate avoids counting the history twice.
+    """
+
+    def __init__(self, wallet_address: str, network: str):
+        self.network = network
+        state = get_cached_wallet_aggregate(wallet_address, network)
+        self.aggregate = WalletAggregate.from_dict(state) if state else WalletAggregate(wallet_address)
+        self._loaded = _state_version(state)
+        self._since = self.aggregate.checkpoint()
+        self.applied = 0
+
+    def add(self, transactions: List[Dict]):
+        self.applied += self.aggregate.update(transactions, since=self._since)
+
+    def save(self, wallet_data: Dict) -> WalletAggregate:
+        self.aggregate.update_context(wallet_data)
+
+        def replace_if_unchanged(state: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            return self.aggregate.to_dict() if _state_version(state) == self._loaded else None
+
+        update_cached_wallet_aggregate(self.aggregate.wallet_address, self.network, replace_if_unchanged)
+        return self.aggregate
+
+def _state_version(state: Optional[Dict[str, Any]]) -> Optional[Tuple]:
+    """What identifies one saved aggregate state, to detect saves by other analyses"""
+    if not state:
+        return None
+    return state["count"], state["last_block"], state["updated_at"]
@@ -0,0 +1,248 @@
+"""Offline bulk wallet scoring.
+
+Reads addresses from a CSV or Parquet file, shards them across a process pool
+and writes results incrementally as Parquet part files. Completed chunks are
+recorded in a checkpoint so an interrupted run resumes where it stopped.
+
+Bulk analyses do not record: they read counterparty exposure from the
+persisted transfer graph but never add to it, and never write wallet
+aggregates or the feature store. Each pool process still loads its own copy
+of the graph snapshot, so budget one snapshot's memory per worker.
+
+Usage:
+    python -m blockchain.bulk_score addresses.csv --output bulk_scores/ --workers 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from config import settings
+from utils.logger import get_logger
+from .data_fetcher import DataFetcher
+from .wallet_analyzer import WalletAnalyzer
+
+logger = get_logger(__name__)
+
+CHECKPOINT_FILE = "_checkpoint.json"
+
+class SharedThrottle:
+    """Request pacing shared by every process holding the same slot and lock"""
+
+    def __init__(self, requests_per_second: float, next_slot=None, lock=None):
+        self.requests_per_second = requests_per_second
+        self.interval = 1.0 / requests_per_second
+        self.next_slot = next_slot if next_slot is not None else multiprocessing.Value("d", 0.0, lock=False)
+        self.lock = lock if lock is not None else multiprocessing.Lock()
+
+    def wait(self):
+        """Block until this caller's slot in the shared quota comes up"""
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot.value)
+            self.next_slot.value = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+# Per-process analyzer, created by the pool initializer
+_worker_analyzer: Optional[WalletAnalyzer] = None
+
+def _init_worker(requests_per_second: float, next_slot, lock):
+    """Create this worker's analyzer, paced by the quota shared across the pool"""
+    global _worker_analyzer
+    throttle = SharedThrottle(requests_per_second, next_slot, lock)
+    _worker_analyzer = WalletAnalyzer(data_fetcher=DataFetcher(throttle=throttle), record=False)
+
+def _score_address(analyzer: WalletAnalyzer, address: str, network: str) -> Dict[str, Any]:
+    """Score a single address, turning failures into an error record"""
+    record = {
+        "address": address,
+        "network": network,
+        "trust_score": None,
+        "risk_score": None,
+        "risk_level": None,
+        "total_transactions": None,
+        "anomaly_count": None,
+        "error": None,
+        "scored_at": datetime.now().isoformat()
+    }
+    try:
+        result = analyzer.analyze_wallet(address, network)
+        if not result.get("success", True):
+            record["error"] = result.get("error", "Analysis failed")
+            return record
+
+        risk = result.get("risk_score", {})
+        record.update({
+            "trust_score": result.get("trust_score"),
+            "risk_score": risk.get("risk_score"),
+            "risk_level": risk.get("risk_level"),
+            "total_transactions": result.get("summary", {}).get("total_transactions"),
+            "anomaly_count": len(result.get("anomalies", []))
+        })
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+def _score_chunk(chunk_index: int, addresses: List[str], network: str) -> Tuple[int, List[Dict[str, Any]], int]:
+    """Score one chunk of addresses inside a pool worker"""
+    fetcher = _worker_analyzer.data_fetcher
+    calls_before = fetcher.upstream_calls
+    records = [_score_address(_worker_analyzer, address, network) for address in addresses]
+    return chunk_index, records, fetcher.upstream_calls - calls_before
+
+def read_addresses(path: str, column: str = "address") -> List[str]:
+    """Read unique addresses from a CSV or Parquet file, preserving order"""
+    if path.endswith(".parquet"):
+        frame = pd.read_parquet(path, columns=[column])
+    else:
+        frame = pd.read_csv(path, usecols=[column], dtype=str)
+    addresses = frame[column].dropna().str.strip()
+    return addresses[addresses != ""].drop_duplicates().tolist()
+
+def load_checkpoint(output_dir: str, run_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Load the checkpoint for a run, or start a new one"""
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return dict(run_config, completed=[])
+
+    with open(path) as f:
+        checkpoint = json.load(f)
+    for key, value in run_config.items():
+        if checkpoint.get(key) != value:
+            raise ValueError(
+                f"Checkpoint in {output_dir} was written with {key}={checkpoint.get(key)!r}, "
+                f"not {value!r}; use a fresh output directory"
+            )
+    return checkpoint
+
+def save_checkpoint(output_dir: str, checkpoint: Dict[str, Any]):
+    """Atomically persist the checkpoint"""
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def write_part(output_dir: str, chunk_index: int, records: List[Dict[str, Any]]):
+    """Atomically write one chunk of results as a Parquet part file"""
+    path = os.path.join(output_dir, f"part-{chunk_index:06d}.parquet")
+    tmp_path = path + ".tmp"
+    pd.DataFrame.from_records(records).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def run_bulk_score(
+    input_path: str,
+    output_dir: str,
+    network: str = "ethereum",
+    column: str = "address",
+    workers: Optional[int] = None,
+    chunk_size: int = 500,
+    requests_per_second: Optional[float] = None
+) -> Dict[str, Any]:
+    """Score every address in input_path, resuming from any existing checkpoint"""
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    requests_per_second = requests_per_second or settings.upstream_requests_per_second
+
+    addresses = read_addresses(input_path, column)
+    chunks = [addresses[i:i + chunk_size] for i in range(0, len(addresses), chunk_size)]
+
+    checkpoint = load_checkpoint(output_dir, {
+        "input": os.path.abspath(input_path),
+        "network": network,
+        "chunk_size": chunk_size,
+        "total_chunks": len(chunks)
+    })
+    completed = set(checkpoint["completed"])
+    pending = [i for i in range(len(chunks)) if i not in completed]
+
+    logger.info(
+        "Starting bulk scoring",
+        addresses=len(addresses),
+        chunks=len(chunks),
+        resumed_chunks=len(completed),
+        workers=workers,
+        requests_per_second=requests_per_second
+    )
+
+    start_time = time.time()
+    scored = 0
+    failed = 0
+    upstream_calls = 0
+
+    next_slot = multiprocessing.Value("d", 0.0, lock=False)
+    lock = multiprocessing.Lock()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(requests_per_second, next_slot, lock)
+    ) as executor:
+        futures = [executor.submit(_score_chunk, i, chunks[i], network) for i in pending]
+        for future in as_completed(futures):
+            chunk_index, records, chunk_calls = future.result()
+            write_part(output_dir, chunk_index, records)
+
+            checkpoint["completed"].append(chunk_index)
+            save_checkpoint(output_dir, checkpoint)
+
+            scored += len(records)
+            failed += sum(1 for record in records if record["error"])
+            upstream_calls += chunk_calls
+            elapsed = time.time() - start_time
+            logger.info(
+                "Chunk scored",
+                chunk=chunk_index,
+                completed_chunks=len(checkpoint["completed"]),
+                total_chunks=len(chunks),
+                wallets_per_second=round(scored / elapsed, 2) if elapsed > 0 else 0,
+                upstream_calls_per_wallet=round(upstream_calls / scored, 2) if scored else 0
+            )
+
+    elapsed = time.time() - start_time
+    return {
+        "addresses": len(addresses),
+        "scored": scored,
+        "failed": failed,
+        "skipped_from_checkpoint": sum(len(chunks[i]) for i in completed),
+        "elapsed_seconds": round(elapsed, 2),
+        "wallets_per_second": round(scored / elapsed, 2) if elapsed > 0 else 0,
+        "upstream_calls": upstream_calls,
+        "upstream_calls_per_wallet": round(upstream_calls / scored, 2) if scored else 0,
+        "output_dir": output_dir
+    }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Score wallet addresses in bulk")
+    parser.add_argument("input", help="CSV or Parquet file with wallet addresses")
+    parser.add_argument("--output", default="bulk_scores", help="Directory for Parquet results and checkpoint")
+    parser.add_argument("--column", default="address", help="Name of the address column")
+    parser.add_argument("--network", default="ethereum", help="Blockchain network")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Addresses per checkpointed chunk")
+    parser.add_argument(
+        "--rate", type=float, default=None,
+        help="Upstream requests per second shared by all workers (default: settings.upstream_requests_per_second)"
+    )
+    args = parser.parse_args(argv)
+
+    report = run_bulk_score(
+        args.input,
+        args.output,
+        network=args.network,
+        column=args.column,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        requests_per_second=args.rate
+    )
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
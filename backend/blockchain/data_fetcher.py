@@ -2,17 +2,25 @@ import requests
 import asyncio
 import aiohttp
 import os
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Iterator, Set, Tuple
 from datetime import datetime, timedelta
 from web3 import Web3
 from dotenv import load_dotenv
 import time
 import json
+from config import settings
+from utils.address import is_valid_address
+from utils.monitoring import tracks_upstream
+from utils.tracing import span, traced
+from .transaction_sketch import HistoryStream, TransactionSketch, use_sketch_mode
 
 load_dotenv()
 
+class UpstreamError(Exception):
+    """An upstream API answered with an error instead of data"""
+
 class DataFetcher:
-    def __init__(self):
+    def __init__(self, throttle=None):
         self.etherscan_api_key = os.getenv("ETHERSCAN_API_KEY")
         self.alchemy_api_key = os.getenv("ALCHEMY_API_KEY")
         self.the_graph_api_key = os.getenv("THE_GRAPH_API_KEY")
@@ -25,52 +33,94 @@ class DataFetcher:
         # Rate limiting
         self.last_request_time = 0
         self.min_request_interval = 0.1  # 100ms between requests
+        # Optional pacing shared with other fetchers (e.g. across bulk scoring processes)
+        self.throttle = throttle
+        
+        # Number of upstream calls made by this fetcher
+        self.upstream_calls = 0
         
+    @traced("fetch.throttle")
     def _rate_limit(self):
         """Implement rate limiting to avoid API limits"""
+        self.upstream_calls += 1
+        if self.throttle is not None:
+            self.throttle.wait()
+            return
+        
         current_time = time.time()
         time_since_last = current_time - self.last_request_time
         if time_since_last < self.min_request_interval:
             time.sleep(self.min_request_interval - time_since_last)
         self.last_request_time = time.time()
 
-    def fetch_from_etherscan(self, address: str, start_block: int = 0, end_block: int = 99999999) -> Dict[str, Any]:
-        """Fetch transaction data from Etherscan API"""
-        if not self.etherscan_api_key:
-            return {"error": "Etherscan API key not configured"}
-        
-        self._rate_limit()
-        
-        try:
-            # Get normal transactions
-            url = f"https://api.etherscan.io/api"
+    def iter_etherscan_pages(self, address: str, start_block: int = 0, end_block: int = 99999999) -> Iterator[List[Dict]]:
+        """Normal transactions from Etherscan, newest first, one page per request.
+
+        One txlist query returns at most 10,000 rows, so longer histories are
+        read by moving endblock down to the oldest block of each full page and
+        refetching that block in the next one; every page yielded ends on a
+        whole block. Raises UpstreamError when Etherscan answers with an error.
+        """
+        url = f"https://api.etherscan.io/api"
+        fetched = False
+        while True:
+            self._rate_limit()
             params = {
                 "module": "account",
                 "action": "txlist",
                 "address": address,
                 "startblock": start_block,
                 "endblock": end_block,
+                "page": 1,
+                "offset": settings.etherscan_page_size,
                 "sort": "desc",
                 "apikey": self.etherscan_api_key
             }
             
             response = requests.get(url, params=params, timeout=30)
             response.raise_for_status()
-            data = response.json()
+            with span("parse.etherscan"):
+                data = response.json()
             
-            if data["status"] == "1":
-                return {
-                    "success": True,
-                    "transactions": data["result"],
-                    "count": len(data["result"])
-                }
+            if data["status"] != "1":
+                # An empty later page just means the history is exhausted
+                if fetched and not data["result"]:
+                    return
+                raise UpstreamError(data.get("message", "Unknown error"))
+            
+            page = data["result"]
+            fetched = True
+            if len(page) < settings.etherscan_page_size:
+                yield page
+                return
+            oldest = int(page[-1]["blockNumber"])
+            complete = [tx for tx in page if int(tx["blockNumber"]) > oldest]
+            if complete:
+                # The oldest block may be cut off; it is fetched whole next time
+                yield complete
+                end_block = oldest
             else:
-                return {
-                    "success": False,
-                    "error": data.get("message", "Unknown error"),
-                    "transactions": []
-                }
-                
+                # A single block fills the page; keep it and move past it
+                yield page
+                end_block = oldest - 1
+            if end_block < start_block:
+                return
+
+    @tracks_upstream("etherscan")
+    def _read_etherscan(self, address: str, add_page: Callable[[List[Dict]], None], start_block: int, end_block: int) -> Dict[str, Any]:
+        """Pass Etherscan pages to add_page, up to etherscan_max_transactions"""
+        if not self.etherscan_api_key:
+            return {"error": "Etherscan API key not configured"}
+        
+        count = 0
+        try:
+            for page in self.iter_etherscan_pages(address, start_block, end_block):
+                add_page(page)
+                count += len(page)
+                if count >= settings.etherscan_max_transactions:
+                    break
+        except UpstreamError as e:
+            return {"success": False, "error": str(e), "transactions": []}
         except requests.exceptions.RequestException as e:
             return {
                 "success": False,
@@ -83,7 +133,33 @@ class DataFetcher:
                 "error": f"Unexpected error: {str(e)}",
                 "transactions": []
             }
+        return {"success": True, "count": count}
+
+    @traced("fetch.etherscan")
+    def fetch_from_etherscan(self, address: str, start_block: int = 0, end_block: int = 99999999) -> Dict[str, Any]:
+        """Fetch transaction data from Etherscan API"""
+        transactions: List[Dict] = []
+        result = self._read_etherscan(address, transactions.extend, start_block, end_block)
+        if result.get("success"):
+            result["transactions"] = transactions
+        return result
 
+    @traced("fetch.etherscan")
+    def stream_from_etherscan(self, address: str, history: HistoryStream) -> Dict[str, Any]:
+        """Fetch transaction data into a HistoryStream.
+
+        Histories past sketch_threshold are sketched page by page and not
+        kept: the result then lists no transactions, only their count, and
+        history.sketch summarizes them.
+        """
+        result = self._read_etherscan(address, history.add, 0, 99999999)
+        history.finish()
+        if result.get("success"):
+            result.update(transactions=history.transactions, sketched=history.sketch is not None)
+        return result
+
+    @traced("fetch.alchemy")
+    @tracks_upstream("alchemy")
     def fetch_from_alchemy(self, address: str) -> Dict[str, Any]:
         """Fetch comprehensive data from Alchemy API"""
         if not self.alchemy_api_key:
@@ -103,7 +179,8 @@ class DataFetcher:
             
             response = requests.post(url, json=params, timeout=30)
             response.raise_for_status()
-            data = response.json()
+            with span("parse.alchemy"):
+                data = response.json()
             
             return {
                 "success": True,
@@ -124,6 +201,8 @@ class DataFetcher:
                 "transfers": []
             }
 
+    @traced("fetch.the_graph")
+    @tracks_upstream("the_graph")
     def fetch_from_the_graph(self, address: str) -> Dict[str, Any]:
         """Fetch DeFi protocol data from The Graph"""
         if not self.the_graph_api_key:
@@ -157,7 +236,8 @@ class DataFetcher:
             url = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v2"
             response = requests.post(url, json={"query": query}, timeout=30)
             response.raise_for_status()
-            data = response.json()
+            with span("parse.the_graph"):
+                data = response.json()
             
             return {
                 "success": True,
@@ -178,6 +258,7 @@ class DataFetcher:
                 "defi_transactions": []
             }
 
+    @traced("fetch.balance")
     def get_wallet_balance(self, address: str, network: str = "ethereum") -> Dict[str, Any]:
         """Get wallet balance and token holdings"""
         try:
@@ -190,6 +271,8 @@ class DataFetcher:
             else:
                 return {"error": f"Unsupported network: {network}"}
             
+            # RPC calls count against the same quota as the HTTP sources
+            self._rate_limit()
             if not w3.is_connected():
                 return {"error": f"Failed to connect to {network} network"}
             
@@ -212,49 +295,86 @@ class DataFetcher:
                 "error": f"Failed to get balance: {str(e)}"
             }
 
-    def get_wallet_data(self, address: str, network: str = "ethereum") -> Dict[str, Any]:
-        """Get comprehensive wallet data from all sources"""
-        print(f"Fetching data for wallet: {address} on {network}")
-        
-        # Validate address
-        if not Web3.is_address(address):
-            return {
-                "success": False,
-                "error": "Invalid wallet address"
-            }
-        
-        # Fetch data from all sources
-        etherscan_data = self.fetch_from_etherscan(address)
-        alchemy_data = self.fetch_from_alchemy(address)
-        the_graph_data = self.fetch_from_the_graph(address)
-        balance_data = self.get_wallet_balance(address, network)
+    def iter_wallet_data(
+        self,
+        address: str,
+        network: str = "ethereum",
+        history: Optional[HistoryStream] = None,
+        sources: Optional[Set[str]] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Fetch wallet data source by source, yielding (source, data) as each one returns.
+
+        With a HistoryStream, transactions are fetched into it (see stream_from_etherscan).
+        Passing sources fetches only those; None means every source.
+        """
+        wanted = lambda source: sources is None or source in sources
+        # Cheapest source first so streaming consumers get something to show quickly
+        if wanted("balance"):
+            yield "balance", self.get_wallet_balance(address, network)
+        if wanted("etherscan"):
+            if history is None:
+                yield "etherscan", self.fetch_from_etherscan(address)
+            else:
+                yield "etherscan", self.stream_from_etherscan(address, history)
+        if wanted("the_graph"):
+            yield "the_graph", self.fetch_from_the_graph(address)
+        if wanted("alchemy"):
+            yield "alchemy", self.fetch_from_alchemy(address)
+
+    @traced("parse.compile")
+    def compile_wallet_data(self, address: str, network: str, data_sources: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Compile per-source results into the combined wallet data structure"""
+        etherscan_data = data_sources.get("etherscan", {})
+        alchemy_data = data_sources.get("alchemy", {})
+        the_graph_data = data_sources.get("the_graph", {})
+        balance_data = data_sources.get("balance", {})
         
-        # Compile results
-        result = {
+        return {
             "wallet_address": address,
             "network": network,
             "timestamp": datetime.now().isoformat(),
             "data_sources": {
-            "etherscan": etherscan_data,
+                "etherscan": etherscan_data,
                 "alchemy": alchemy_data,
                 "the_graph": the_graph_data,
                 "balance": balance_data
             },
             "summary": {
-                "total_transactions": len(etherscan_data.get("transactions", [])),
+                # Sketched histories keep no transaction list, only its length
+                "total_transactions": etherscan_data.get("count", len(etherscan_data.get("transactions", []))),
                 "total_transfers": len(alchemy_data.get("transfers", [])),
                 "defi_transactions": len(the_graph_data.get("defi_transactions", [])),
                 "has_balance": balance_data.get("success", False)
             }
         }
+
+    def get_wallet_data(self, address: str, network: str = "ethereum") -> Dict[str, Any]:
+        """Get comprehensive wallet data from all sources"""
+        print(f"Fetching data for wallet: {address} on {network}")
         
-        return result
+        # Validate address
+        if not is_valid_address(address):
+            return {
+                "success": False,
+                "error": "Invalid wallet address"
+            }
+        
+        # Fetch data from all sources
+        data_sources = dict(self.iter_wallet_data(address, network))
+        
+        # Compile results
+        return self.compile_wallet_data(address, network, data_sources)
 
+    @traced("analysis.transaction_patterns")
     def analyze_transaction_patterns(self, transactions: List[Dict]) -> Dict[str, Any]:
         """Analyze transaction patterns for risk assessment"""
         if not transactions:
             return {"error": "No transactions to analyze"}
         
+        # Very large histories are summarized in bounded memory, with stated error bounds
+        if use_sketch_mode(transactions):
+            return TransactionSketch.from_transactions(transactions).pattern_summary()
+        
         try:
             # Calculate basic statistics
             total_transactions = len(transactions)
@@ -0,0 +1,305 @@
+"""Flagged-address index.
+
+Deny lists (sanctions, known scams, mixers) are compiled into a versioned
+directory under settings.flagged_path:
+
+    <version>/addresses.npy    sorted S20 array of raw addresses
+    <version>/categories.npy   uint8 category code per address
+    <version>/bloom.npy        Bloom filter bits (uint64 words)
+    <version>/meta.json        counts, categories, filter parameters
+    CURRENT                    name of the served version
+
+Lookups first test the Bloom filter, which rules out almost every clean
+address without touching the address array, then confirm the remaining
+candidates with a binary search over the memory-mapped sorted array. All
+arrays are memory-mapped, so uvicorn workers share one copy through the page
+cache. Publishing a new version rewrites CURRENT atomically, and every process
+swaps to it on its next lookup.
+
+Usage:
+    python -m blockchain.flagged build --source sanctions=ofac.txt --source scam=scams.txt
+    python -m blockchain.flagged lookup 0x...
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from utils.address import ADDRESS_BYTES, addresses_to_array, is_valid_address
+from utils.logger import get_logger
+from utils.sketches import address_words, mix64
+
+logger = get_logger(__name__)
+
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+ADDRESS_DTYPE = f"S{ADDRESS_BYTES}"
+
+def _bloom_positions(raw: np.ndarray, n_bits: int, n_hashes: int) -> np.ndarray:
+    """(len(raw), n_hashes) bit positions, double hashing two mixed 64-bit words of each address"""
+    words = address_words(raw)
+    h1 = mix64(words[:, 0])
+    h2 = mix64(words[:, 1]) | np.uint64(1)
+    steps = np.arange(n_hashes, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(n_bits)
+
+def bloom_parameters(n_items: int, fp_rate: float) -> Tuple[int, int]:
+    """Optimal (bits, hash count) for n_items at the target false positive rate"""
+    n_items = max(n_items, 1)
+    n_bits = max(64, int(math.ceil(-n_items * math.log(fp_rate) / math.log(2) ** 2)))
+    n_hashes = max(1, int(round(n_bits / n_items * math.log(2))))
+    return n_bits, n_hashes
+
+class FlaggedIndex:
+    """One published version of the flagged-address lists"""
+
+    def __init__(self, addresses: np.ndarray, categories: np.ndarray, bloom: np.ndarray, meta: Dict):
+        self.addresses = addresses
+        self.categories = categories
+        self.bloom = bloom
+        self.meta = meta
+        self.version = meta["version"]
+        self.category_names: List[str] = meta["categories"]
+        self.n_bits = meta["bloom_bits"]
+        self.n_hashes = meta["bloom_hashes"]
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    @classmethod
+    def load(cls, directory: str) -> "FlaggedIndex":
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in ("addresses", "categories", "bloom")
+        }
+        return cls(meta=meta, **arrays)
+
+    def _maybe_contains(self, raw: np.ndarray) -> np.ndarray:
+        """Bloom filter test: False is definite, True needs confirming"""
+        positions = _bloom_positions(raw, self.n_bits, self.n_hashes)
+        words = self.bloom[(positions >> np.uint64(6)).astype(np.int64)]
+        bits = (words >> (positions & np.uint64(63))) & np.uint64(1)
+        return bits.all(axis=1)
+
+    def match_raw(self, raw: np.ndarray) -> np.ndarray:
+        """Row in the sorted address array for each S20 address, or -1"""
+        rows = np.full(len(raw), -1, dtype=np.int64)
+        if len(raw) == 0 or len(self.addresses) == 0:
+            return rows
+        candidates = np.flatnonzero(self._maybe_contains(raw))
+        if len(candidates):
+            probe = raw[candidates]
+            positions = np.searchsorted(self.addresses, probe)
+            positions[positions == len(self.addresses)] = 0
+            exact = self.addresses[positions] == probe
+            rows[candidates[exact]] = positions[exact]
+        return rows
+
+    def contains_raw(self, raw: np.ndarray) -> np.ndarray:
+        return self.match_raw(raw) >= 0
+
+    def lookup_many(self, addresses: List[str]) -> List[Optional[str]]:
+        """Category of each address, or None if it is not flagged (or invalid)"""
+        valid = [i for i, address in enumerate(addresses) if is_valid_address(address)]
+        results: List[Optional[str]] = [None] * len(addresses)
+        if not valid:
+            return results
+        rows = self.match_raw(addresses_to_array(addresses[i] for i in valid))
+        for i, row in zip(valid, rows):
+            if row >= 0:
+                results[i] = self.category_names[self.categories[row]]
+        return results
+
+    def lookup(self, address: str) -> Optional[str]:
+        return self.lookup_many([address])[0]
+
+def read_address_file(path: str) -> Iterable[str]:
+    """Addresses from a text or CSV file: the first field of each line, invalid lines skipped"""
+    with open(path) as f:
+        for line in f:
+            candidate = line.split(",")[0].strip()
+            if is_valid_address(candidate):
+                yield candidate
+
+def build_index(
+    sources: Dict[str, Iterable[str]],
+    root: Optional[str] = None,
+    version: Optional[str] = None,
+    fp_rate: Optional[float] = None,
+    keep: int = 3
+) -> str:
+    """
+    Compile category -> addresses lists into a new version and publish it.
+
+    An address listed under several categories keeps the first one, so pass
+    sources in priority order. Returns the new version directory.
+    """
+    root = root or settings.flagged_path
+    fp_rate = fp_rate or settings.flagged_fp_rate
+    version = version or datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    category_names = list(sources)
+    if len(category_names) > 255:
+        raise ValueError("At most 255 categories are supported")
+
+    raw_parts, code_parts = [], []
+    for code, name in enumerate(category_names):
+        raw = addresses_to_array(sources[name])
+        raw_parts.append(raw)
+        code_parts.append(np.full(len(raw), code, dtype=np.uint8))
+    raw = np.concatenate(raw_parts) if raw_parts else np.zeros(0, dtype=ADDRESS_DTYPE)
+    codes = np.concatenate(code_parts) if code_parts else np.zeros(0, dtype=np.uint8)
+    # np.unique returns the first occurrence, i.e. the highest-priority category
+    addresses, first = np.unique(raw, return_index=True)
+    categories = codes[first]
+
+    n_bits, n_hashes = bloom_parameters(len(addresses), fp_rate)
+    bloom = np.zeros((n_bits + 63) // 64, dtype=np.uint64)
+    if len(addresses):
+        positions = _bloom_positions(addresses, n_bits, n_hashes).ravel()
+        np.bitwise_or.at(bloom, (positions >> np.uint64(6)).astype(np.int64), np.uint64(1) << (positions & np.uint64(63)))
+
+    meta = {
+        "version": version,
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "count": int(len(addresses)),
+        "categories": category_names,
+        "category_counts": dict(zip(category_names, np.bincount(categories, minlength=len(category_names)).tolist())),
+        "bloom_bits": n_bits,
+        "bloom_hashes": n_hashes,
+        "fp_rate": fp_rate
+    }
+
+    version_dir = os.path.join(root, version)
+    if os.path.exists(version_dir):
+        raise FileExistsError(f"Flagged index version already exists: {version_dir}")
+    tmp_dir = os.path.join(root, f".{version}.{os.getpid()}.tmp")
+    os.makedirs(tmp_dir)
+    try:
+        np.save(os.path.join(tmp_dir, "addresses.npy"), addresses)
+        np.save(os.path.join(tmp_dir, "categories.npy"), categories)
+        np.save(os.path.join(tmp_dir, "bloom.npy"), bloom)
+        with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+        os.rename(tmp_dir, version_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    publish_version(root, version)
+    _prune_versions(root, keep)
+    logger.info("Flagged index published", version=version, count=meta["count"], categories=meta["category_counts"])
+    return version_dir
+
+def publish_version(root: str, version: str):
+    """Atomically point CURRENT at version"""
+    tmp_path = os.path.join(root, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+def _prune_versions(root: str, keep: int):
+    """Remove all but the newest keep versions; processes still mapping them keep their open files"""
+    versions = sorted(
+        name for name in os.listdir(root)
+        if not name.startswith(".") and os.path.isdir(os.path.join(root, name))
+    )
+    for name in versions[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+_index: Optional[FlaggedIndex] = None
+_index_version: Optional[str] = None
+_pointer_stat: Optional[tuple] = None
+_checked_at = float("-inf")
+_index_lock = threading.Lock()
+
+def get_flagged_index() -> Optional[FlaggedIndex]:
+    """
+    The published index, swapped for a new version when CURRENT changes.
+
+    Called for every graph lookup, so CURRENT is only stat'ed once per
+    flagged_check_interval, and only re-read when its inode or mtime changed
+    (publishing replaces the file).
+    """
+    global _index, _index_version, _pointer_stat, _checked_at
+    if time.monotonic() - _checked_at < settings.flagged_check_interval:
+        return _index
+    with _index_lock:
+        if time.monotonic() - _checked_at < settings.flagged_check_interval:
+            return _index
+        _checked_at = time.monotonic()
+        pointer = os.path.join(settings.flagged_path, CURRENT_FILE)
+        try:
+            stat = os.stat(pointer)
+        except OSError:
+            _index, _index_version, _pointer_stat = None, None, None
+            return None
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == _pointer_stat:
+            return _index
+        try:
+            with open(pointer) as f:
+                version = f.read().strip()
+        except OSError:
+            return _index
+        if version != _index_version:
+            try:
+                _index = FlaggedIndex.load(os.path.join(settings.flagged_path, version))
+                logger.info("Flagged index loaded", version=version, count=len(_index))
+            except Exception as e:
+                # Keep serving the previous index; the load is retried at the next check
+                logger.error("Failed to load flagged index", version=version, error=str(e))
+                return _index
+            _index_version = version
+        _pointer_stat = signature
+        return _index
+
+def lookup_counterparties(addresses: Iterable[str]) -> Dict[str, str]:
+    """Flagged addresses among addresses, mapped to their category"""
+    index = get_flagged_index()
+    if index is None:
+        return {}
+    unique = list(dict.fromkeys(address.lower() for address in addresses if address))
+    return {address: category for address, category in zip(unique, index.lookup_many(unique)) if category}
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the flagged-address index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Compile address lists into a new published version")
+    build.add_argument("--source", action="append", required=True, metavar="CATEGORY=PATH",
+                       help="Address list for a category, highest priority first (repeatable)")
+    build.add_argument("--fp-rate", type=float, default=None, help="Bloom filter false positive rate")
+    build.add_argument("--keep", type=int, default=3, help="Versions to keep on disk")
+
+    lookup = subparsers.add_parser("lookup", help="Check addresses against the published index")
+    lookup.add_argument("addresses", nargs="+")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        sources = {}
+        for source in args.source:
+            category, _, path = source.partition("=")
+            if not path:
+                parser.error(f"Expected CATEGORY=PATH, got {source!r}")
+            sources[category] = list(read_address_file(path))
+        print(build_index(sources, fp_rate=args.fp_rate, keep=args.keep))
+    else:
+        index = get_flagged_index()
+        if index is None:
+            parser.error("No flagged index has been published")
+        for address, category in zip(args.addresses, index.lookup_many(args.addresses)):
+            print(f"{address}\t{category or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+"""Wallet-to-wallet transfer graph.
+
+Transfers are stored as a CSR sparse matrix over interned address ids, where
+entry (i, j) counts transfers from wallet i to wallet j. New transactions are
+buffered as COO triples and merged into the CSR matrix in one vectorized step
+before the next query, so ingesting a wallet's history never rebuilds the
+graph. Multi-hop neighbourhoods are expanded frontier by frontier with CSR row
+slicing, which keeps 2-hop exposure queries in the milliseconds even when the
+graph holds millions of edges.
+
+The persisted snapshot (<graph_path>/<network>.npz) is the shared copy.
+Rebuilds add the transfers of every cached analysis and transaction history
+to the previous snapshot. API workers load it and reload it when the file
+changes. Transfers a worker ingests between rebuilds stay local to that
+worker as a bounded overlay: past graph_max_live_nodes or
+graph_max_live_transfers, the worker drops its overlay by reloading the
+snapshot. Those transfers stay in the cache, so the next rebuild picks them
+up.
+
+Usage (update the persisted graph from cached analyses, once or periodically):
+    python -m blockchain.graph --network ethereum [--interval 600]
+"""
+import argparse
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from blockchain.flagged import get_flagged_index
+from config import settings
+from utils.address import AddressInterner, is_valid_address
+from utils.logger import get_logger
+from utils.monitoring import start_metrics_server
+
+logger = get_logger(__name__)
+
+def _tx_key(tx: Dict) -> int:
+    """64-bit transaction identity, so re-analysed wallets don't double-count transfers"""
+    tx_hash = tx.get("hash") or ""
+    if len(tx_hash) >= 18:
+        return int(tx_hash[-16:], 16)
+    return hash((tx.get("from"), tx.get("to"), tx.get("timeStamp"), tx.get("value"))) & 0xFFFFFFFFFFFFFFFF
+
+def _pad(matrix: sp.csr_matrix, n: int) -> sp.csr_matrix:
+    """Grow a square CSR matrix to n nodes without copying its data"""
+    if matrix.shape[0] == n:
+        return matrix
+    indptr = np.concatenate([matrix.indptr, np.full(n - matrix.shape[0], matrix.indptr[-1], dtype=matrix.indptr.dtype)])
+    return sp.csr_matrix((matrix.data, matrix.indices, indptr), shape=(n, n))
+
+class TransferGraph:
+    """
+    Directed transfer-count graph over interned wallet ids.
+
+    Edges live in a large base matrix plus a small delta matrix holding the
+    transfers added since the last merge. Compaction only rebuilds the delta,
+    so ingesting one wallet stays cheap however large the base grows; the
+    delta is folded into the base once it exceeds graph_delta_max_edges.
+    Each matrix is kept alongside its transpose for in-edge queries.
+    """
+
+    def __init__(self):
+        self.interner = AddressInterner()
+        empty = sp.csr_matrix((0, 0), dtype=np.float32)
+        self._base, self._base_rev = empty, empty
+        self._delta, self._delta_rev = empty, empty
+        self._delta_src = np.zeros(0, dtype=np.int64)
+        self._delta_dst = np.zeros(0, dtype=np.int64)
+        self._flagged = np.zeros(0, dtype=bool)
+        self._seen_tx = np.zeros(0, dtype=np.uint64)  # sorted, transactions in the base
+        self._delta_tx: set = set()
+        self._pending_src: List[int] = []
+        self._pending_dst: List[int] = []
+        self._pending_tx: List[int] = []
+        self._lock = threading.RLock()
+        # Size of the snapshot this graph was loaded from, and the file's mtime
+        self.snapshot_nodes = 0
+        self.snapshot_transfers = 0
+        self.snapshot_mtime: Optional[float] = None
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.interner)
+
+    @property
+    def live_nodes(self) -> int:
+        """Wallets added since the snapshot was loaded"""
+        return self.n_nodes - self.snapshot_nodes
+
+    @property
+    def live_transfers(self) -> int:
+        """Transfers added since the snapshot was loaded, merged or not"""
+        with self._lock:
+            return len(self._seen_tx) - self.snapshot_transfers + len(self._delta_tx) + len(self._pending_tx)
+
+    @property
+    def n_edges(self) -> int:
+        """Distinct (sender, receiver) pairs"""
+        with self._lock:
+            self.compact()
+            self._merge()
+            return self._base.nnz
+
+    def add_transactions(self, transactions: Iterable[Dict]):
+        """Buffer transfers (from -> to) for the next compaction"""
+        with self._lock:
+            for tx in transactions:
+                sender, receiver = tx.get("from") or "", tx.get("to") or ""
+                # Contract creations have no receiver
+                if not (is_valid_address(sender) and is_valid_address(receiver)):
+                    continue
+                self._pending_src.append(self.interner.intern(sender))
+                self._pending_dst.append(self.interner.intern(receiver))
+                self._pending_tx.append(_tx_key(tx))
+
+    def flag(self, addresses: Iterable[str]):
+        """Mark addresses as risky for exposure queries, in addition to the flagged-address index"""
+        with self._lock:
+            ids = self.interner.intern_many(addresses)
+            self._grow_flags()
+            self._flagged[ids] = True
+
+    def set_flagged(self, addresses: Iterable[str]):
+        """Replace the flagged set"""
+        with self._lock:
+            ids = self.interner.intern_many(addresses)
+            self._flagged = np.zeros(self.n_nodes, dtype=bool)
+            self._flagged[ids] = True
+
+    def _grow_flags(self):
+        if len(self._flagged) < self.n_nodes:
+            self._flagged = np.concatenate([self._flagged, np.zeros(self.n_nodes - len(self._flagged), dtype=bool)])
+
+    def compact(self):
+        """Move buffered transfers into the delta matrix, merging it into the base when large"""
+        with self._lock:
+            n = self.n_nodes
+            if not self._pending_tx and self._delta.shape[0] == n:
+                return
+            src = np.asarray(self._pending_src, dtype=np.int64)
+            dst = np.asarray(self._pending_dst, dtype=np.int64)
+            tx_keys = np.asarray(self._pending_tx, dtype=np.uint64)
+            self._pending_src, self._pending_dst, self._pending_tx = [], [], []
+
+            # Drop transactions already in the graph or repeated within the batch
+            tx_keys, first = np.unique(tx_keys, return_index=True)
+            positions = np.searchsorted(self._seen_tx, tx_keys)
+            in_base = positions < len(self._seen_tx)
+            in_base[in_base] = self._seen_tx[positions[in_base]] == tx_keys[in_base]
+            fresh = ~in_base & np.fromiter((key not in self._delta_tx for key in tx_keys.tolist()), dtype=bool, count=len(tx_keys))
+            self._delta_tx.update(tx_keys[fresh].tolist())
+            self._delta_src = np.concatenate([self._delta_src, src[first[fresh]]])
+            self._delta_dst = np.concatenate([self._delta_dst, dst[first[fresh]]])
+
+            if len(self._delta_src) > settings.graph_delta_max_edges:
+                self._merge()
+            else:
+                # Duplicate (src, dst) pairs are summed into transfer counts
+                weights = np.ones(len(self._delta_src), dtype=np.float32)
+                self._delta = sp.csr_matrix((weights, (self._delta_src, self._delta_dst)), shape=(n, n))
+                self._delta_rev = self._delta.T.tocsr()
+                self._base, self._base_rev = _pad(self._base, n), _pad(self._base_rev, n)
+            self._grow_flags()
+
+    def _merge(self):
+        """Fold the delta matrix into the base"""
+        n = self.n_nodes
+        if len(self._delta_src):
+            weights = np.ones(len(self._delta_src), dtype=np.float32)
+            delta = sp.csr_matrix((weights, (self._delta_src, self._delta_dst)), shape=(n, n))
+            self._base = (_pad(self._base, n) + delta).tocsr()
+            self._base_rev = self._base.T.tocsr()
+            self._seen_tx = np.union1d(self._seen_tx, np.fromiter(self._delta_tx, dtype=np.uint64, count=len(self._delta_tx)))
+        else:
+            self._base, self._base_rev = _pad(self._base, n), _pad(self._base_rev, n)
+        empty = sp.csr_matrix((n, n), dtype=np.float32)
+        self._delta, self._delta_rev = empty, empty
+        self._delta_src = np.zeros(0, dtype=np.int64)
+        self._delta_dst = np.zeros(0, dtype=np.int64)
+        self._delta_tx = set()
+
+    def is_flagged(self, nodes: np.ndarray) -> np.ndarray:
+        """Whether each node is flagged in the graph or on a published deny list"""
+        with self._lock:
+            flagged = self._flagged[nodes]
+        index = get_flagged_index()
+        if index is not None and len(nodes):
+            flagged = flagged | index.contains_raw(self.interner.raw(nodes))
+        return flagged
+
+    def _node(self, address: str) -> int:
+        """Id of a wallet present in the compacted matrices, or -1"""
+        node = self.interner.lookup(address)
+        return node if node < self._delta.shape[0] else -1
+
+    def _edges(self, node: int):
+        """A wallet's combined (outgoing, incoming) rows over base and delta"""
+        return self._base[node] + self._delta[node], self._base_rev[node] + self._delta_rev[node]
+
+    def degree(self, address: str) -> Dict[str, int]:
+        """Distinct counterparties and transfer counts in each direction"""
+        # Queries hold the lock so compact() in another thread cannot swap matrices mid-read
+        with self._lock:
+            self.compact()
+            node = self._node(address)
+            if node < 0:
+                return {"out_degree": 0, "in_degree": 0, "out_transfers": 0, "in_transfers": 0}
+            out_row, in_row = self._edges(node)
+        return {
+            "out_degree": int(out_row.nnz),
+            "in_degree": int(in_row.nnz),
+            "out_transfers": int(out_row.sum()),
+            "in_transfers": int(in_row.sum())
+        }
+
+    def _neighbours(self, nodes: np.ndarray) -> np.ndarray:
+        """Distinct wallets with a transfer to or from any of nodes"""
+        return np.unique(np.concatenate([
+            matrix[nodes].indices for matrix in (self._base, self._base_rev, self._delta, self._delta_rev)
+        ]))
+
+    def k_hop(self, address: str, k: Optional[int] = None) -> List[np.ndarray]:
+        """Node ids first reached at each hop 1..k, ignoring transfer direction
+
+        Hubs (exchanges, routers) connect most of the graph within two hops,
+        so wallets above graph_hub_degree are reported but not expanded, and
+        expansion stops once graph_max_neighbours wallets have been reached.
+        """
+        k = k or settings.graph_max_hops
+        with self._lock:
+            self.compact()
+            node = self._node(address)
+            if node < 0:
+                return []
+            # Upper bound on distinct counterparties; pairs in both base and delta count twice
+            degrees = sum(np.diff(matrix.indptr) for matrix in (self._base, self._base_rev, self._delta, self._delta_rev))
+            visited = np.zeros(len(degrees), dtype=bool)
+            visited[node] = True
+            frontier = np.array([node])
+            hops, reached = [], 0
+            for _ in range(k):
+                expandable = frontier[(degrees[frontier] <= settings.graph_hub_degree) | (frontier == node)]
+                if len(expandable) == 0 or reached >= settings.graph_max_neighbours:
+                    break
+                candidates = self._neighbours(expandable)
+                frontier = candidates[~visited[candidates]]
+                if len(frontier) == 0:
+                    break
+                visited[frontier] = True
+                hops.append(frontier)
+                reached += len(frontier)
+            return hops
+
+    def neighbourhood(self, address: str, k: Optional[int] = None) -> List[List[str]]:
+        """Addresses first reached at each hop"""
+        with self._lock:
+            return [[self.interner.address(i) for i in hop] for hop in self.k_hop(address, k)]
+
+    def exposure(self, address: str, k: Optional[int] = None) -> Dict:
+        """Contact with flagged wallets: direct transfers and counts per hop"""
+        with self._lock:
+            self.compact()
+            node = self._node(address)
+            hops = self.k_hop(address, k)
+            flagged_per_hop = [int(self.is_flagged(hop).sum()) for hop in hops]
+
+            direct_share = 0.0
+            if node >= 0:
+                out_row, in_row = self._edges(node)
+                total = out_row.sum() + in_row.sum()
+                flagged_transfers = out_row.data[self.is_flagged(out_row.indices)].sum() + in_row.data[self.is_flagged(in_row.indices)].sum()
+                direct_share = float(flagged_transfers / total) if total else 0.0
+
+        return {
+            "flagged_per_hop": flagged_per_hop,
+            "wallets_per_hop": [int(len(hop)) for hop in hops],
+            "direct_flagged": flagged_per_hop[0] if flagged_per_hop else 0,
+            "flagged_within_k": int(sum(flagged_per_hop)),
+            "direct_flagged_transfer_share": round(direct_share, 4)
+        }
+
+    def risk_features(self, address: str) -> Dict:
+        """Graph features consumed by WalletAnalyzer.assess_risk"""
+        with self._lock:
+            return {**self.degree(address), **self.exposure(address)}
+
+    def save(self, path: str):
+        """Atomically persist the graph"""
+        with self._lock:
+            self.compact()
+            self._merge()
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(
+                tmp_path,
+                addresses=self.interner.to_array(),
+                indptr=self._base.indptr,
+                indices=self._base.indices,
+                data=self._base.data,
+                flagged=self._flagged,
+                seen_tx=self._seen_tx
+            )
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TransferGraph":
+        graph = cls()
+        with np.load(path) as data:
+            graph.interner = AddressInterner.from_array(data["addresses"])
+            n = graph.n_nodes
+            graph._base = sp.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=(n, n))
+            graph._base_rev = graph._base.T.tocsr()
+            graph._delta = graph._delta_rev = sp.csr_matrix((n, n), dtype=np.float32)
+            graph._flagged = data["flagged"].copy()
+            graph._seen_tx = data["seen_tx"].copy()
+        graph.snapshot_nodes = n
+        graph.snapshot_transfers = len(graph._seen_tx)
+        graph.snapshot_mtime = os.path.getmtime(path)
+        return graph
+
+_graphs: Dict[str, TransferGraph] = {}
+_graphs_checked: Dict[str, float] = {}
+_graphs_lock = threading.Lock()
+
+def graph_file(network: str) -> str:
+    return os.path.join(settings.graph_path, f"{network}.npz")
+
+def _snapshot_mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def _load_snapshot(network: str) -> TransferGraph:
+    """The persisted graph for a network, or an empty one"""
+    path = graph_file(network)
+    if os.path.isfile(path):
+        try:
+            return TransferGraph.load(path)
+        except Exception as e:
+            logger.error("Failed to load transfer graph", path=path, error=str(e))
+    return TransferGraph()
+
+def _overlay_full(graph: TransferGraph) -> bool:
+    return (graph.live_nodes > settings.graph_max_live_nodes or
+            graph.live_transfers > settings.graph_max_live_transfers)
+
+def get_transfer_graph(network: str = "ethereum") -> TransferGraph:
+    """
+    This process's graph for a network: the persisted snapshot plus transfers
+    ingested since it was loaded.
+
+    The snapshot file is re-checked every graph_reload_interval seconds and
+    reloaded when a rebuild replaced it; a full local overlay is dropped the
+    same way.
+    """
+    graph = _graphs.get(network)
+    if (graph is not None and not _overlay_full(graph) and
+            time.monotonic() - _graphs_checked.get(network, 0.0) < settings.graph_reload_interval):
+        return graph
+    with _graphs_lock:
+        graph = _graphs.get(network)
+        if graph is None:
+            graph = _load_snapshot(network)
+        elif _overlay_full(graph):
+            logger.info("Dropping local transfer graph overlay", network=network,
+                        live_nodes=graph.live_nodes, live_transfers=graph.live_transfers)
+            graph = _load_snapshot(network)
+        elif _snapshot_mtime(graph_file(network)) not in (None, graph.snapshot_mtime):
+            graph = _load_snapshot(network)
+        _graphs[network] = graph
+        _graphs_checked[network] = time.monotonic()
+    return graph
+
+def _cached_transactions(network: str) -> Iterator[List[Dict]]:
+    """Transaction lists from cached analyses and cached transaction histories"""
+    from utils.cache import cache
+
+    sources = (
+        # Every wallet analysis caches its Etherscan history under data_sources
+        (f"wallet_analysis:{network}:", lambda value: value.get("data_sources", {}).get("etherscan", {}).get("transactions", [])),
+        (f"transactions:{network}:", lambda value: value.get("transactions", []))
+    )
+    for prefix, extract in sources:
+        for key in cache.redis_client.scan_iter(match=prefix.encode() + b"*", count=1000):
+            value = cache.get(key)
+            if isinstance(value, dict):
+                yield extract(value) or []
+
+def build_from_cache(network: str = "ethereum", graph: Optional[TransferGraph] = None) -> TransferGraph:
+    """Add every cached wallet's transactions to graph (a new graph if None)"""
+    graph = graph if graph is not None else TransferGraph()
+    for transactions in _cached_transactions(network):
+        graph.add_transactions(transactions)
+    graph.compact()
+    return graph
+
+def rebuild(network: str, output: Optional[str] = None, flagged_path: Optional[str] = None, fresh: bool = False):
+    """Fold cached transactions into the persisted graph and write it"""
+    existing = graph_file(network)
+    previous = TransferGraph.load(existing) if os.path.isfile(existing) else None
+    # Cached analyses expire, so start from the previous snapshot to keep older transfers
+    graph = build_from_cache(network, None if fresh or previous is None else previous)
+    if flagged_path:
+        with open(flagged_path) as f:
+            graph.set_flagged(line.strip() for line in f if is_valid_address(line.strip()))
+    elif fresh and previous is not None:
+        # Keep wallets flagged in the previous snapshot
+        graph.flag(previous.interner.address(i) for i in np.flatnonzero(previous._flagged))
+    output = output or existing
+    graph.save(output)
+    logger.info("Transfer graph built", path=output, nodes=graph.n_nodes, edges=graph.n_edges)
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the persisted transfer graph from cached analyses")
+    parser.add_argument("--network", default="ethereum", help="Blockchain network")
+    parser.add_argument("--flagged", default=None, help="File of flagged addresses, one per line (replaces the flagged set)")
+    parser.add_argument("--output", default=None, help="Output path (default: <graph_path>/<network>.npz)")
+    parser.add_argument("--fresh", action="store_true", help="Rebuild from the cache alone instead of extending the snapshot")
+    parser.add_argument("--interval", type=float, default=None, help="Keep running, rebuilding every this many seconds")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Port for /metrics with --interval (default: service_metrics_port; 0 disables)")
+    args = parser.parse_args()
+
+    if args.interval is not None:
+        start_metrics_server(args.metrics_port)
+
+    while True:
+        try:
+            rebuild(args.network, args.output, args.flagged, args.fresh)
+        except Exception as e:
+            if args.interval is None:
+                raise
+            logger.error("Transfer graph rebuild failed", network=args.network, error=str(e))
+        if args.interval is None:
+            break
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""Bounded-memory transaction analysis for very large histories.
+
+Above settings.sketch_threshold transactions, pattern analysis and anomaly
+detection stop building sets, sorted copies and DataFrames over the whole
+history. Transactions are instead streamed in chunks sized to
+settings.sketch_max_memory_mb through fixed-size sketches:
+
+    counts, sums, mean/std, time span    exact
+    unique counterparties                HyperLogLog, relative error 1.04 / sqrt(2^p)
+    value quantiles                      KLL, rank error 2.296 / k^0.9723
+    unusual values                       count read from the KLL, largest examples kept
+    rapid transactions                   exact count
+    flagged counterparties               exact, looked up chunk by chunk
+    ML feature row                       exact except the unique counterparty counts
+
+A sketch takes its history in one pass, so a HistoryStream can sketch pages
+as they are fetched and drop them. Build one sketch per history and share it
+between stages.
+
+Results carry "approximate": True and an "error_bounds" entry so callers know
+which figures are estimates.
+"""
+import heapq
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from config import settings
+from utils.logger import get_logger
+from utils.sketches import HyperLogLog, KLLSketch
+from .flagged import lookup_counterparties
+
+logger = get_logger(__name__)
+
+# Measured peak working memory per transaction in a chunk (parsed arrays, sketch batches, temporaries)
+BYTES_PER_TRANSACTION = 512
+MIN_CHUNK_SIZE = 1000
+RAPID_SECONDS = 60
+VALUE_QUANTILES = (0.5, 0.9, 0.99)
+
+def use_sketch_mode(transactions: List[Dict]) -> bool:
+    """Whether a history is large enough to analyze with sketches"""
+    return len(transactions) > settings.sketch_threshold
+
+def sketch_chunk_size() -> int:
+    """Transactions per chunk that keep one analysis within settings.sketch_max_memory_mb"""
+    return max(MIN_CHUNK_SIZE, settings.sketch_max_memory_mb * 1024 * 1024 // BYTES_PER_TRANSACTION)
+
+def iter_chunks(transactions: List[Dict]) -> Iterator[List[Dict]]:
+    """Slices of sketch_chunk_size() transactions, for stages that must still see every transaction"""
+    size = sketch_chunk_size()
+    for start in range(0, len(transactions), size):
+        yield transactions[start:start + size]
+
+class TransactionSketch:
+    """Fixed-size summary of a transaction history, built in one pass of bounded chunks"""
+
+    def __init__(self, owner: Optional[str] = None, seed: Optional[int] = 0):
+        # The wallet whose history this is; outgoing transactions are sent from it
+        self.owner = (owner or "").lower()
+        self.count = 0
+        self.total_value = 0.0
+        self.max_value = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.first_timestamp: Optional[int] = None
+        self.last_timestamp: Optional[int] = None
+        self.unique_to = HyperLogLog(settings.sketch_hll_precision)
+        self.unique_from = HyperLogLog(settings.sketch_hll_precision)
+        self.values = KLLSketch(settings.sketch_kll_k, seed=seed)
+        self.hours = np.zeros(24, dtype=np.int64)
+        self.rapid_transactions = 0
+        # Rapid-transaction gaps across chunk boundaries are exact only for time-ordered input
+        self.time_ordered = True
+        self._previous_range: Optional[tuple] = None
+        self.flagged: Dict[str, str] = {}
+        self.unusual_values = 0
+        self.unusual_examples: List[Dict] = []
+        # Min-heap of (value, arrival, transaction) for the largest values seen
+        self._largest: List[tuple] = []
+        self._arrivals = 0
+        self.outgoing = 0
+        self.failed = 0
+        self.contract_calls = 0
+        self.gas_price_total = 0.0
+        self._chunk_size = sketch_chunk_size()
+
+    @staticmethod
+    def _values(chunk: List[Dict]) -> np.ndarray:
+        return np.fromiter((float(tx.get("value", 0) or 0) for tx in chunk), dtype=np.float64, count=len(chunk))
+
+    def _add_chunk(self, chunk: List[Dict]):
+        values = self._values(chunk)
+        timestamps = np.fromiter((int(tx.get("timeStamp", 0) or 0) for tx in chunk), dtype=np.int64, count=len(chunk))
+
+        # Chan et al. merge of the chunk into the running mean/variance
+        n, chunk_mean = len(values), float(values.mean())
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += float(((values - chunk_mean) ** 2).sum()) + delta ** 2 * self.count * n / total
+        self.count = total
+        self.total_value += float(values.sum())
+        self.max_value = max(self.max_value, float(values.max()))
+        self.values.update(values)
+
+        timestamps.sort()
+        first, last = int(timestamps[0]), int(timestamps[-1])
+        self.first_timestamp = first if self.first_timestamp is None else min(self.first_timestamp, first)
+        self.last_timestamp = last if self.last_timestamp is None else max(self.last_timestamp, last)
+        self.hours += np.bincount((timestamps // 3600) % 24, minlength=24)
+        self.rapid_transactions += int(np.count_nonzero(np.diff(timestamps) < RAPID_SECONDS))
+        if self._previous_range is not None:
+            previous_first, previous_last = self._previous_range
+            if first >= previous_last:
+                gap = first - previous_last
+            elif last <= previous_first:
+                gap = previous_first - last
+            else:
+                gap, self.time_ordered = RAPID_SECONDS, False
+            self.rapid_transactions += int(gap < RAPID_SECONDS)
+        self._previous_range = (first, last)
+
+        self.outgoing += sum(1 for tx in chunk if (tx.get("from") or "").lower() == self.owner)
+        self.failed += sum(1 for tx in chunk if tx.get("isError") == "1")
+        self.contract_calls += sum(1 for tx in chunk if tx.get("input") not in (None, "", "0x"))
+        self.gas_price_total += sum(float(tx.get("gasPrice") or 0) for tx in chunk)
+
+        self.unique_to.add_addresses(tx.get("to") for tx in chunk)
+        self.unique_from.add_addresses(tx.get("from") for tx in chunk)
+        self.flagged.update(lookup_counterparties(
+            [tx.get("from") for tx in chunk] + [tx.get("to") for tx in chunk]
+        ))
+
+        # Keep the largest transactions; the unusual-value examples come from them
+        for i in np.argsort(values)[-settings.sketch_sample_size:]:
+            item = (float(values[i]), self._arrivals, chunk[i])
+            self._arrivals += 1
+            if len(self._largest) < settings.sketch_sample_size:
+                heapq.heappush(self._largest, item)
+            elif item[0] > self._largest[0][0]:
+                heapq.heapreplace(self._largest, item)
+
+    def add(self, transactions: List[Dict]):
+        """Fold transactions into the sketch, in chunks of sketch_chunk_size()"""
+        for chunk in iter_chunks(transactions):
+            if chunk:
+                self._add_chunk(chunk)
+
+    def finish(self):
+        """Settle the figures that need the whole history: unusual values over mean + 2 std"""
+        if self.count:
+            threshold = self.mean + 2 * self.std
+            examples = sorted((item for item in self._largest if item[0] > threshold), reverse=True)
+            self.unusual_examples = [tx for _, _, tx in examples]
+            self.unusual_values = max(len(examples), round(self.count * (1 - self.values.rank(threshold))))
+        logger.info(
+            "Sketched transaction history",
+            transactions=self.count,
+            chunk_size=self._chunk_size,
+            sketch_bytes=self.memory_bytes
+        )
+
+    @classmethod
+    def from_transactions(
+        cls,
+        transactions: List[Dict],
+        owner: Optional[str] = None,
+        seed: Optional[int] = 0
+    ) -> "TransactionSketch":
+        sketch = cls(owner, seed=seed)
+        sketch.add(transactions)
+        sketch.finish()
+        return sketch
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation, matching pandas"""
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.unique_to.registers.nbytes + self.unique_from.registers.nbytes + self.values.memory_bytes + self.hours.nbytes
+
+    def error_bounds(self) -> Dict[str, Any]:
+        return {
+            "unique_addresses_relative_error": self.unique_to.relative_error,
+            "value_quantiles_rank_error": self.values.rank_error,
+            "rapid_transactions_exact": self.time_ordered,
+            "examples_sampled": settings.sketch_sample_size
+        }
+
+    def pattern_summary(self) -> Dict[str, Any]:
+        """Same shape as DataFetcher.analyze_transaction_patterns, plus quantiles and error bounds"""
+        if self.count == 0:
+            return {"error": "No transactions to analyze"}
+        span = self.last_timestamp - self.first_timestamp
+        return {
+            "success": True,
+            "total_transactions": self.count,
+            "total_value_eth": self.total_value,
+            "average_value_eth": self.total_value / self.count,
+            "average_daily_transactions": self.count / (span / 86400 + 1),
+            "unique_to_addresses": int(round(self.unique_to.count())),
+            "unique_from_addresses": int(round(self.unique_from.count())),
+            "transaction_span_days": span / 86400 if span > 0 else 0,
+            "value_quantiles": dict(zip(
+                (f"p{int(q * 100)}" for q in VALUE_QUANTILES),
+                self.values.quantiles(VALUE_QUANTILES)
+            )),
+            "approximate": True,
+            "error_bounds": self.error_bounds()
+        }
+
+    def most_active_hours(self, top: int = 3) -> Dict[int, int]:
+        """Busiest UTC hours and their transaction counts"""
+        order = np.argsort(-self.hours, kind="stable")[:top]
+        return {int(hour): int(self.hours[hour]) for hour in order if self.hours[hour]}
+
+    def anomalies(self) -> List[Dict]:
+        """Transaction anomalies in WalletAnalyzer.detect_anomalies form, examples sampled"""
+        anomalies = []
+        for tx in self.unusual_examples:
+            anomalies.append({
+                "type": "unusual_value",
+                "description": f"Transaction value {float(tx.get('value', 0) or 0):.4f} ETH is unusually high",
+                "transaction_hash": tx.get("hash", ""),
+                "severity": "medium",
+                "sampled_from": self.unusual_values
+            })
+
+        if self.rapid_transactions:
+            anomalies.append({
+                "type": "rapid_transactions",
+                "description": f"Found {self.rapid_transactions} transactions within 1 minute of each other",
+                "severity": "low",
+                "exact": self.time_ordered
+            })
+
+        if self.flagged:
+            categories = sorted(set(self.flagged.values()))
+            anomalies.append({
+                "type": "flagged_counterparty",
+                "description": f"Transacted with {len(self.flagged)} flagged address(es): {', '.join(categories)}",
+                "addresses": dict(list(self.flagged.items())[:20]),
+                "severity": "high"
+            })
+        return anomalies
+
+class HistoryStream:
+    """
+    Collects a wallet's history page by page, switching to a sketch past sketch_threshold.
+
+    Pages are kept as a list until the history outgrows the threshold. From
+    then on the kept list and every later page go through the sketch and
+    on_chunk (e.g. to record them elsewhere) and are dropped, so memory stays
+    bounded however long the history is.
+    """
+
+    def __init__(self, owner: str, on_chunk: Optional[Callable[[List[Dict]], None]] = None):
+        self.owner = owner
+        self.on_chunk = on_chunk
+        self.transactions: List[Dict] = []
+        self.sketch: Optional[TransactionSketch] = None
+        self.count = 0
+
+    def add(self, page: List[Dict]):
+        self.count += len(page)
+        if self.sketch is None:
+            self.transactions.extend(page)
+            if not use_sketch_mode(self.transactions):
+                return
+            self.sketch = TransactionSketch(self.owner)
+            page, self.transactions = self.transactions, []
+        for chunk in iter_chunks(page):
+            self.sketch.add(chunk)
+            if self.on_chunk is not None:
+                self.on_chunk(chunk)
+
+    def finish(self):
+        if self.sketch is not None:
+            self.sketch.finish()
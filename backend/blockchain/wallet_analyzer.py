@@ -1,67 +1,264 @@
 from web3 import Web3
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Iterator, Set, Tuple, Union
 from datetime import datetime, timedelta
 from .data_fetcher import DataFetcher
+from .aggregates import AggregateStream, WalletAggregate, update_wallet_aggregate
+from .flagged import lookup_counterparties
+from .graph import get_transfer_graph
+from .transaction_sketch import HistoryStream, TransactionSketch, use_sketch_mode
+from ml.clustering import assign_cluster
+from ml.feature_store import store_features
+from ml.features import extract_feature_matrix, features_from_sketch
 import json
+from utils.address import is_valid_address
+from utils.tracing import span
+
+# Derived stages of the analysis pipeline, and the stages each one needs
+ANALYSIS_STAGES = ("risk", "anomalies", "patterns", "trust_score", "cluster")
+STAGE_DEPENDENCIES = {"trust_score": {"risk"}}
+# Data source stages, and the sources each derived stage reads
+DATA_SOURCES = ("balance", "etherscan", "the_graph", "alchemy")
+STAGE_SOURCES = {
+    "risk": {"balance", "etherscan", "the_graph"},
+    "anomalies": {"etherscan", "the_graph"},
+    "patterns": {"balance", "etherscan", "the_graph"},
+    "trust_score": {"balance", "etherscan"},
+    "cluster": {"balance", "etherscan"}
+}
+
+def resolve_stages(stages: Optional[Iterable[str]] = None) -> Set[str]:
+    """Requested stages plus the stages and data sources they need; None means every stage"""
+    if stages is None:
+        return set(ANALYSIS_STAGES) | set(DATA_SOURCES)
+    resolved = set(stages)
+    unknown = resolved - set(ANALYSIS_STAGES) - set(DATA_SOURCES)
+    if unknown:
+        raise ValueError(f"Unknown analysis stages: {', '.join(sorted(unknown))}")
+    for stage in list(resolved):
+        resolved |= STAGE_DEPENDENCIES.get(stage, set())
+    for stage in list(resolved):
+        resolved |= STAGE_SOURCES.get(stage, set())
+    return resolved
 
 class WalletAnalyzer:
-    def __init__(self, web3_provider: str = None):
-        self.data_fetcher = DataFetcher()
+    def __init__(self, web3_provider: str = None, data_fetcher: Optional[DataFetcher] = None, record: bool = True):
+        self.data_fetcher = data_fetcher or DataFetcher()
+        # With record off, analyses still read the transfer graph and stored aggregate but
+        # never write to the graph, the aggregate or the feature store (bulk runs, projections)
+        self.record = record
         self.web3 = Web3(Web3.HTTPProvider(web3_provider)) if web3_provider else None
 
-    def analyze_wallet(self, wallet_address: str, network: str = "ethereum") -> Dict[str, Any]:
+    def analyze_wallet(
+        self,
+        wallet_address: str,
+        network: str = "ethereum",
+        stages: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
         """Comprehensive wallet analysis with real data"""
-        if not Web3.is_address(wallet_address):
+        result = {}
+        # Parent span, so every stage of this analysis lands in one trace
+        with span("analysis", network=network):
+            for stage, payload in self.iter_analysis(wallet_address, network, stages):
+                if stage == "result":
+                    result = payload
+        return result
+
+    def iter_analysis(
+        self,
+        wallet_address: str,
+        network: str = "ethereum",
+        stages: Optional[Iterable[str]] = None
+    ) -> Iterator[Tuple[str, Any]]:
+        """Run the analysis pipeline, yielding (stage, payload) as each stage completes.
+
+        Data source stages are named after the source ("balance", "etherscan",
+        "the_graph", "alchemy"), followed by "risk", "anomalies", "patterns",
+        "trust_score" and "cluster". The last event is always "result" with the
+        full analysis.
+
+        Passing stages runs only those stages, plus the stages and data
+        sources they need; the other sources are not fetched, the result omits
+        the other stages and lists the ones that ran under "stages".
+        """
+        if not is_valid_address(wallet_address):
             raise ValueError("Invalid wallet address")
+        partial = stages is not None
+        stages = resolve_stages(stages)
 
         print(f"Starting analysis for wallet: {wallet_address}")
         
-        # Fetch comprehensive data
-        wallet_data = self.data_fetcher.get_wallet_data(wallet_address, network)
+        graph = get_transfer_graph(network)
+        streamed_aggregate: Optional[AggregateStream] = None
+
+        def record_chunk(chunk: List[Dict]):
+            # Past sketch_threshold, fetched chunks are recorded here and then dropped
+            nonlocal streamed_aggregate
+            if streamed_aggregate is None:
+                streamed_aggregate = AggregateStream(wallet_address, network)
+            streamed_aggregate.add(chunk)
+            # Compact chunk by chunk so the buffered transfers stay within the sketch budget
+            graph.add_transactions(chunk)
+            graph.compact()
+
+        # Fetch comprehensive data, source by source. Very large histories are
+        # sketched page by page as they arrive, and every stage reads the sketch
+        history = HistoryStream(wallet_address, on_chunk=record_chunk if self.record else None)
+        data_sources = {}
+        sources = stages & set(DATA_SOURCES)
+        for source, data in self.data_fetcher.iter_wallet_data(wallet_address, network, history, sources):
+            data_sources[source] = data
+            yield source, data
+        wallet_data = self.data_fetcher.compile_wallet_data(wallet_address, network, data_sources)
         
         if not wallet_data.get("success", True):
-            return {
+            yield "result", {
                 "wallet_address": wallet_address,
                 "success": False,
                 "error": wallet_data.get("error", "Failed to fetch wallet data")
             }
+            return
 
-        # Extract transactions for analysis
+        # Extract transactions for analysis; empty when the history was sketched
         transactions = wallet_data["data_sources"]["etherscan"].get("transactions", [])
+        sketch = history.sketch
         
-        # Perform risk assessment
-        risk_score = self.assess_risk(transactions, wallet_data)
-        anomalies = self.detect_anomalies(transactions, wallet_data)
-        patterns = self.analyze_patterns(transactions, wallet_data)
+        # Add the wallet's transfers to the counterparty graph and read its exposure
+        # (Stage spans close before each yield; see utils.tracing)
+        with span("graph", transactions=wallet_data["summary"]["total_transactions"]):
+            if self.record and sketch is None:
+                graph.add_transactions(transactions)
+            graph_features = graph.risk_features(wallet_address) if "risk" in stages else None
         
-        # Calculate trust score
-        trust_score = self.calculate_trust_score(risk_score, patterns, wallet_data)
+        # Fold any transactions not seen before into the wallet's streaming aggregate
+        if self.record:
+            with span("aggregate"):
+                if sketch is None:
+                    update_wallet_aggregate(wallet_address, network, transactions, wallet_data=wallet_data)
+                elif streamed_aggregate is not None:
+                    streamed_aggregate.save(wallet_data)
+        
+        derived = {}
+        
+        # Perform risk assessment, exact over the fetched history or from its sketch
+        if "risk" in stages:
+            with span("risk"):
+                derived["risk_score"] = self.assess_risk(transactions, wallet_data, graph_features, sketch)
+            yield "risk", derived["risk_score"]
+        if "anomalies" in stages:
+            with span("anomalies"):
+                derived["anomalies"] = self.detect_anomalies(transactions, wallet_data, sketch)
+            yield "anomalies", derived["anomalies"]
+        if "patterns" in stages:
+            with span("patterns"):
+                derived["patterns"] = self.analyze_patterns(transactions, wallet_data, sketch)
+            yield "patterns", derived["patterns"]
+        
+        # Calculate trust score; without the patterns stage, it reuses the risk stage's pattern analysis
+        if "trust_score" in stages:
+            with span("trust_score"):
+                patterns = derived.get("patterns") or {
+                    "transaction_patterns": derived["risk_score"].get("pattern_analysis", {})
+                }
+                derived["trust_score"] = self.calculate_trust_score(derived["risk_score"], patterns, wallet_data)
+            yield "trust_score", derived["trust_score"]
+        
+        if "cluster" in stages:
+            with span("cluster"):
+                # Compute the ML features once: stored for the scoring path, then used for clustering
+                balances = self._balances(wallet_address, wallet_data)
+                if sketch is None:
+                    features = extract_feature_matrix([wallet_address], {wallet_address: transactions}, balances)
+                else:
+                    features = features_from_sketch(sketch, balances.get(wallet_address, 0.0))
+                if self.record:
+                    store_features(network, [wallet_address], features)
 
-        return {
+                # Place the wallet among the trained behavioural clusters
+                derived["cluster_id"] = assign_cluster(features)
+            yield "cluster", derived["cluster_id"]
+
+        result = {
             "wallet_address": wallet_address,
             "network": network,
             "success": True,
             "timestamp": datetime.now().isoformat(),
-            "trust_score": trust_score,
-            "risk_score": risk_score,
-            "anomalies": anomalies,
-            "patterns": patterns,
+            **derived,
             "summary": wallet_data["summary"],
             "data_sources": wallet_data["data_sources"]
         }
+        if partial:
+            result["stages"] = sorted(stages)
+        yield "result", result
 
-    def assess_risk(self, transactions: List[Dict], wallet_data: Dict) -> Dict[str, Any]:
+    def refresh_score(
+        self,
+        wallet_address: str,
+        network: str = "ethereum",
+        new_transactions: Optional[List[Dict]] = None,
+        balance_data: Optional[Dict] = None
+    ) -> Dict[str, Any]:
+        """Update risk and trust scores from new transactions in O(new transactions)
+
+        Uses the wallet's persisted aggregate instead of refetching its history;
+        wallets without an aggregate get a full analysis.
+        """
+        new_transactions = new_transactions or []
+        aggregate, applied = update_wallet_aggregate(
+            wallet_address, network, new_transactions, balance_data=balance_data, create=False
+        )
+        if aggregate is None:
+            result = self.analyze_wallet(wallet_address, network)
+            return dict(result, incremental=False, new_transactions=len(new_transactions))
+        
+        graph = get_transfer_graph(network)
+        graph.add_transactions(new_transactions)
+        graph_features = graph.risk_features(wallet_address)
+        
+        wallet_data = aggregate.wallet_data()
+        risk_score = self.assess_risk(new_transactions, wallet_data, graph_features, aggregate)
+        patterns = {"transaction_patterns": aggregate.pattern_summary()}
+        trust_score = self.calculate_trust_score(risk_score, patterns, wallet_data)
+        
+        return {
+            "wallet_address": wallet_address,
+            "network": network,
+            "success": True,
+            "incremental": True,
+            "new_transactions": applied,
+            "timestamp": datetime.now().isoformat(),
+            "trust_score": trust_score,
+            "risk_score": risk_score
+        }
+
+    def _balances(self, wallet_address: str, wallet_data: Dict) -> Dict[str, float]:
+        """Native balance keyed by address, as the feature extractor expects"""
+        balance_data = wallet_data["data_sources"]["balance"]
+        if balance_data.get("success"):
+            return {wallet_address: float(balance_data["native_balance"])}
+        return {}
+
+    def assess_risk(
+        self,
+        transactions: List[Dict],
+        wallet_data: Dict,
+        graph_features: Optional[Dict] = None,
+        summary: Optional[Union[WalletAggregate, TransactionSketch]] = None
+    ) -> Dict[str, Any]:
         """Assess risk based on transaction patterns and wallet behavior"""
-        if not transactions:
+        if not transactions and not (summary and summary.count):
             return {"risk_level": "unknown", "risk_score": 0, "factors": []}
         
         risk_factors = []
         risk_score = 0
         
-        # Analyze transaction patterns
-        pattern_analysis = self.data_fetcher.analyze_transaction_patterns(transactions)
+        # Analyze transaction patterns; callers without the full history pass a summary of
+        # it instead (the wallet's aggregate for incremental refreshes, or the history's sketch)
+        if summary is not None:
+            pattern_analysis = summary.pattern_summary()
+        else:
+            pattern_analysis = self.data_fetcher.analyze_transaction_patterns(transactions)
         
         if pattern_analysis.get("success"):
             # Factor 1: Transaction frequency (high frequency = higher risk)
@@ -124,6 +321,15 @@ class WalletAnalyzer:
                 risk_factors.append("Very low balance")
                 risk_score += 10
         
+        # Factor 7: Counterparty exposure (from the transfer graph)
+        if graph_features:
+            if graph_features["direct_flagged"] > 0:
+                risk_factors.append("Direct transfers with flagged wallets")
+                risk_score += 30
+            elif graph_features["flagged_within_k"] > 0:
+                risk_factors.append("Flagged wallets in counterparty network")
+                risk_score += 10
+        
         # Normalize risk score to 0-100
         risk_score = max(0, min(100, risk_score))
         
@@ -139,16 +345,45 @@ class WalletAnalyzer:
             "risk_level": risk_level,
             "risk_score": risk_score,
             "factors": risk_factors,
-            "pattern_analysis": pattern_analysis
+            "pattern_analysis": pattern_analysis,
+            "graph": graph_features
         }
 
-    def detect_anomalies(self, transactions: List[Dict], wallet_data: Dict) -> List[Dict]:
-        """Detect anomalous patterns in transactions"""
+    def detect_anomalies(
+        self,
+        transactions: List[Dict],
+        wallet_data: Dict,
+        sketch: Optional[TransactionSketch] = None
+    ) -> List[Dict]:
+        """Detect anomalous patterns in transactions, reading a prebuilt sketch if given"""
         anomalies = []
         
-        if not transactions:
+        if not transactions and sketch is None:
             return anomalies
         
+        # Anomalies 1-3 from transactions, in bounded memory for very large histories
+        if sketch is None and use_sketch_mode(transactions):
+            sketch = TransactionSketch.from_transactions(transactions)
+        if sketch is not None:
+            anomalies.extend(sketch.anomalies())
+        else:
+            anomalies.extend(self._transaction_anomalies(transactions))
+        
+        # Anomaly 4: High DeFi activity
+        defi_count = wallet_data["summary"]["defi_transactions"]
+        if defi_count > 100:
+            anomalies.append({
+                "type": "high_defi_activity",
+                "description": f"Wallet has {defi_count} DeFi transactions",
+                "severity": "medium"
+            })
+        
+        return anomalies
+
+    def _transaction_anomalies(self, transactions: List[Dict]) -> List[Dict]:
+        """Exact transaction anomalies over the full history"""
+        anomalies = []
+        
         # Convert to pandas for easier analysis
         df = pd.DataFrame(transactions)
         df['value'] = pd.to_numeric(df['value'], errors='coerce')
@@ -182,19 +417,27 @@ class WalletAnalyzer:
                     "severity": "low"
                 })
         
-        # Anomaly 3: High DeFi activity
-        defi_count = wallet_data["summary"]["defi_transactions"]
-        if defi_count > 100:
+        # Anomaly 3: Counterparties on deny lists (sanctions, scams, mixers)
+        counterparties = [tx.get("from") for tx in transactions] + [tx.get("to") for tx in transactions]
+        flagged = lookup_counterparties(counterparties)
+        if flagged:
+            categories = sorted(set(flagged.values()))
             anomalies.append({
-                "type": "high_defi_activity",
-                "description": f"Wallet has {defi_count} DeFi transactions",
-                "severity": "medium"
+                "type": "flagged_counterparty",
+                "description": f"Transacted with {len(flagged)} flagged address(es): {', '.join(categories)}",
+                "addresses": dict(list(flagged.items())[:20]),
+                "severity": "high"
             })
         
         return anomalies
 
-    def analyze_patterns(self, transactions: List[Dict], wallet_data: Dict) -> Dict[str, Any]:
-        """Analyze behavioral patterns"""
+    def analyze_patterns(
+        self,
+        transactions: List[Dict],
+        wallet_data: Dict,
+        sketch: Optional[TransactionSketch] = None
+    ) -> Dict[str, Any]:
+        """Analyze behavioral patterns, reading a prebuilt sketch if given"""
         patterns = {
             "transaction_patterns": {},
             "defi_usage": {},
@@ -202,7 +445,13 @@ class WalletAnalyzer:
             "activity_timeline": {}
         }
         
-        if transactions:
+        if sketch is None and use_sketch_mode(transactions):
+            sketch = TransactionSketch.from_transactions(transactions)
+        if sketch is not None:
+            # Patterns and timeline from the bounded-memory sketch
+            patterns["transaction_patterns"] = sketch.pattern_summary()
+            patterns["activity_timeline"]["most_active_hours"] = sketch.most_active_hours()
+        elif transactions:
             # Transaction pattern analysis
             pattern_analysis = self.data_fetcher.analyze_transaction_patterns(transactions)
             if pattern_analysis.get("success"):
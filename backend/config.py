@@ -58,14 +58,101 @@ class Settings(BaseSettings):
     # Rate Limiting
     rate_limit_per_minute: int = 60
     rate_limit_per_hour: int = 1000
+    upstream_requests_per_second: float = 10.0  # Shared upstream quota for bulk jobs
+    
+    # Background jobs
+    job_queue_backend: str = "redis"  # "redis", or "memory" for tests/single process
+    job_worker_concurrency: int = 2
+    job_max_retries: int = 2
+    job_pending_ttl: int = 86400  # 1 day
+    job_result_ttl: int = 3600  # 1 hour
+    job_max_batch_size: int = 1000
+    job_visibility_timeout: int = 300  # Seconds a reserved job may go without a heartbeat before it is reclaimed
+    job_reclaim_interval: float = 30.0  # Seconds between each worker's scans for abandoned jobs
+    
+    # Block watcher
+    watcher_ws_url: Optional[str] = None  # Websocket RPC for newHeads; polls the HTTP RPC when unset or down
+    watcher_mode: str = "invalidate"  # "invalidate", or "refresh" to also queue a re-analysis
+    watcher_poll_interval: float = 12.0  # Seconds between eth_blockNumber polls
+    watcher_ws_retry: float = 60.0  # Seconds of polling before retrying the websocket
+    watcher_tracked_refresh: float = 30.0  # Seconds between reloads of the tracked-wallet set
+    watcher_max_catchup: int = 64  # Most missed blocks scanned after a gap
+    
+    # Heavy hitters and cache warming
+    hotkeys_cms_width: int = 65536  # Count-Min counters per row
+    hotkeys_cms_depth: int = 4
+    hotkeys_top_k: int = 100  # Most requested wallets tracked per network
+    hotkeys_window: int = 3600  # Seconds per counting window
+    hotkeys_flush_interval: float = 1.0  # Seconds each worker batches counts before writing them
+    warm_interval: float = 30.0  # Seconds between warming passes
+    warm_lead_time: int = 300  # Re-analyze hot wallets this long before their cache entry expires
+    warm_min_requests: int = 10  # Requests per window before a wallet is worth warming
+    warm_quota_share: float = 0.2  # Share of upstream_requests_per_second the warmer may use
     
     # Monitoring
     sentry_dsn: Optional[str] = None
     prometheus_enabled: bool = True
+    metrics_max_endpoints: int = 200  # Distinct endpoint label values before the rest become "other"
+    metrics_scrape_cache_seconds: float = 1.0  # Scrapes within this long of the last one reuse its output
+    service_metrics_port: int = 9100  # Port background services (worker, watcher, warmer, graph) serve /metrics on; 0 disables
+    health_sample_interval: float = 5.0  # Seconds between background health samples
+    health_check_timeout: float = 2.0  # Per-dependency check timeout
+    health_stale_after: float = 30.0  # A snapshot older than this makes the worker not ready
+    health_required_dependencies: List[str] = ["redis"]  # Dependencies that must be healthy for readiness
+    upstream_failure_threshold: int = 3  # Consecutive failed calls before an upstream API is reported failing
+    tracing_enabled: bool = True  # Per-stage latency histograms; off makes spans no-ops
+    tracing_export_path: Optional[str] = None  # Append OTLP/JSON spans to this file
+    tracing_otlp_endpoint: Optional[str] = None  # OTLP/HTTP collector base URL, e.g. http://localhost:4318
+    tracing_service_name: Optional[str] = None  # service.name on exported spans; defaults to app_name
+    tracing_queue_size: int = 10000  # Finished spans buffered for export before new ones are dropped
+    tracing_batch_size: int = 512  # Most spans per export
+    tracing_flush_interval: float = 1.0  # Seconds a partial batch waits before export
     
     # ML Models
     model_path: str = "ml/models/"
+    model_reload_interval: int = 60  # Seconds between checks for a new model version
+    ml_train_n_jobs: int = -1  # Cores used for training; -1 uses all of them
+    ml_train_chunk_size: int = 100000  # Labeled rows streamed per training chunk
+    ml_train_trees_per_chunk: int = 10
+    feature_store_enabled: bool = True
+    feature_store_path: str = "ml/feature_store/"
+    feature_store_max_age: int = 3600  # Stored features older than this are recomputed
+    flagged_path: str = "blockchain/flagged/"
+    flagged_fp_rate: float = 0.001  # Bloom filter false positive rate
+    flagged_check_interval: float = 5.0  # Seconds between checks for a newly published index
+    graph_path: str = "blockchain/graph/"
+    graph_max_hops: int = 2
+    graph_hub_degree: int = 1000  # Counterparties above which a wallet is not expanded through
+    graph_max_neighbours: int = 100000  # Stop multi-hop expansion after this many wallets
+    graph_delta_max_edges: int = 50000  # Recent transfers kept outside the base matrix before a merge
+    graph_max_live_nodes: int = 200000  # Wallets a worker adds to the loaded snapshot before dropping them
+    graph_max_live_transfers: int = 1000000  # Transfers a worker adds to the loaded snapshot before dropping them
+    graph_reload_interval: float = 60.0  # Seconds between checks for a rebuilt snapshot
+    cluster_path: str = "ml/clusters/wallet_clusters.npz"
+    cluster_check_interval: float = 5.0  # Seconds between checks for retrained clusters
+    cluster_silhouette_sample: int = 10000  # Rows used to score clustering quality
+    ml_compiled_inference: bool = True  # Flattened NumPy forest for small batches
+    ml_compiled_max_batch: int = 64  # Larger batches go through sklearn
+    ml_batch_max_size: int = 32  # Rows per micro-batched prediction
+    ml_batch_max_wait_ms: float = 5.0  # Longest a request waits for its batch to fill
+    shap_cache_size: int = 10000  # Cached per-wallet explanations
+    shap_top_k: int = 5
+    shap_fast_mode: bool = True  # Approximate (Saabas) attributions for inline explanations
     cache_ttl: int = 3600  # 1 hour
+    aggregate_ttl: int = 2592000  # 30 days; wallet aggregates are updated in place
+    cache_keyspace_report_interval: float = 300.0  # Seconds between sampled keyspace reports; 0 disables them
+    cache_keyspace_sample_size: int = 1000  # Random keys sampled per keyspace report
+    response_compress_min_bytes: int = 1024  # Cached response bodies below this are stored uncompressed
+    response_gzip_level: int = 6
+    response_zstd_level: int = 3
+    address_cache_size: int = 100000  # Memoized address validations/checksums
+    etherscan_page_size: int = 10000  # Rows per txlist request (Etherscan's maximum)
+    etherscan_max_transactions: int = 500000  # Cap on the history fetched for one wallet
+    sketch_threshold: int = 50000  # Transactions above which analysis switches to bounded-memory sketches
+    sketch_max_memory_mb: int = 32  # Working-set cap for one sketched analysis
+    sketch_kll_k: int = 200  # Quantile sketch size; rank error 2.296 / k^0.9723
+    sketch_hll_precision: int = 12  # Distinct-count registers 2^p; relative error 1.04 / sqrt(2^p)
+    sketch_sample_size: int = 20  # Example transactions kept per sketched anomaly
     
     # Logging
     log_level: str = "INFO"
@@ -74,6 +161,8 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
         case_sensitive = False
+        # model_path and model_reload_interval are settings, not pydantic internals
+        protected_namespaces = ()
 
 # Global settings instance
 settings = Settings()
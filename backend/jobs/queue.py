@@ -0,0 +1,276 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import redis
+
+from config import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+JOB_TYPES = ("wallet_analysis", "batch_analysis")
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+def new_job(job_type: str, payload: Dict[str, Any], max_retries: Optional[int] = None) -> Dict[str, Any]:
+    """Build the initial record for a job"""
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unsupported job type: {job_type}")
+
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "type": job_type,
+        "payload": payload,
+        "status": "queued",
+        "progress": {"done": 0, "total": len(payload.get("addresses", [])) or 1},
+        "result": None,
+        "error": None,
+        "attempts": 0,
+        "max_retries": settings.job_max_retries if max_retries is None else max_retries,
+        "cancel_requested": False,
+        "created_at": now,
+        "updated_at": now
+    }
+
+# Takes an abandoned job back from the processing list if its lease is still expired
+_RECLAIM_SCRIPT = """
+local deadline = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if deadline and tonumber(deadline) <= tonumber(ARGV[2]) then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('LREM', KEYS[2], 0, ARGV[1])
+    redis.call('LPUSH', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# Requests cancellation in one step, so a worker's status write cannot land between
+# the check and the set; fields hold JSON, hence the quoted status values
+_CANCEL_SCRIPT = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if not status then
+    return 0
+end
+if status == '"completed"' or status == '"failed"' or status == '"cancelled"' then
+    return 1
+end
+redis.call('HSET', KEYS[1], 'cancel_requested', 'true', 'updated_at', ARGV[1])
+if status == '"queued"' then
+    redis.call('HSET', KEYS[1], 'status', '"cancelled"')
+end
+return 1
+"""
+
+class RedisJobQueue:
+    """
+    Job queue backed by a Redis list, with each job's state in its own hash.
+
+    Reserving moves a job id atomically (BLMOVE) onto a processing list and
+    gives it a lease in a sorted set. Workers renew the lease with heartbeat()
+    while they run the job, and finish() or requeue() removes it. If a worker
+    dies, its lease expires and reclaim_expired() puts the job back on the
+    queue, so no job is lost between reserve and finish.
+    """
+
+    def __init__(self, redis_client=None, queue_name: str = "jobs:queue"):
+        self.redis_client = redis_client or redis.from_url(settings.redis_url)
+        self.queue_name = queue_name
+        self.processing_name = f"{queue_name}:processing"
+        self.leases_name = f"{queue_name}:leases"
+        self.visibility_timeout = settings.job_visibility_timeout
+        self._reclaim = self.redis_client.register_script(_RECLAIM_SCRIPT)
+        self._cancel = self.redis_client.register_script(_CANCEL_SCRIPT)
+
+    def _key(self, job_id: str) -> str:
+        return f"job:{job_id}"
+
+    def submit(self, job_type: str, payload: Dict[str, Any], max_retries: Optional[int] = None) -> Dict[str, Any]:
+        """Create a job and push it onto the queue"""
+        job = new_job(job_type, payload, max_retries)
+        key = self._key(job["id"])
+        pipe = self.redis_client.pipeline()
+        pipe.hset(key, mapping={field: json.dumps(value) for field, value in job.items()})
+        pipe.expire(key, settings.job_pending_ttl)
+        pipe.lpush(self.queue_name, job["id"])
+        pipe.execute()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job's current state"""
+        fields = self.redis_client.hgetall(self._key(job_id))
+        if not fields:
+            return None
+        return {field.decode(): json.loads(value) for field, value in fields.items()}
+
+    def update(self, job_id: str, **fields):
+        """Update individual job fields"""
+        fields["updated_at"] = time.time()
+        self.redis_client.hset(self._key(job_id), mapping={field: json.dumps(value) for field, value in fields.items()})
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        """Check whether cancellation was requested for a job"""
+        return self.redis_client.hget(self._key(job_id), "cancel_requested") == b"true"
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Request cancellation; queued jobs are cancelled immediately, running ones at the next checkpoint"""
+        if not self._cancel(keys=[self._key(job_id)], args=[json.dumps(time.time())]):
+            return None
+        return self.get(job_id)
+
+    def reserve(self, timeout: int = 5) -> Optional[Dict[str, Any]]:
+        """Block until a job is available, lease it to this worker and return it"""
+        item = self.redis_client.blmove(self.queue_name, self.processing_name, timeout, "RIGHT", "LEFT")
+        if item is None:
+            return None
+        job_id = item.decode()
+        self.heartbeat(job_id)
+        job = self.get(job_id)
+        if job is None:
+            # The job's record expired while it was queued
+            self._release(job_id)
+        return job
+
+    def heartbeat(self, job_id: str):
+        """Extend a reserved job's lease"""
+        self.redis_client.zadd(self.leases_name, {job_id: time.time() + self.visibility_timeout})
+
+    def _release(self, job_id: str, pipe=None):
+        """Drop a job from the processing list and its lease"""
+        own_pipe = pipe is None
+        pipe = pipe if pipe is not None else self.redis_client.pipeline()
+        pipe.lrem(self.processing_name, 0, job_id)
+        pipe.zrem(self.leases_name, job_id)
+        if own_pipe:
+            pipe.execute()
+
+    def requeue(self, job_id: str):
+        """Put a job back on the queue for another attempt"""
+        self.update(job_id, status="queued")
+        pipe = self.redis_client.pipeline()
+        self._release(job_id, pipe)
+        pipe.lpush(self.queue_name, job_id)
+        pipe.execute()
+
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+        """Record a job's final state and start its result TTL"""
+        self.update(job_id, status=status, result=result, error=error, finished_at=time.time())
+        pipe = self.redis_client.pipeline()
+        pipe.expire(self._key(job_id), settings.job_result_ttl)
+        self._release(job_id, pipe)
+        pipe.execute()
+
+    def reclaim_expired(self) -> List[str]:
+        """Requeue reserved jobs whose lease expired (their worker died); returns their ids"""
+        now = time.time()
+        reclaimed = []
+        for raw_id in self.redis_client.zrangebyscore(self.leases_name, "-inf", now):
+            job_id = raw_id.decode()
+            # Atomic per job, so concurrent reclaimers never requeue it twice
+            if self._reclaim(keys=[self.leases_name, self.processing_name, self.queue_name], args=[job_id, now]):
+                self.update(job_id, status="queued", error="Worker stopped before finishing the job")
+                reclaimed.append(job_id)
+        if reclaimed:
+            logger.warning("Reclaimed abandoned jobs", jobs=reclaimed)
+        return reclaimed
+
+class InMemoryJobQueue:
+    """In-process stand-in for RedisJobQueue, for tests and single-process deployments"""
+
+    def __init__(self):
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.expires_at: Dict[str, float] = {}
+        self.pending: deque = deque()
+        self._condition = threading.Condition()
+
+    def _purge_expired(self):
+        now = time.time()
+        for job_id in [job_id for job_id, expiry in self.expires_at.items() if expiry <= now]:
+            self.jobs.pop(job_id, None)
+            self.expires_at.pop(job_id, None)
+
+    def submit(self, job_type: str, payload: Dict[str, Any], max_retries: Optional[int] = None) -> Dict[str, Any]:
+        """Create a job and push it onto the queue"""
+        job = new_job(job_type, payload, max_retries)
+        with self._condition:
+            self.jobs[job["id"]] = job
+            self.expires_at[job["id"]] = time.time() + settings.job_pending_ttl
+            self.pending.appendleft(job["id"])
+            self._condition.notify()
+        return json.loads(json.dumps(job))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job's current state"""
+        with self._condition:
+            self._purge_expired()
+            job = self.jobs.get(job_id)
+            # Round-trip through JSON so callers see the same types as with Redis
+            return json.loads(json.dumps(job)) if job else None
+
+    def update(self, job_id: str, **fields):
+        """Update individual job fields"""
+        with self._condition:
+            if job_id in self.jobs:
+                fields["updated_at"] = time.time()
+                self.jobs[job_id].update(fields)
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        """Check whether cancellation was requested for a job"""
+        with self._condition:
+            return bool(self.jobs.get(job_id, {}).get("cancel_requested"))
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Request cancellation; queued jobs are cancelled immediately, running ones at the next checkpoint"""
+        job = self.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return job
+        fields = {"cancel_requested": True}
+        if job["status"] == "queued":
+            fields["status"] = "cancelled"
+        self.update(job_id, **fields)
+        return self.get(job_id)
+
+    def reserve(self, timeout: int = 5) -> Optional[Dict[str, Any]]:
+        """Block until a job is available and return it"""
+        with self._condition:
+            if not self.pending:
+                self._condition.wait(timeout)
+            if not self.pending:
+                return None
+            job_id = self.pending.pop()
+        return self.get(job_id)
+
+    def heartbeat(self, job_id: str):
+        """Leases only matter across processes; nothing to extend here"""
+
+    def reclaim_expired(self) -> List[str]:
+        """Jobs die with this process, so there is never anything to reclaim"""
+        return []
+
+    def requeue(self, job_id: str):
+        """Put a job back on the queue for another attempt"""
+        self.update(job_id, status="queued")
+        with self._condition:
+            self.pending.appendleft(job_id)
+            self._condition.notify()
+
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+        """Record a job's final state and start its result TTL"""
+        self.update(job_id, status=status, result=result, error=error, finished_at=time.time())
+        with self._condition:
+            self.expires_at[job_id] = time.time() + settings.job_result_ttl
+
+_job_queue = None
+
+def get_job_queue():
+    """Get the configured job queue for this process"""
+    global _job_queue
+    if _job_queue is None:
+        if settings.job_queue_backend == "memory":
+            _job_queue = InMemoryJobQueue()
+        else:
+            _job_queue = RedisJobQueue()
+    return _job_queue
@@ -0,0 +1,156 @@
+"""Proactive cache warmer for the most requested wallets.
+
+Every warm_interval seconds the warmer takes each network's heavy hitters
+(utils.heavy_hitters), and re-analyzes those whose cached analysis is missing
+or expires within warm_lead_time, so hot wallets never fall out of cache under
+load. Upstream calls are paced to warm_quota_share of
+upstream_requests_per_second, leaving the rest for live traffic.
+
+Only one warmer does work at a time: replicas compete for a Redis leader
+lock and the others stand by. Its cache_warmed_total counter is served on
+service_metrics_port.
+
+Usage:
+    python -m jobs.warmer --network ethereum --network polygon
+"""
+import argparse
+import signal
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+from api.responses import store_wallet_response
+from blockchain.bulk_score import SharedThrottle
+from blockchain.data_fetcher import DataFetcher
+from blockchain.wallet_analyzer import WalletAnalyzer
+from config import settings
+from utils.cache import cache, cache_wallet_analysis, get_wallet_analysis_ttl
+from utils.heavy_hitters import HeavyHitterTracker, heavy_hitters
+from utils.logger import get_logger
+from utils.monitoring import CACHE_WARMED, start_metrics_server
+
+logger = get_logger(__name__)
+
+LEADER_KEY = "hotkeys:warmer:leader"
+
+# Compare-and-expire/delete, so a warmer whose lock lapsed and was taken by
+# another replica between the check and the write cannot touch the new lock
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class CacheWarmer:
+    """Re-analyzes hot wallets shortly before their cache entries expire"""
+
+    def __init__(
+        self,
+        networks: List[str],
+        tracker: Optional[HeavyHitterTracker] = None,
+        analyzer: Optional[WalletAnalyzer] = None,
+        redis_client=None
+    ):
+        self.networks = networks
+        self.tracker = tracker or heavy_hitters
+        self.redis_client = redis_client or cache.redis_client
+        if analyzer is None:
+            throttle = SharedThrottle(settings.upstream_requests_per_second * settings.warm_quota_share)
+            analyzer = WalletAnalyzer(data_fetcher=DataFetcher(throttle=throttle))
+        self.analyzer = analyzer
+        self.token = uuid.uuid4().hex
+        # The lock outlives a pass, so a stalled leader hands over after a few intervals
+        self.lock_ttl = int(settings.warm_interval * 3) + 1
+        self._renew = self.redis_client.register_script(_RENEW_SCRIPT)
+        self._release = self.redis_client.register_script(_RELEASE_SCRIPT)
+
+    def acquire_leadership(self) -> bool:
+        """Take or renew the leader lock"""
+        if self.redis_client.set(LEADER_KEY, self.token, nx=True, ex=self.lock_ttl):
+            return True
+        return bool(self._renew(keys=[LEADER_KEY], args=[self.token, self.lock_ttl]))
+
+    def release_leadership(self):
+        self._release(keys=[LEADER_KEY], args=[self.token])
+
+    def due_wallets(self, network: str) -> List[str]:
+        """Hot wallets whose cached analysis is missing or about to expire, hottest first"""
+        due = []
+        for address, requests in self.tracker.top(network):
+            if requests < settings.warm_min_requests:
+                break
+            ttl = get_wallet_analysis_ttl(address, network)
+            # -2: not cached; -1: no expiry (or the lookup failed), nothing to warm
+            if ttl == -2 or 0 <= ttl < settings.warm_lead_time:
+                due.append(address)
+        return due
+
+    def warm(self, address: str, network: str) -> bool:
+        try:
+            result = self.analyzer.analyze_wallet(address, network)
+        except Exception as e:
+            logger.error("Cache warming failed", wallet_address=address, network=network, error=str(e))
+            return False
+        if not result.get("success", True):
+            return False
+        # Marks the entries so hits on them are counted as warm hits
+        result["cache_warmed_at"] = time.time()
+        cache_wallet_analysis(address, network, result)
+        store_wallet_response(address, network, result, warmed=True)
+        CACHE_WARMED.labels(network=network).inc()
+        return True
+
+    def run_once(self, stop_event: Optional[threading.Event] = None) -> int:
+        """One warming pass over every network; returns the number of wallets warmed"""
+        warmed = 0
+        for network in self.networks:
+            for address in self.due_wallets(network):
+                if stop_event is not None and stop_event.is_set():
+                    return warmed
+                warmed += self.warm(address, network)
+        if warmed:
+            logger.info("Warmed hot wallets", wallets=warmed)
+        return warmed
+
+    def run(self, stop_event: Optional[threading.Event] = None):
+        """Warm on every interval while holding the leader lock"""
+        stop_event = stop_event or threading.Event()
+        logger.info("Cache warmer started", networks=self.networks, token=self.token)
+        try:
+            while not stop_event.is_set():
+                try:
+                    if self.acquire_leadership():
+                        self.run_once(stop_event)
+                except Exception as e:
+                    logger.error("Cache warmer error", error=str(e))
+                stop_event.wait(settings.warm_interval)
+        finally:
+            self.release_leadership()
+            logger.info("Cache warmer stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the most requested wallets warm in cache")
+    parser.add_argument(
+        "--network", action="append", dest="networks",
+        help="Network to warm (repeatable, default: ethereum)"
+    )
+    parser.add_argument("--metrics-port", type=int, default=None, help="Port for /metrics (default: service_metrics_port; 0 disables)")
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    start_metrics_server(args.metrics_port)
+    CacheWarmer(args.networks or ["ethereum"]).run(stop_event)
+
+if __name__ == "__main__":
+    main()
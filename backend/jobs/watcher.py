@@ -0,0 +1,276 @@
+"""New-block watcher.
+
+Follows the chain head and invalidates cached analyses of tracked wallets as
+soon as they appear in a block, instead of letting them go stale until their
+TTL. Wallets are tracked when their analysis is cached (utils.cache.
+track_wallet); idle wallets are never refetched.
+
+Heads arrive over a websocket eth_subscribe("newHeads") when watcher_ws_url is
+set, otherwise (or while the websocket is down) by polling eth_blockNumber.
+Each new block is read over HTTP JSON-RPC: its transactions' from/to plus the
+sender and recipient of every ERC-20 Transfer log. Touched addresses are
+matched as raw 20-byte keys against an in-memory copy of the tracked set.
+
+In "refresh" mode matched wallets are also queued for re-analysis, so their
+cache is warm again before the next request.
+
+Usage:
+    python -m jobs.watcher --network ethereum
+    python -m jobs.watcher --rpc-url http://localhost:8545 --ws-url ws://localhost:8546 --mode refresh
+
+Its counters (watcher_*) are served on service_metrics_port.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import signal
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import aiohttp
+import websockets
+
+from config import settings
+from utils.address import address_from_bytes
+from utils.cache import get_tracked_wallets, invalidate_wallet_cache, untrack_wallets
+from utils.logger import get_logger
+from utils.monitoring import WATCHER_BLOCKS_PROCESSED, WATCHER_WALLETS_INVALIDATED, start_metrics_server
+from .queue import get_job_queue
+
+logger = get_logger(__name__)
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+WATCHER_MODES = ("invalidate", "refresh")
+
+class RpcError(Exception):
+    """JSON-RPC error response"""
+
+class JsonRpcClient:
+    """Minimal async JSON-RPC client over HTTP"""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._ids = itertools.count(1)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def call(self, method: str, params: Optional[List] = None) -> Any:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params or []}
+        async with self._session.post(self.url, json=payload) as response:
+            response.raise_for_status()
+            body = await response.json(content_type=None)
+        if body.get("error"):
+            raise RpcError(f"{method}: {body['error']}")
+        return body.get("result")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+def _raw(address: Optional[str]) -> Optional[bytes]:
+    """Raw bytes of a hex address or 32-byte topic, without checksum validation"""
+    if not address or len(address) < 40:
+        return None
+    try:
+        return bytes.fromhex(address[-40:])
+    except ValueError:
+        return None
+
+def touched_addresses(block: Dict, logs: Iterable[Dict] = ()) -> Set[bytes]:
+    """Raw addresses sending or receiving ETH or ERC-20 tokens in a block"""
+    touched = set()
+    for tx in block.get("transactions") or []:
+        if isinstance(tx, dict):
+            touched.add(_raw(tx.get("from")))
+            touched.add(_raw(tx.get("to")))
+    for log in logs:
+        topics = log.get("topics") or []
+        if len(topics) >= 3 and topics[0] == TRANSFER_TOPIC:
+            touched.add(_raw(topics[1]))
+            touched.add(_raw(topics[2]))
+    touched.discard(None)
+    return touched
+
+class TrackedWallets:
+    """In-memory copy of the tracked-wallet set, reloaded from Redis periodically"""
+
+    def __init__(self, network: str, refresh_interval: Optional[float] = None):
+        self.network = network
+        self.refresh_interval = settings.watcher_tracked_refresh if refresh_interval is None else refresh_interval
+        self._wallets: Set[bytes] = set()
+        self._loaded_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._wallets)
+
+    def refresh(self):
+        self._wallets = get_tracked_wallets(self.network)
+        self._loaded_at = time.monotonic()
+
+    def match(self, touched: Set[bytes]) -> Set[bytes]:
+        if time.monotonic() - self._loaded_at >= self.refresh_interval:
+            self.refresh()
+        return touched & self._wallets
+
+    def remove(self, raw_addresses: Set[bytes]):
+        self._wallets -= raw_addresses
+        untrack_wallets(self.network, raw_addresses)
+
+class BlockWatcher:
+    """Scans each new block for tracked wallets and invalidates or refreshes them"""
+
+    def __init__(
+        self,
+        network: str = "ethereum",
+        rpc_url: Optional[str] = None,
+        ws_url: Optional[str] = None,
+        mode: Optional[str] = None,
+        tracked: Optional[TrackedWallets] = None,
+        job_queue=None
+    ):
+        self.network = network
+        self.rpc = JsonRpcClient(rpc_url or getattr(settings, f"{network}_rpc_url"))
+        self.ws_url = ws_url if ws_url is not None else settings.watcher_ws_url
+        self.mode = mode or settings.watcher_mode
+        if self.mode not in WATCHER_MODES:
+            raise ValueError(f"Unsupported watcher mode: {self.mode}")
+        self.tracked = tracked or TrackedWallets(network)
+        self.job_queue = job_queue
+        self.last_block: Optional[int] = None
+        self._stop = asyncio.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def on_match(self, raw_addresses: Set[bytes]):
+        """Invalidate matched wallets and, in refresh mode, queue their re-analysis"""
+        for raw in raw_addresses:
+            address = address_from_bytes(raw)
+            invalidate_wallet_cache(address, self.network)
+            if self.mode == "refresh":
+                self.job_queue = self.job_queue or get_job_queue()
+                self.job_queue.submit("wallet_analysis", {"address": address, "network": self.network})
+        # Untracked until cached again, so wallets nobody asks about stop costing work
+        self.tracked.remove(raw_addresses)
+        WATCHER_WALLETS_INVALIDATED.labels(network=self.network, mode=self.mode).inc(len(raw_addresses))
+
+    async def process_block(self, number: int) -> int:
+        """Scan one block; returns how many tracked wallets it touched"""
+        block_hex = hex(number)
+        block = await self.rpc.call("eth_getBlockByNumber", [block_hex, True])
+        if block is None:
+            raise RpcError(f"Block {number} not available yet")
+        logs = await self.rpc.call("eth_getLogs", [{
+            "fromBlock": block_hex,
+            "toBlock": block_hex,
+            "topics": [TRANSFER_TOPIC]
+        }])
+        matched = self.tracked.match(touched_addresses(block, logs or []))
+        if matched:
+            self.on_match(matched)
+            logger.info("Tracked wallets touched", network=self.network, block=number, wallets=len(matched))
+        WATCHER_BLOCKS_PROCESSED.labels(network=self.network).inc()
+        return len(matched)
+
+    async def advance_to(self, head: int):
+        """Scan blocks after the last one processed up to head, capped at watcher_max_catchup"""
+        if self.last_block is None:
+            start = head
+        elif head > self.last_block:
+            start = max(self.last_block + 1, head - settings.watcher_max_catchup + 1)
+            if start > self.last_block + 1:
+                logger.warning("Skipping missed blocks", network=self.network, skipped=start - self.last_block - 1)
+        else:
+            # Same or lower height: a reorg replaced the head, rescan it
+            start = head
+        for number in range(start, head + 1):
+            await self.process_block(number)
+            self.last_block = number
+
+    async def _sleep(self, seconds: float) -> bool:
+        """Sleep unless stopped; returns False once stopped"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=seconds)
+            return False
+        except asyncio.TimeoutError:
+            return True
+
+    async def poll(self, duration: Optional[float] = None):
+        """Follow the head by polling eth_blockNumber, for duration seconds or until stopped"""
+        deadline = None if duration is None else time.monotonic() + duration
+        while not self._stop.is_set() and (deadline is None or time.monotonic() < deadline):
+            try:
+                await self.advance_to(int(await self.rpc.call("eth_blockNumber"), 16))
+            except Exception as e:
+                logger.error("Block poll failed", network=self.network, error=str(e))
+            if not await self._sleep(settings.watcher_poll_interval):
+                return
+
+    async def subscribe(self):
+        """Follow the head over a newHeads websocket subscription"""
+        async with websockets.connect(self.ws_url) as ws:
+            await ws.send(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}))
+            reply = json.loads(await ws.recv())
+            if reply.get("error"):
+                raise RpcError(f"eth_subscribe: {reply['error']}")
+            logger.info("Subscribed to new heads", network=self.network, url=self.ws_url)
+            while not self._stop.is_set():
+                try:
+                    message = json.loads(await asyncio.wait_for(ws.recv(), timeout=settings.watcher_poll_interval * 5))
+                except asyncio.TimeoutError:
+                    # Quiet subscription: make sure the connection and chain are still moving
+                    await self.advance_to(int(await self.rpc.call("eth_blockNumber"), 16))
+                    continue
+                head = (message.get("params") or {}).get("result") or {}
+                if "number" in head:
+                    await self.advance_to(int(head["number"], 16))
+
+    async def run(self):
+        """Watch until stopped, preferring the websocket and polling while it is unavailable"""
+        self.tracked.refresh()
+        logger.info("Block watcher started", network=self.network, mode=self.mode, tracked=len(self.tracked))
+        try:
+            while not self._stop.is_set():
+                if not self.ws_url:
+                    await self.poll()
+                    break
+                try:
+                    await self.subscribe()
+                except Exception as e:
+                    logger.warning("Websocket unavailable, polling", network=self.network, error=str(e))
+                    await self.poll(settings.watcher_ws_retry)
+        finally:
+            await self.rpc.close()
+            logger.info("Block watcher stopped", network=self.network)
+
+def main():
+    parser = argparse.ArgumentParser(description="Invalidate cached analyses of wallets seen in new blocks")
+    parser.add_argument("--network", default="ethereum")
+    parser.add_argument("--rpc-url", default=None, help="HTTP JSON-RPC endpoint (default: <network>_rpc_url)")
+    parser.add_argument("--ws-url", default=None, help="Websocket endpoint for newHeads (default: watcher_ws_url)")
+    parser.add_argument("--mode", choices=WATCHER_MODES, default=None, help="Invalidate, or also queue re-analysis")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Port for /metrics (default: service_metrics_port; 0 disables)")
+    args = parser.parse_args()
+
+    mode = args.mode or settings.watcher_mode
+    if mode == "refresh" and settings.job_queue_backend == "memory":
+        raise SystemExit("Refresh mode needs job_queue_backend=redis so workers can pick up the jobs")
+
+    start_metrics_server(args.metrics_port)
+    watcher = BlockWatcher(args.network, rpc_url=args.rpc_url, ws_url=args.ws_url, mode=mode)
+
+    async def _run():
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, watcher.stop)
+        await watcher.run()
+
+    asyncio.run(_run())
+
+if __name__ == "__main__":
+    main()
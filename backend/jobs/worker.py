@@ -0,0 +1,200 @@
+"""Background job worker.
+
+Runs WalletAnalyzer jobs from the job queue in separate processes so analysis
+cost never sits inside an API request.
+
+The parent process serves /metrics on service_metrics_port. With
+PROMETHEUS_MULTIPROC_DIR set, as in the backend image, that endpoint
+aggregates every worker process; without it only the parent's own registry
+is visible, so run a single worker or set the directory.
+
+Usage:
+    python -m jobs.worker --concurrency 4
+"""
+import argparse
+import multiprocessing
+import signal
+import threading
+import time
+from typing import Any, Dict
+
+from blockchain.wallet_analyzer import WalletAnalyzer
+from config import settings
+from utils.cache import cache_wallet_analysis
+from utils.logger import get_logger
+from utils.monitoring import MULTIPROCESS, mark_worker_dead, start_metrics_server
+from .queue import get_job_queue
+
+logger = get_logger(__name__)
+
+class JobCancelled(Exception):
+    """Raised when a running job is cancelled at a checkpoint"""
+
+def _summarize_result(address: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact per-address entry for batch job results"""
+    risk = result.get("risk_score", {})
+    return {
+        "address": address,
+        "success": result.get("success", True),
+        "trust_score": result.get("trust_score"),
+        "risk_score": risk.get("risk_score"),
+        "risk_level": risk.get("risk_level"),
+        "error": result.get("error")
+    }
+
+def _keep_leased(queue, job_id: str, stop: threading.Event):
+    """Renew a job's lease until stop is set, so long analyses are not reclaimed"""
+    interval = settings.job_visibility_timeout / 3
+    while not stop.wait(interval):
+        try:
+            queue.heartbeat(job_id)
+        except Exception as e:
+            logger.warning("Job heartbeat failed", job_id=job_id, error=str(e))
+
+def execute_job(queue, job: Dict[str, Any], analyzer: WalletAnalyzer) -> Any:
+    """Run a job, renewing its lease from a background thread until it returns"""
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_keep_leased, args=(queue, job["id"], stop), daemon=True)
+    heartbeat.start()
+    try:
+        return _run_job(queue, job, analyzer)
+    finally:
+        stop.set()
+        heartbeat.join()
+
+def _run_job(queue, job: Dict[str, Any], analyzer: WalletAnalyzer) -> Any:
+    """Run a job's analyses, reporting progress and honouring cancellation"""
+    payload = job["payload"]
+    network = payload.get("network", "ethereum")
+
+    if job["type"] == "wallet_analysis":
+        result = analyzer.analyze_wallet(payload["address"], network)
+        if not result.get("success", True):
+            raise ValueError(result.get("error", "Analysis failed"))
+        cache_wallet_analysis(payload["address"], network, result)
+        queue.update(job["id"], progress={"done": 1, "total": 1})
+        return result
+
+    addresses = payload["addresses"]
+    results = []
+    for done, address in enumerate(addresses):
+        if queue.is_cancel_requested(job["id"]):
+            raise JobCancelled()
+        try:
+            result = analyzer.analyze_wallet(address, network)
+            if result.get("success", True):
+                cache_wallet_analysis(address, network, result)
+            results.append(_summarize_result(address, result))
+        except Exception as e:
+            # One bad address should not fail the whole batch
+            results.append({"address": address, "success": False, "error": str(e)})
+        queue.update(job["id"], progress={"done": done + 1, "total": len(addresses)})
+    return results
+
+def process_next_job(queue, analyzer: WalletAnalyzer, timeout: int = 5) -> bool:
+    """Reserve and run one job; returns False if the queue stayed empty"""
+    job = queue.reserve(timeout)
+    if job is None:
+        return False
+
+    job_id = job["id"]
+    if job["status"] == "cancelled" or job["cancel_requested"]:
+        queue.finish(job_id, "cancelled")
+        return True
+
+    # A job reclaimed from a dead worker already counted that attempt
+    if job["attempts"] > job["max_retries"]:
+        logger.error("Job out of retries", job_id=job_id, attempts=job["attempts"])
+        queue.finish(job_id, "failed", error=job.get("error") or "Out of retries")
+        return True
+
+    attempts = job["attempts"] + 1
+    queue.update(job_id, status="running", attempts=attempts, started_at=time.time())
+    logger.info("Running job", job_id=job_id, job_type=job["type"], attempt=attempts)
+
+    try:
+        result = execute_job(queue, job, analyzer)
+        queue.finish(job_id, "completed", result=result)
+        logger.info("Job completed", job_id=job_id)
+    except JobCancelled:
+        queue.finish(job_id, "cancelled")
+        logger.info("Job cancelled", job_id=job_id)
+    except Exception as e:
+        if attempts <= job["max_retries"]:
+            logger.warning("Job failed, retrying", job_id=job_id, attempt=attempts, error=str(e))
+            queue.update(job_id, error=str(e))
+            queue.requeue(job_id)
+        else:
+            logger.error("Job failed", job_id=job_id, attempts=attempts, error=str(e))
+            queue.finish(job_id, "failed", error=str(e))
+    return True
+
+def run_worker(queue=None, stop_event=None, poll_timeout: int = 5):
+    """Process jobs until stop_event is set"""
+    queue = queue or get_job_queue()
+    stop_event = stop_event or threading.Event()
+    analyzer = WalletAnalyzer()
+    next_reclaim = 0.0
+
+    while not stop_event.is_set():
+        try:
+            if time.monotonic() >= next_reclaim:
+                queue.reclaim_expired()
+                next_reclaim = time.monotonic() + settings.job_reclaim_interval
+            process_next_job(queue, analyzer, poll_timeout)
+        except Exception as e:
+            logger.error("Job worker error", error=str(e))
+            time.sleep(1)
+
+def start_inline_worker(queue=None) -> threading.Thread:
+    """Run a worker thread inside this process (used with the in-memory queue)"""
+    worker_thread = threading.Thread(target=run_worker, args=(queue,), daemon=True)
+    worker_thread.start()
+    logger.info("Inline job worker started")
+    return worker_thread
+
+def _worker_process(index: int):
+    """Entry point for one worker process"""
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    logger.info("Job worker process started", worker=index)
+    try:
+        run_worker(stop_event=stop_event)
+    finally:
+        mark_worker_dead()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.job_worker_concurrency,
+        help="Number of worker processes"
+    )
+    parser.add_argument("--metrics-port", type=int, default=None, help="Port for /metrics (default: service_metrics_port; 0 disables)")
+    args = parser.parse_args()
+
+    if settings.job_queue_backend == "memory":
+        raise SystemExit("Separate worker processes need job_queue_backend=redis")
+
+    if not MULTIPROCESS:
+        logger.warning("PROMETHEUS_MULTIPROC_DIR is not set; /metrics will not include the worker processes")
+    start_metrics_server(args.metrics_port)
+
+    processes = [
+        multiprocessing.Process(target=_worker_process, args=(i,), name=f"job-worker-{i}")
+        for i in range(args.concurrency)
+    ]
+    for process in processes:
+        process.start()
+
+    def _shutdown(signum, frame):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()
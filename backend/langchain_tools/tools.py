@@ -1,13 +1,16 @@
 from langchain import Tool
 from ml.models import get_wallet_score, detect_fraud, analyze_user_patterns
+from ml.clustering import get_cluster_assigner
 
 def wallet_score(wallet_address):
     score = get_wallet_score(wallet_address)
     return {"wallet_address": wallet_address, "score": score}
 
 def cluster_explain(cluster_id):
-    # TODO: Implement real cluster explanation logic
-    raise NotImplementedError("Cluster explanation not implemented yet.")
+    assigner = get_cluster_assigner()
+    if assigner is None:
+        raise RuntimeError("Wallet clusters not trained.")
+    return assigner.describe(int(cluster_id))
 
 def txn_summary(wallet_address):
     # TODO: Implement real transaction summary logic
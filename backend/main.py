@@ -12,8 +12,12 @@ from config import settings
 from api.routes import router as api_router
 from utils.logger import get_logger, log_request, log_error
 from utils.rate_limiter import rate_limit_middleware
-from utils.monitoring import metrics_middleware, get_metrics, get_health_status, start_system_monitoring
-from utils.cache import cache
+from utils.monitoring import (
+    metrics_middleware, get_metrics, get_health_status, health_sampler, mark_worker_dead, start_system_monitoring
+)
+from utils.cache import cache, keyspace_reporter
+from jobs.worker import start_inline_worker
+from ml.models import model_registry
 
 logger = get_logger(__name__)
 
@@ -33,10 +37,21 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error("Cache connection failed", error=str(e))
     
+    # Sampled keys and memory per cache namespace
+    keyspace_reporter.start()
+    
+    # Pick up new model versions without a restart
+    model_registry.start_watcher()
+    
+    # The in-memory job queue has no separate workers, so run one here
+    if settings.job_queue_backend == "memory":
+        start_inline_worker()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down Wallet Scoring System")
+    mark_worker_dead()
 
 # Create FastAPI app
 app = FastAPI(
@@ -101,6 +116,9 @@ async def request_tracking_middleware(request: Request, call_next):
 @app.middleware("http")
 async def rate_limit_middleware_wrapper(request: Request, call_next):
     """Rate limiting middleware wrapper"""
+    # Orchestrator probes stay off Redis entirely
+    if request.url.path in ("/health/live", "/health/ready"):
+        return await call_next(request)
     return await rate_limit_middleware(request, call_next)
 
 # Add metrics middleware
@@ -174,10 +192,21 @@ async def health_check():
     """Comprehensive health check endpoint"""
     return get_health_status()
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process is serving requests"""
+    return {"status": "alive", "timestamp": time.time()}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: fresh health sample and required dependencies healthy"""
+    ready, body = health_sampler.readiness()
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
 # Metrics endpoint for Prometheus
 @app.get("/metrics")
-async def metrics():
-    """Prometheus metrics endpoint"""
+def metrics():
+    """Prometheus metrics endpoint (sync: aggregating worker files runs off the event loop)"""
     return get_metrics()
 
 # Root endpoint
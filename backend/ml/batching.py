@@ -0,0 +1,92 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from config import settings
+from utils.monitoring import MODEL_BATCH_SIZE, MODEL_BATCH_QUEUE_WAIT
+
+class MicroBatchPredictor:
+    """
+    Coalesce concurrent single-row predictions into batched model calls.
+
+    Requests are collected until max_batch_size rows are waiting or the oldest
+    has waited max_wait_ms, then predicted with one call in the default executor
+    so the event loop is never blocked. Each caller awaits its own row's result.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size or settings.ml_batch_max_size
+        self.max_wait = (settings.ml_batch_max_wait_ms if max_wait_ms is None else max_wait_ms) / 1000
+        self._pending: deque = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    async def predict(self, row: Any) -> Any:
+        """Predict a single feature row as part of the next batch"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._pending.append((np.asarray(row, dtype=np.float64), future, time.perf_counter()))
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # Wait for more rows until the batch is full or the oldest row's wait runs out
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch_size))]
+            await self._run_batch(batch)
+
+    async def _run_batch(self, batch):
+        started = time.perf_counter()
+        for _, _, enqueued in batch:
+            MODEL_BATCH_QUEUE_WAIT.observe(started - enqueued)
+
+        batch = [item for item in batch if not item[1].cancelled()]
+        if not batch:
+            return
+        MODEL_BATCH_SIZE.observe(len(batch))
+
+        try:
+            features = np.vstack([row for row, _, _ in batch])
+            predictions = await self._loop.run_in_executor(None, self.predict_fn, features)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(prediction)
@@ -0,0 +1,267 @@
+"""Streaming wallet clustering.
+
+Trains MiniBatchKMeans with partial_fit over feature chunks streamed from
+disk, scores it with a sampled silhouette, and persists the centroids so
+every analysed wallet can be assigned a cluster with one small matrix product.
+
+Usage:
+    python -m ml.clustering features.parquet --clusters 8
+    python -m ml.clustering --feature-store ethereum --clusters 8
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.cluster import MiniBatchKMeans, kmeans_plusplus
+from sklearn.metrics import silhouette_score
+
+from config import settings
+from ml.features import FEATURE_NAMES, FEATURE_SCHEMA_VERSION
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+def iter_feature_chunks(paths: List[str], chunk_size: int = 50000, columns: List[str] = FEATURE_NAMES) -> Iterator[np.ndarray]:
+    """Stream feature rows from Parquet or CSV files without loading them whole"""
+    for path in paths:
+        if path.endswith(".parquet"):
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+                yield batch.to_pandas()[columns].to_numpy(dtype=np.float64)
+        else:
+            for frame in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+                yield frame[columns].to_numpy(dtype=np.float64)
+
+class RunningStats:
+    """Streaming per-feature mean and variance (Chan et al. parallel update)"""
+
+    def __init__(self, n_features: int):
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+
+    def update(self, chunk: np.ndarray):
+        n = len(chunk)
+        if n == 0:
+            return
+        chunk_mean = chunk.mean(axis=0)
+        chunk_m2 = ((chunk - chunk_mean) ** 2).sum(axis=0)
+        delta = chunk_mean - self.mean
+        total = self.count + n
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + chunk_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    @property
+    def scale(self) -> np.ndarray:
+        std = np.sqrt(self.m2 / max(self.count, 1))
+        std[std == 0] = 1.0
+        return std
+
+class ReservoirSample:
+    """Uniform fixed-size row sample over a stream (bottom-k by random priority)"""
+
+    def __init__(self, size: int, random_state: int = 42):
+        self.size = size
+        self.rng = np.random.default_rng(random_state)
+        self.rows: Optional[np.ndarray] = None
+        self.priorities = np.empty(0)
+
+    def update(self, chunk: np.ndarray):
+        rows = chunk if self.rows is None else np.vstack([self.rows, chunk])
+        priorities = np.concatenate([self.priorities, self.rng.random(len(chunk))])
+        if len(rows) > self.size:
+            keep = np.argpartition(priorities, self.size - 1)[:self.size]
+            rows, priorities = rows[keep], priorities[keep]
+        self.rows, self.priorities = rows, priorities
+
+def train_streaming_clusters(
+    chunk_source: Callable[[], Iterator[np.ndarray]],
+    n_clusters: int = 8,
+    sample_size: Optional[int] = None,
+    output_path: Optional[str] = None,
+    random_state: int = 42
+) -> Dict:
+    """
+    Train MiniBatchKMeans over a re-iterable stream of feature chunks.
+
+    chunk_source is called once per pass: the first pass collects scaling
+    statistics and a reservoir sample, which seeds the centroids (k-means++)
+    and later scores them (silhouette) instead of the full data. The second
+    pass standardizes each chunk and calls partial_fit.
+    """
+    sample_size = sample_size or settings.cluster_silhouette_sample
+    output_path = output_path or settings.cluster_path
+    start_time = time.time()
+
+    stats = RunningStats(len(FEATURE_NAMES))
+    sample = ReservoirSample(sample_size, random_state)
+    for chunk in chunk_source():
+        stats.update(chunk)
+        sample.update(chunk)
+    if stats.count < n_clusters:
+        raise ValueError(f"Need at least {n_clusters} rows to train {n_clusters} clusters, got {stats.count}")
+    mean, scale = stats.mean, stats.scale
+    sample.rows = (sample.rows - mean) / scale
+
+    # Seed from the uniform sample so centroids don't depend on the on-disk row order
+    init, _ = kmeans_plusplus(sample.rows, n_clusters, random_state=random_state)
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=1, random_state=random_state)
+    pending = np.empty((0, len(FEATURE_NAMES)))
+    for chunk in chunk_source():
+        scaled = (chunk - mean) / scale
+        # partial_fit needs at least n_clusters rows in its first call
+        pending = np.vstack([pending, scaled]) if len(pending) else scaled
+        if len(pending) >= n_clusters:
+            kmeans.partial_fit(pending)
+            pending = np.empty((0, len(FEATURE_NAMES)))
+    if len(pending):
+        kmeans.partial_fit(pending)
+
+    sample_labels = kmeans.predict(sample.rows)
+    silhouette = None
+    if len(np.unique(sample_labels)) > 1:
+        silhouette = float(silhouette_score(sample.rows, sample_labels, random_state=random_state))
+    shares = np.bincount(sample_labels, minlength=n_clusters) / len(sample_labels)
+
+    meta = {
+        "feature_schema": FEATURE_SCHEMA_VERSION,
+        "n_clusters": n_clusters,
+        "n_rows": int(stats.count),
+        "silhouette_sample_size": int(len(sample.rows)),
+        "silhouette": silhouette,
+        "cluster_shares": shares.tolist(),
+        "trained_at": datetime.now().isoformat(),
+        "training_seconds": round(time.time() - start_time, 2)
+    }
+    save_clusters(output_path, kmeans.cluster_centers_, mean, scale, meta)
+    logger.info("Wallet clusters trained", path=output_path, **{k: meta[k] for k in ("n_clusters", "n_rows", "silhouette")})
+    return meta
+
+def save_clusters(path: str, centroids: np.ndarray, mean: np.ndarray, scale: np.ndarray, meta: Dict):
+    """Atomically persist centroids and scaling parameters"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, centroids=centroids, mean=mean, scale=scale, meta=np.array(json.dumps(meta)))
+    os.replace(tmp_path, path)
+
+class ClusterAssigner:
+    """Nearest-centroid assignment against persisted cluster centroids"""
+
+    def __init__(self, centroids: np.ndarray, mean: np.ndarray, scale: np.ndarray, meta: Dict):
+        self.centroids = centroids
+        self.mean = mean
+        self.scale = scale
+        self.meta = meta
+        self._centroid_norms = (centroids ** 2).sum(axis=1)
+
+    @classmethod
+    def load(cls, path: str) -> "ClusterAssigner":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("feature_schema") != FEATURE_SCHEMA_VERSION:
+                raise ValueError(f"Clusters use feature schema {meta.get('feature_schema')}, expected {FEATURE_SCHEMA_VERSION}")
+            return cls(data["centroids"], data["mean"], data["scale"], meta)
+
+    def assign(self, features: np.ndarray) -> np.ndarray:
+        """Cluster id for each feature row"""
+        X = (np.atleast_2d(features) - self.mean) / self.scale
+        distances = self._centroid_norms[np.newaxis, :] - 2 * X @ self.centroids.T
+        return np.argmin(distances, axis=1)
+
+    def describe(self, cluster_id: int, top_n: int = 3) -> Dict:
+        """Summarize a cluster by its centroid and most distinctive features"""
+        if not 0 <= cluster_id < len(self.centroids):
+            raise ValueError(f"Unknown cluster id: {cluster_id}")
+        centroid = self.centroids[cluster_id]
+        distinctive = np.argsort(-np.abs(centroid))[:top_n]
+        return {
+            "cluster_id": cluster_id,
+            "share_of_wallets": self.meta["cluster_shares"][cluster_id],
+            "centroid": dict(zip(FEATURE_NAMES, (centroid * self.scale + self.mean).tolist())),
+            "distinctive_features": [
+                {
+                    "feature": FEATURE_NAMES[i],
+                    "std_from_mean": float(centroid[i]),
+                    "direction": "above average" if centroid[i] > 0 else "below average"
+                }
+                for i in distinctive
+            ],
+            "silhouette": self.meta["silhouette"],
+            "trained_at": self.meta["trained_at"]
+        }
+
+_assigner: Optional[ClusterAssigner] = None
+_assigner_mtime: Optional[float] = None
+_assigner_checked_at = float("-inf")
+_assigner_lock = threading.Lock()
+
+def get_cluster_assigner() -> Optional[ClusterAssigner]:
+    """
+    The assigner for the persisted centroids, reloaded when the file changes.
+
+    Called for every analysis, so the file is only stat'ed once per
+    cluster_check_interval.
+    """
+    global _assigner, _assigner_mtime, _assigner_checked_at
+    if time.monotonic() - _assigner_checked_at < settings.cluster_check_interval:
+        return _assigner
+    with _assigner_lock:
+        if time.monotonic() - _assigner_checked_at < settings.cluster_check_interval:
+            return _assigner
+        _assigner_checked_at = time.monotonic()
+        try:
+            mtime = os.path.getmtime(settings.cluster_path)
+        except OSError:
+            _assigner, _assigner_mtime = None, None
+            return None
+        if mtime != _assigner_mtime:
+            try:
+                _assigner = ClusterAssigner.load(settings.cluster_path)
+            except Exception as e:
+                logger.error("Failed to load wallet clusters", path=settings.cluster_path, error=str(e))
+                _assigner = None
+            _assigner_mtime = mtime
+    return _assigner
+
+def assign_cluster(features: np.ndarray) -> Optional[int]:
+    """Cluster id for a single wallet's feature row, or None if no clusters are trained"""
+    assigner = get_cluster_assigner()
+    if assigner is None:
+        return None
+    return int(assigner.assign(features)[0])
+
+def main():
+    parser = argparse.ArgumentParser(description="Train wallet clusters from feature files")
+    parser.add_argument("paths", nargs="*", help="Parquet or CSV files with feature columns")
+    parser.add_argument("--feature-store", metavar="NETWORK", default=None, help="Train on the stored features of a network instead of files")
+    parser.add_argument("--clusters", type=int, default=8, help="Number of clusters")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per streamed chunk")
+    parser.add_argument("--sample-size", type=int, default=None, help="Rows sampled for the silhouette score")
+    parser.add_argument("--output", default=None, help="Output path (default: settings.cluster_path)")
+    args = parser.parse_args()
+    if args.feature_store:
+        from ml.feature_store import feature_store
+        table = feature_store.table(args.feature_store)
+        chunk_source = lambda: table.iter_chunks(args.chunk_size)
+    elif args.paths:
+        chunk_source = lambda: iter_feature_chunks(args.paths, args.chunk_size)
+    else:
+        parser.error("Pass feature files or --feature-store")
+
+    meta = train_streaming_clusters(
+        chunk_source,
+        n_clusters=args.clusters,
+        sample_size=args.sample_size,
+        output_path=args.output
+    )
+    print(json.dumps(meta, indent=2))
+
+if __name__ == "__main__":
+    main()
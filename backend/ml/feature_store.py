@@ -0,0 +1,225 @@
+"""Memory-mapped wallet feature store.
+
+Features are stored per (network, feature schema version) in
+<root>/<network>/<schema>/ as:
+
+    features.f64    float64 matrix, one FEATURE_NAMES row per wallet
+    updated_at.f64  unix time each row was last written
+    addresses.bin   row index; 20-byte record N is the raw address in row N
+
+The matrix files are preallocated and grown by doubling, and opened with
+np.memmap, so point lookups are one dict hit plus a row read and bulk reads
+for training or batch scoring are zero-copy slices. Writers from any process
+serialize on an flock; the address record is appended only after its row is
+written, so readers never see an index entry without data.
+"""
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from ml.features import FEATURE_NAMES, FEATURE_SCHEMA_VERSION
+from utils.address import ADDRESS_BYTES, address_bytes, address_from_bytes
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+FEATURES_FILE = "features.f64"
+UPDATED_FILE = "updated_at.f64"
+INDEX_FILE = "addresses.bin"
+LOCK_FILE = ".lock"
+INITIAL_CAPACITY = 1024
+
+class FeatureTable:
+    """The feature rows of one network under one schema version"""
+
+    def __init__(self, directory: str, n_features: int = len(FEATURE_NAMES)):
+        self.directory = directory
+        self.n_features = n_features
+        self.index: Dict[bytes, int] = {}
+        self.addresses: List[bytes] = []
+        self._index_offset = 0
+        self._capacity = 0
+        self._features: Optional[np.memmap] = None
+        self._updated_at: Optional[np.memmap] = None
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._refresh()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers across threads and processes"""
+        with self._lock, open(self._path(LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Pick up rows appended by other processes since the last call"""
+        try:
+            size = os.path.getsize(self._path(INDEX_FILE))
+        except OSError:
+            return
+        if size == self._index_offset:
+            return
+        with self._lock:
+            with open(self._path(INDEX_FILE), "rb") as f:
+                f.seek(self._index_offset)
+                data = f.read(size - self._index_offset)
+            # Ignore a trailing partial record; it is read once its writer finishes
+            complete = data[:len(data) - len(data) % ADDRESS_BYTES]
+            for start in range(0, len(complete), ADDRESS_BYTES):
+                key = complete[start:start + ADDRESS_BYTES]
+                self.index[key] = len(self.addresses)
+                self.addresses.append(key)
+            self._index_offset += len(complete)
+            if len(self.addresses) > self._capacity:
+                self._open()
+
+    def _open(self):
+        """Map the matrix files at their current on-disk capacity"""
+        capacity = os.path.getsize(self._path(UPDATED_FILE)) // 8
+        self._features = np.memmap(self._path(FEATURES_FILE), dtype=np.float64, mode="r+", shape=(capacity, self.n_features))
+        self._updated_at = np.memmap(self._path(UPDATED_FILE), dtype=np.float64, mode="r+", shape=(capacity,))
+        self._capacity = capacity
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity:
+            return
+        on_disk = os.path.getsize(self._path(UPDATED_FILE)) // 8 if os.path.exists(self._path(UPDATED_FILE)) else 0
+        capacity = max(INITIAL_CAPACITY, on_disk)
+        while capacity < rows:
+            capacity *= 2
+        if capacity > on_disk:
+            # Extending with truncate leaves sparse zero-filled pages, no copy of existing rows
+            for name, width in ((FEATURES_FILE, self.n_features), (UPDATED_FILE, 1)):
+                with open(self._path(name), "ab") as f:
+                    f.truncate(capacity * width * 8)
+        self._open()
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self.addresses)
+
+    def put(self, addresses: List[str], features: np.ndarray):
+        """Insert or overwrite rows for addresses"""
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        if features.shape != (len(addresses), self.n_features):
+            raise ValueError(f"Expected features of shape ({len(addresses)}, {self.n_features}), got {features.shape}")
+        keys = [address_bytes(address) for address in addresses]
+
+        with self._write_lock():
+            self._refresh()
+            new_keys = list(dict.fromkeys(key for key in keys if key not in self.index))
+            rows = {key: len(self.addresses) + i for i, key in enumerate(new_keys)}
+            rows.update((key, self.index[key]) for key in keys if key in self.index)
+            self._ensure_capacity(len(self.addresses) + len(new_keys))
+
+            row_ids = np.fromiter((rows[key] for key in keys), dtype=np.int64, count=len(keys))
+            self._features[row_ids] = features
+            self._updated_at[row_ids] = time.time()
+            self._features.flush()
+            self._updated_at.flush()
+
+            if new_keys:
+                with open(self._path(INDEX_FILE), "ab") as f:
+                    f.write(b"".join(new_keys))
+                self._refresh()
+
+    def _row(self, address: str) -> int:
+        """Row of a stored address, or -1 (also for invalid addresses)"""
+        try:
+            return self.index.get(address_bytes(address), -1)
+        except ValueError:
+            return -1
+
+    def address_at(self, row: int) -> str:
+        return address_from_bytes(self.addresses[row])
+
+    def get(self, address: str, max_age: Optional[float] = None) -> Optional[np.ndarray]:
+        """A copy of one wallet's features, or None if missing or older than max_age seconds"""
+        self._refresh()
+        row = self._row(address)
+        if row < 0:
+            return None
+        if max_age is not None and time.time() - self._updated_at[row] > max_age:
+            return None
+        return np.array(self._features[row])
+
+    def get_many(self, addresses: List[str], max_age: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Features for many wallets and a mask of which were found (missing rows are zeros)"""
+        self._refresh()
+        rows = np.fromiter((self._row(address) for address in addresses), dtype=np.int64, count=len(addresses))
+        found = rows >= 0
+        matrix = np.zeros((len(addresses), self.n_features), dtype=np.float64)
+        if found.any():
+            matrix[found] = self._features[rows[found]]
+            if max_age is not None:
+                found[found] &= time.time() - self._updated_at[rows[found]] <= max_age
+                matrix[~found] = 0
+        return matrix, found
+
+    def matrix(self) -> np.ndarray:
+        """Zero-copy read-only view of every stored row, in index order"""
+        n_rows = len(self)
+        if n_rows == 0:
+            return np.empty((0, self.n_features))
+        view = self._features[:n_rows].view(np.ndarray)
+        view.flags.writeable = False
+        return view
+
+    def iter_chunks(self, chunk_size: int = 50000) -> Iterator[np.ndarray]:
+        """Stream stored rows as zero-copy chunks, e.g. for ml.clustering"""
+        matrix = self.matrix()
+        for start in range(0, len(matrix), chunk_size):
+            yield matrix[start:start + chunk_size]
+
+class FeatureStore:
+    """Feature tables keyed by (network, schema version), opened on first use"""
+
+    def __init__(self, root: Optional[str] = None, schema_version: str = FEATURE_SCHEMA_VERSION):
+        self.root = root or settings.feature_store_path
+        self.schema_version = schema_version
+        self._tables: Dict[str, FeatureTable] = {}
+        self._lock = threading.Lock()
+
+    def table(self, network: str) -> FeatureTable:
+        table = self._tables.get(network)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(network)
+                if table is None:
+                    table = FeatureTable(os.path.join(self.root, network, self.schema_version))
+                    self._tables[network] = table
+        return table
+
+    def put(self, network: str, addresses: List[str], features: np.ndarray):
+        self.table(network).put(addresses, features)
+
+    def get(self, network: str, address: str, max_age: Optional[float] = None) -> Optional[np.ndarray]:
+        return self.table(network).get(address, max_age)
+
+    def get_many(self, network: str, addresses: List[str], max_age: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        return self.table(network).get_many(addresses, max_age)
+
+def store_features(network: str, addresses: List[str], features: np.ndarray):
+    """Write features to the store; failures are logged, never raised into the request"""
+    if not settings.feature_store_enabled:
+        return
+    try:
+        feature_store.put(network, addresses, features)
+    except Exception as e:
+        logger.error("Feature store write failed", network=network, count=len(addresses), error=str(e))
+
+# Global feature store instance
+feature_store = FeatureStore()
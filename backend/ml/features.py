@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+from blockchain.data_fetcher import DataFetcher
+from blockchain.transaction_sketch import TransactionSketch
+from config import settings
+from utils.cache import cache_transaction_data, get_cached_transaction_data
+
+# Bump the version whenever FEATURE_NAMES or their computation changes, so
+# models and stored features from different schemas are never mixed
+FEATURE_SCHEMA_VERSION = "v1"
+
+FEATURE_NAMES = [
+    "tx_count",
+    "total_value_eth",
+    "avg_value_eth",
+    "std_value_eth",
+    "max_value_eth",
+    "active_span_days",
+    "avg_daily_tx",
+    "unique_to",
+    "unique_from",
+    "outgoing_ratio",
+    "failed_ratio",
+    "contract_call_ratio",
+    "avg_gas_price_gwei",
+    "balance_eth",
+]
+
+TRANSACTION_COLUMNS = ["from", "to", "value", "timeStamp", "isError", "input", "gasPrice"]
+
+def extract_feature_matrix(
+    addresses: List[str],
+    transactions: Dict[str, List[Dict]],
+    balances: Optional[Dict[str, float]] = None
+) -> np.ndarray:
+    """Build the (n_wallets, n_features) matrix for many wallets in one pass.
+
+    transactions maps each address to its Etherscan-style transaction list and
+    balances maps addresses to native balances in ETH. Rows follow the order of
+    addresses; wallets without transactions get zeros.
+    """
+    balances = balances or {}
+    n_wallets = len(addresses)
+    matrix = np.zeros((n_wallets, len(FEATURE_NAMES)), dtype=np.float64)
+    matrix[:, FEATURE_NAMES.index("balance_eth")] = [float(balances.get(a, 0) or 0) for a in addresses]
+
+    tx_lists = [transactions.get(address) or [] for address in addresses]
+    counts = np.fromiter((len(txs) for txs in tx_lists), dtype=np.int64, count=n_wallets)
+    if counts.sum() == 0:
+        return matrix
+
+    # One frame for every wallet's transactions, tagged with the wallet's row
+    frame = pd.DataFrame([tx for txs in tx_lists for tx in txs], columns=TRANSACTION_COLUMNS)
+    wallet = np.repeat(np.arange(n_wallets), counts)
+    # Intern owners and counterparties to integer ids: grouping and comparing
+    # ints is cheaper than 42-character strings
+    n_tx = len(frame)
+    ids, _ = pd.factorize(np.concatenate([
+        frame["from"].fillna("").str.lower().to_numpy(dtype=object),
+        frame["to"].fillna("").str.lower().to_numpy(dtype=object),
+        np.array([address.lower() for address in addresses], dtype=object)
+    ]))
+    sender, receiver, owner = ids[:n_tx], ids[n_tx:2 * n_tx], ids[2 * n_tx:][wallet]
+
+    frame = pd.DataFrame({
+        "wallet": wallet,
+        "value": pd.to_numeric(frame["value"], errors="coerce").fillna(0).to_numpy() / 1e18,
+        "timestamp": pd.to_numeric(frame["timeStamp"], errors="coerce").fillna(0).to_numpy(),
+        "to": receiver,
+        "from": sender,
+        "outgoing": (sender == owner).astype(np.float64),
+        "failed": (frame["isError"] == "1").to_numpy(dtype=np.float64),
+        "contract_call": (~frame["input"].fillna("0x").isin(["", "0x"])).to_numpy(dtype=np.float64),
+        "gas_price": pd.to_numeric(frame["gasPrice"], errors="coerce").fillna(0).to_numpy() / 1e9,
+    })
+
+    grouped = frame.groupby("wallet", sort=True)
+    stats = grouped.agg(
+        tx_count=("value", "size"),
+        total_value_eth=("value", "sum"),
+        avg_value_eth=("value", "mean"),
+        std_value_eth=("value", "std"),
+        max_value_eth=("value", "max"),
+        first_seen=("timestamp", "min"),
+        last_seen=("timestamp", "max"),
+        unique_to=("to", "nunique"),
+        unique_from=("from", "nunique"),
+        outgoing_ratio=("outgoing", "mean"),
+        failed_ratio=("failed", "mean"),
+        contract_call_ratio=("contract_call", "mean"),
+        avg_gas_price_gwei=("gas_price", "mean"),
+    )
+    stats["active_span_days"] = (stats["last_seen"] - stats["first_seen"]) / 86400
+    # Same daily rate definition as DataFetcher.analyze_transaction_patterns
+    stats["avg_daily_tx"] = stats["tx_count"] / (stats["active_span_days"] + 1)
+    stats = stats.fillna(0)
+
+    rows = stats.index.to_numpy()
+    for column, name in enumerate(FEATURE_NAMES):
+        if name in stats.columns:
+            matrix[rows, column] = stats[name].to_numpy(dtype=np.float64)
+    return matrix
+
+def features_from_sketch(sketch: TransactionSketch, balance: float = 0.0) -> np.ndarray:
+    """Build the single-row feature matrix from a sketched history, without materializing it.
+
+    Matches extract_feature_matrix except unique_to/unique_from, which are
+    HyperLogLog estimates.
+    """
+    row = dict.fromkeys(FEATURE_NAMES, 0.0)
+    row["balance_eth"] = float(balance or 0)
+    if sketch.count:
+        span_days = (sketch.last_timestamp - sketch.first_timestamp) / 86400
+        row.update(
+            tx_count=sketch.count,
+            total_value_eth=sketch.total_value / 1e18,
+            avg_value_eth=sketch.mean / 1e18,
+            std_value_eth=sketch.std / 1e18,
+            max_value_eth=sketch.max_value / 1e18,
+            active_span_days=span_days,
+            avg_daily_tx=sketch.count / (span_days + 1),
+            unique_to=round(sketch.unique_to.count()),
+            unique_from=round(sketch.unique_from.count()),
+            outgoing_ratio=sketch.outgoing / sketch.count,
+            failed_ratio=sketch.failed / sketch.count,
+            contract_call_ratio=sketch.contract_calls / sketch.count,
+            avg_gas_price_gwei=sketch.gas_price_total / sketch.count / 1e9,
+        )
+    return np.array([[row[name] for name in FEATURE_NAMES]], dtype=np.float64)
+
+def fetch_wallet_features(
+    addresses: List[str],
+    network: str = "ethereum",
+    fetcher: Optional[DataFetcher] = None
+) -> np.ndarray:
+    """Build the feature matrix for addresses, reading fresh rows from the feature store
+    and fetching (cached) transactions only for the rest"""
+    from ml.feature_store import feature_store, store_features
+
+    if settings.feature_store_enabled:
+        matrix, found = feature_store.get_many(network, addresses, settings.feature_store_max_age)
+    else:
+        matrix, found = np.zeros((len(addresses), len(FEATURE_NAMES))), np.zeros(len(addresses), dtype=bool)
+    missing = [address for address, hit in zip(addresses, found) if not hit]
+    if not missing:
+        return matrix
+
+    fetcher = fetcher or DataFetcher()
+    transactions = {}
+    balances = {}
+    for address in missing:
+        tx_data = get_cached_transaction_data(address, network)
+        if not tx_data:
+            tx_data = fetcher.fetch_from_etherscan(address)
+            if tx_data.get("success"):
+                cache_transaction_data(address, network, tx_data)
+        transactions[address] = tx_data.get("transactions", [])
+
+        balance_data = fetcher.get_wallet_balance(address, network)
+        if balance_data.get("success"):
+            balances[address] = float(balance_data["native_balance"])
+
+    computed = extract_feature_matrix(missing, transactions, balances)
+    store_features(network, missing, computed)
+    matrix[~found] = computed
+    return matrix
+
+def features_from_analysis(result: Dict) -> np.ndarray:
+    """Build the single-row feature matrix from a WalletAnalyzer result, without refetching"""
+    address = result.get("wallet_address", "")
+    data_sources = result.get("data_sources", {})
+    if data_sources.get("etherscan", {}).get("sketched"):
+        # Sketched results carry no transactions; the analysis stored the row it computed
+        from ml.feature_store import feature_store
+
+        row = feature_store.get(result.get("network", "ethereum"), address, settings.feature_store_max_age)
+        if row is None:
+            raise ValueError("Sketched analysis has no stored features")
+        return row[np.newaxis, :]
+    transactions = data_sources.get("etherscan", {}).get("transactions", [])
+    balance_data = data_sources.get("balance", {})
+    balances = {address: float(balance_data["native_balance"])} if balance_data.get("success") else {}
+    return extract_feature_matrix([address], {address: transactions}, balances)
@@ -1,27 +1,41 @@
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, silhouette_score
+import numpy as np
 import pandas as pd
-import joblib
 import os
+from typing import List
+from config import settings
+from ml.features import FEATURE_NAMES, FEATURE_SCHEMA_VERSION, fetch_wallet_features
+from ml.registry import LoadedModel, ModelRegistry
+from utils.cache import cache_ml_score, get_cached_ml_score
+from ml.batching import MicroBatchPredictor
+from ml.shap_explain import explain_top_features
+from starlette.concurrency import run_in_threadpool
 
+# Pre-registry single-file artifact, still served when no versioned model exists
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'wallet_score_model.joblib')
 
-# Load the model once at module import
-try:
-    model = joblib.load(MODEL_PATH)
-except Exception as e:
-    model = None
-    print(f"Error loading model: {e}")
+# Versioned models under settings.model_path, loaded lazily and hot-swapped
+model_registry = ModelRegistry(legacy_path=MODEL_PATH)
+
+def predict(features: np.ndarray, loaded: LoadedModel = None) -> np.ndarray:
+    """Run the active model on a feature matrix, using the compiled forest for small batches"""
+    loaded = loaded or _require_model()
+    if loaded.compiled is not None:
+        # Batches above ml_compiled_max_batch fall back to sklearn inside the forest
+        return loaded.compiled.predict(features)
+    return loaded.model.predict(features)
 
 def train_fraud_detection_model(data):
+    # In-memory training; ml.train streams larger datasets from Parquet
     X = data.drop('is_fraud', axis=1)
     y = data['is_fraud']
     
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
+    model = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=settings.ml_train_n_jobs)
     model.fit(X_train, y_train)
     
     y_pred = model.predict(X_test)
@@ -30,10 +44,12 @@ def train_fraud_detection_model(data):
     return model
 
 def cluster_wallets(data, n_clusters):
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3)
     data['cluster'] = kmeans.fit_predict(data)
     
-    silhouette_avg = silhouette_score(data.drop('cluster', axis=1), data['cluster'])
+    # Silhouette is O(n^2); score a sample (see ml.clustering for out-of-core training)
+    sample_size = min(len(data), settings.cluster_silhouette_sample)
+    silhouette_avg = silhouette_score(data.drop('cluster', axis=1), data['cluster'], sample_size=sample_size, random_state=42)
     print(f'Silhouette Score: {silhouette_avg}')
     
     return kmeans
@@ -47,24 +63,58 @@ def evaluate_credit_scoring_model(model, data):
     
     return y_pred
 
-def extract_features(wallet_address: str) -> pd.Series:
-    # TODO: Implement real feature extraction from blockchain data
-    # For now, raise NotImplementedError to force implementation
-    raise NotImplementedError("Feature extraction not implemented yet.")
+def extract_features(wallet_address: str, network: str = "ethereum") -> pd.Series:
+    features = fetch_wallet_features([wallet_address], network)
+    return pd.Series(features[0], index=FEATURE_NAMES, name=wallet_address)
 
-def get_wallet_score(wallet_address: str):
-    if model is None:
+def _require_model() -> LoadedModel:
+    loaded = model_registry.active()
+    if loaded is None:
         raise RuntimeError("ML model not loaded.")
-    features = extract_features(wallet_address)
-    score = model.predict([features])[0]
+    n_features = getattr(loaded.model, "n_features_in_", len(FEATURE_NAMES))
+    if n_features != len(FEATURE_NAMES):
+        raise RuntimeError(
+            f"ML model expects {n_features} features, feature schema {FEATURE_SCHEMA_VERSION} has {len(FEATURE_NAMES)}."
+        )
+    return loaded
+
+def score_wallets(addresses: List[str], network: str = "ethereum") -> np.ndarray:
+    """Score many wallets with a single model.predict call"""
+    loaded = _require_model()
+    if not addresses:
+        return np.array([])
+    features = fetch_wallet_features(addresses, network)
+    return predict(features, loaded)
+
+def detect_fraud_batch(addresses: List[str], network: str = "ethereum") -> List[bool]:
+    """Flag many wallets with a single model.predict call"""
+    return [bool(prediction) for prediction in score_wallets(addresses, network)]
+
+# Shared by concurrent API requests so their single rows are scored together
+batch_predictor = MicroBatchPredictor(predict)
+
+async def score_wallet_async(wallet_address: str, network: str = "ethereum"):
+    """Score one wallet from async code, batching the prediction with concurrent callers"""
+    loaded = _require_model()
+    cached_score = get_cached_ml_score(loaded.version, network, wallet_address)
+    if cached_score is not None:
+        return cached_score
+    
+    features = await run_in_threadpool(fetch_wallet_features, [wallet_address], network)
+    score = (await batch_predictor.predict(features[0])).item()
+    cache_ml_score(loaded.version, network, wallet_address, score)
     return score
 
+def explain_features(features: np.ndarray, k: int = None) -> List[List[dict]]:
+    """Top-k feature contributions for each row of a feature matrix"""
+    loaded = _require_model()
+    return explain_top_features(loaded.model, features, FEATURE_NAMES, loaded.version, k)
+
+def get_wallet_score(wallet_address: str):
+    return score_wallets([wallet_address])[0].item()
+
 def detect_fraud(wallet_address: str):
-    if model is None:
-        raise RuntimeError("ML model not loaded.")
-    features = extract_features(wallet_address)
-    prediction = model.predict([features])[0]
-    return bool(prediction)
+    return detect_fraud_batch([wallet_address])[0]
 
 def analyze_user_patterns(wallet_address: str):
     # TODO: Implement real user pattern analysis
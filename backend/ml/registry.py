@@ -0,0 +1,174 @@
+import json
+import os
+import shutil
+import threading
+import time
+import joblib
+from typing import List, Optional
+from sklearn.ensemble import RandomForestClassifier
+from config import settings
+from ml.features import FEATURE_SCHEMA_VERSION
+from ml.tree_inference import CompiledForest
+from utils.logger import get_logger
+from utils.monitoring import MODEL_ACTIVE_VERSION, MODEL_LOAD_DURATION, MODEL_LOADED_AT
+
+logger = get_logger(__name__)
+
+MODEL_FILE = "model.joblib"
+META_FILE = "meta.json"
+COMPILED_DIR = "compiled"
+ACTIVE_FILE = "ACTIVE"
+LEGACY_VERSION = "legacy"
+
+class LoadedModel:
+    """An immutable snapshot of one loaded model version"""
+
+    def __init__(self, version: str, model, compiled: Optional[CompiledForest], load_seconds: float):
+        self.version = version
+        self.model = model
+        self.compiled = compiled
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+class ModelRegistry:
+    """
+    Discovers versioned model artifacts and serves the active one.
+
+    Versions live in <root>/<version>/model.joblib. The version named in
+    <root>/ACTIVE is served if present, otherwise the highest version name.
+    Models load lazily on first use with mmap_mode, and the compiled forest's
+    arrays are memory-mapped, so uvicorn workers share those pages through the
+    OS page cache. A newer version is loaded in the background and swapped in
+    with a single reference assignment, so requests never see a half-loaded model.
+    """
+
+    def __init__(self, root: Optional[str] = None, legacy_path: Optional[str] = None):
+        self.root = root or settings.model_path
+        self.legacy_path = legacy_path
+        self._active: Optional[LoadedModel] = None
+        self._load_lock = threading.Lock()
+        self._last_checked = 0.0
+        self._watcher: Optional[threading.Thread] = None
+
+    def available_versions(self) -> List[str]:
+        """Versions with a model artifact under the registry root"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isfile(os.path.join(self.root, name, MODEL_FILE))
+        )
+
+    def target_version(self) -> Optional[str]:
+        """The version that should be active right now"""
+        versions = self.available_versions()
+        active_file = os.path.join(self.root, ACTIVE_FILE)
+        if os.path.isfile(active_file):
+            with open(active_file) as f:
+                pinned = f.read().strip()
+            if pinned in versions:
+                return pinned
+            logger.warning("Pinned model version not found", version=pinned)
+        if versions:
+            return versions[-1]
+        if self.legacy_path and os.path.isfile(self.legacy_path):
+            return LEGACY_VERSION
+        return None
+
+    def active(self) -> Optional[LoadedModel]:
+        """The active model, loading it on first use"""
+        if self._active is None and time.time() - self._last_checked >= settings.model_reload_interval:
+            self.refresh()
+        return self._active
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._active.version if self._active else None
+
+    def refresh(self) -> bool:
+        """Load and swap in the target version if it changed; returns True on swap"""
+        self._last_checked = time.time()
+        target = self.target_version()
+        if target is None or target == self.version:
+            return False
+
+        with self._load_lock:
+            if target == self.version:
+                return False
+            try:
+                loaded = self._load(target)
+            except Exception as e:
+                logger.error("Model load failed", version=target, error=str(e))
+                return False
+
+            previous = self._active
+            self._active = loaded
+
+        if previous is not None:
+            # Zero rather than remove(): removing a series is unsupported under
+            # multiprocess collection, where the old version would stay at 1
+            MODEL_ACTIVE_VERSION.labels(version=previous.version).set(0)
+        MODEL_ACTIVE_VERSION.labels(version=loaded.version).set(1)
+        MODEL_LOAD_DURATION.set(loaded.load_seconds)
+        MODEL_LOADED_AT.set(loaded.loaded_at)
+        logger.info(
+            "Model activated",
+            version=loaded.version,
+            previous_version=previous.version if previous else None,
+            load_seconds=round(loaded.load_seconds, 3)
+        )
+        return True
+
+    def _load(self, version: str) -> LoadedModel:
+        start = time.perf_counter()
+        if version == LEGACY_VERSION:
+            model = joblib.load(self.legacy_path, mmap_mode="r")
+            return LoadedModel(version, model, self._compile(model, None), time.perf_counter() - start)
+
+        version_dir = os.path.join(self.root, version)
+        meta_path = os.path.join(version_dir, META_FILE)
+        if os.path.isfile(meta_path):
+            with open(meta_path) as f:
+                schema = json.load(f).get("feature_schema")
+            if schema and schema != FEATURE_SCHEMA_VERSION:
+                raise ValueError(f"Model uses feature schema {schema}, this build produces {FEATURE_SCHEMA_VERSION}")
+
+        # mmap_mode only takes effect for artifacts dumped uncompressed
+        model = joblib.load(os.path.join(version_dir, MODEL_FILE), mmap_mode="r")
+        return LoadedModel(version, model, self._compile(model, version_dir), time.perf_counter() - start)
+
+    def _compile(self, model, version_dir: Optional[str]) -> Optional[CompiledForest]:
+        """Load the memory-mapped compiled forest, exporting it on first use"""
+        if not settings.ml_compiled_inference or not isinstance(model, RandomForestClassifier):
+            return None
+        if version_dir is None:
+            return CompiledForest.from_sklearn(model).with_fallback(model, settings.ml_compiled_max_batch)
+
+        compiled_dir = os.path.join(version_dir, COMPILED_DIR)
+        if not os.path.isdir(compiled_dir):
+            # Export to a private directory and rename, so concurrent workers never read a partial export
+            tmp_dir = f"{compiled_dir}.{os.getpid()}.tmp"
+            CompiledForest.from_sklearn(model).save(tmp_dir)
+            try:
+                os.rename(tmp_dir, compiled_dir)
+            except OSError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        return CompiledForest.load(compiled_dir, mmap_mode="r").with_fallback(model, settings.ml_compiled_max_batch)
+
+    def start_watcher(self, interval: Optional[int] = None) -> threading.Thread:
+        """Poll for new versions in the background and hot-swap them in"""
+        interval = interval or settings.model_reload_interval
+
+        def watch_loop():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error("Model watcher error", error=str(e))
+                time.sleep(interval)
+
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=watch_loop, daemon=True)
+            self._watcher.start()
+            logger.info("Model watcher started", root=self.root, interval=interval)
+        return self._watcher
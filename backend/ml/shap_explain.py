@@ -1,7 +1,91 @@
 from shap import TreeExplainer
+from collections import OrderedDict
+import hashlib
+import threading
 import numpy as np
+from config import settings
 
-def explain_model_predictions(model, X, feature_names):
+# Long-lived explainers, keyed by model version
+_explainers = {}
+_explainers_lock = threading.Lock()
+
+# LRU of per-row SHAP values, keyed by (model version, approximate, feature-vector hash)
+_explanation_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def get_explainer(model, model_version):
+    """
+    Get the TreeExplainer bound to a model version, building it once.
+
+    Parameters:
+    - model: The trained tree model.
+    - model_version: Identifier of the loaded model artifact.
+
+    Returns:
+    - explainer: A TreeExplainer reused for every call with this model version.
+    """
+    with _explainers_lock:
+        explainer = _explainers.get(model_version)
+        if explainer is None:
+            explainer = TreeExplainer(model)
+            # Only explainers for the active model are worth keeping
+            _explainers.clear()
+            _explainers[model_version] = explainer
+        return explainer
+
+def _positive_class(shap_values):
+    """Reduce classifier SHAP output to the last (positive) class"""
+    if isinstance(shap_values, list):
+        return np.asarray(shap_values[-1])
+    shap_values = np.asarray(shap_values)
+    if shap_values.ndim == 3:
+        return shap_values[..., -1]
+    return shap_values
+
+def _row_key(model_version, approximate, row):
+    digest = hashlib.blake2b(np.ascontiguousarray(row, dtype=np.float64).tobytes(), digest_size=16).hexdigest()
+    return (model_version, approximate, digest)
+
+def explain_batch(model, X, model_version, approximate=False):
+    """
+    Explain many rows with one explainer call, reusing cached rows.
+
+    Parameters:
+    - model: The trained tree model.
+    - X: 2D array of feature vectors.
+    - model_version: Identifier of the loaded model artifact, part of the cache key.
+    - approximate: Use the fast Saabas approximation instead of exact Tree SHAP.
+
+    Returns:
+    - shap_values: Array of shape (n_rows, n_features) for the positive class.
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    keys = [_row_key(model_version, approximate, row) for row in X]
+    shap_values = np.zeros(X.shape, dtype=np.float64)
+
+    missing = []
+    with _cache_lock:
+        for i, key in enumerate(keys):
+            cached = _explanation_cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                _explanation_cache.move_to_end(key)
+                shap_values[i] = cached
+
+    if missing:
+        explainer = get_explainer(model, model_version)
+        computed = _positive_class(explainer.shap_values(X[missing], approximate=approximate, check_additivity=False))
+        shap_values[missing] = computed
+        with _cache_lock:
+            for i, values in zip(missing, computed):
+                _explanation_cache[keys[i]] = values
+            while len(_explanation_cache) > settings.shap_cache_size:
+                _explanation_cache.popitem(last=False)
+
+    return shap_values
+
+def explain_model_predictions(model, X, feature_names, model_version=None):
     """
     Explain model predictions using SHAP values.
 
@@ -9,13 +93,19 @@ def explain_model_predictions(model, X, feature_names):
     - model: The trained machine learning model.
     - X: The input features for which to explain predictions.
     - feature_names: The names of the features.
+    - model_version: Identifier of the loaded model. Opt-in: enables explainer and
+      result caching, and then returns the positive class only.
 
     Returns:
-    - shap_values: The SHAP values for the input features.
+    - shap_values: The SHAP values for the input features, exactly as
+      TreeExplainer.shap_values returns them (every class for classifiers);
+      with model_version, an (n_rows, n_features) array for the positive class.
     - feature_importance: The mean absolute SHAP values for feature importance.
     """
-    explainer = TreeExplainer(model)
-    shap_values = explainer.shap_values(X)
+    if model_version is None:
+        shap_values = TreeExplainer(model).shap_values(X)
+    else:
+        shap_values = explain_batch(model, X, model_version)
 
     # Calculate feature importance as the mean absolute SHAP values
     feature_importance = np.abs(shap_values).mean(axis=0)
@@ -33,8 +123,43 @@ def summarize_explanation(shap_values, feature_names):
     Returns:
     - summary: A dictionary summarizing the SHAP values and feature contributions.
     """
-    summary = {}
-    for i, feature in enumerate(feature_names):
-        summary[feature] = shap_values[i]
-    
-    return summary
\ No newline at end of file
+    return dict(zip(feature_names, np.asarray(shap_values, dtype=np.float64).tolist()))
+
+def top_k_features(shap_values, feature_names, k=5):
+    """
+    Pick the features contributing most to a single prediction.
+
+    Parameters:
+    - shap_values: The SHAP values for a single prediction.
+    - feature_names: The names of the features.
+    - k: Number of features to return.
+
+    Returns:
+    - top_features: List of {"feature", "contribution"} ordered by absolute contribution.
+    """
+    shap_values = np.asarray(shap_values, dtype=np.float64)
+    k = min(k, len(shap_values))
+    if k <= 0:
+        return []
+    magnitude = np.abs(shap_values)
+    top = np.argpartition(-magnitude, k - 1)[:k]
+    top = top[np.argsort(-magnitude[top])]
+    return [{"feature": feature_names[i], "contribution": float(shap_values[i])} for i in top]
+
+def explain_top_features(model, X, feature_names, model_version, k=None):
+    """
+    Fast top-k explanation for many rows, suitable for inline API responses.
+
+    Parameters:
+    - model: The trained tree model.
+    - X: 2D array of feature vectors.
+    - feature_names: The names of the features.
+    - model_version: Identifier of the loaded model artifact.
+    - k: Number of features per row (defaults to settings.shap_top_k).
+
+    Returns:
+    - explanations: One top-k feature list per row.
+    """
+    k = k or settings.shap_top_k
+    shap_values = explain_batch(model, X, model_version, approximate=settings.shap_fast_mode)
+    return [top_k_features(row, feature_names, k) for row in shap_values]
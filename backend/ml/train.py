@@ -0,0 +1,234 @@
+"""Out-of-core training for the fraud model.
+
+Streams labeled feature rows from Parquet or CSV in chunks and grows a
+RandomForestClassifier with warm_start, fitting a few new trees on each chunk
+across all cores. A uniform holdout sample is kept aside for evaluation. The
+model is written as a new version under settings.model_path, where the API's
+model registry picks it up, along with a JSON training report.
+
+Usage:
+    python -m ml.train labeled_features.parquet --label is_fraud
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import classification_report, roc_auc_score
+
+from config import settings
+from ml.clustering import ReservoirSample
+from ml.features import FEATURE_NAMES, FEATURE_SCHEMA_VERSION
+from ml.registry import META_FILE, MODEL_FILE
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+REPORT_FILE = "report.json"
+
+def iter_labeled_chunks(
+    paths: List[str],
+    label: str = "is_fraud",
+    chunk_size: Optional[int] = None
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Stream (features, labels) chunks from Parquet or CSV files"""
+    chunk_size = chunk_size or settings.ml_train_chunk_size
+    columns = FEATURE_NAMES + [label]
+    for path in paths:
+        if path.endswith(".parquet"):
+            frames = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns))
+        else:
+            frames = pd.read_csv(path, usecols=columns, chunksize=chunk_size)
+        for frame in frames:
+            yield frame[FEATURE_NAMES].to_numpy(dtype=np.float32), frame[label].to_numpy()
+
+def _peak_memory_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def train_streaming_model(
+    chunk_source: Callable[[], Iterator[Tuple[np.ndarray, np.ndarray]]],
+    trees_per_chunk: Optional[int] = None,
+    n_jobs: Optional[int] = None,
+    test_fraction: float = 0.2,
+    holdout_size: int = 100000,
+    anchor_size: int = 1000,
+    leading_limit: Optional[int] = None,
+    random_state: int = 42,
+    **forest_params
+) -> Tuple[RandomForestClassifier, Dict]:
+    """
+    Grow a random forest over a stream of labeled chunks.
+
+    Each chunk adds trees_per_chunk trees trained only on that chunk, so memory
+    is bounded by the chunk size, not the dataset. Every tree must see the same
+    class set, so chunks missing a class are topped up from a small per-class
+    reservoir of earlier rows (anchor_size). Leading single-class chunks are
+    held back until a second class appears, as a uniform sample of at most
+    leading_limit rows (default: one chunk), so class-sorted input cannot
+    buffer the whole dataset; the report counts the rows this drops. Returns
+    the model and its training report.
+    """
+    trees_per_chunk = trees_per_chunk or settings.ml_train_trees_per_chunk
+    leading_limit = leading_limit or settings.ml_train_chunk_size
+    n_jobs = settings.ml_train_n_jobs if n_jobs is None else n_jobs
+    rng = np.random.default_rng(random_state)
+    start_time = time.time()
+
+    model = RandomForestClassifier(
+        n_estimators=0,
+        warm_start=True,
+        n_jobs=n_jobs,
+        random_state=random_state,
+        **forest_params
+    )
+    holdout = ReservoirSample(holdout_size, random_state)
+    anchors: Dict = {}
+    classes = None
+    leading = ReservoirSample(leading_limit, random_state)
+    leading_label = None
+    leading_rows = 0
+    n_rows = n_chunks = 0
+
+    def fit_chunk(X, y):
+        for label in classes[~np.isin(classes, y)]:
+            anchor = anchors[label].rows
+            X = np.concatenate([X, anchor.astype(X.dtype)])
+            y = np.concatenate([y, np.full(len(anchor), label, dtype=y.dtype)])
+        model.n_estimators += trees_per_chunk
+        model.fit(X, y)
+
+    for X, y in chunk_source():
+        n_rows += len(y)
+        n_chunks += 1
+        test_mask = rng.random(len(y)) < test_fraction
+        if test_mask.any():
+            holdout.update(np.column_stack([X[test_mask], y[test_mask]]))
+        X, y = X[~test_mask], y[~test_mask]
+        for label in np.unique(y):
+            anchors.setdefault(label, ReservoirSample(anchor_size, random_state)).update(X[y == label])
+
+        if classes is None:
+            if len(anchors) < 2:
+                # Only one class so far: keep a bounded sample of it for the first fit
+                if len(y):
+                    leading_label = y[0]
+                    leading.update(X)
+                    leading_rows += len(y)
+                continue
+            classes = np.array(sorted(anchors))
+            if leading.rows is not None:
+                X = np.concatenate([leading.rows.astype(X.dtype), X])
+                y = np.concatenate([np.full(len(leading.rows), leading_label, dtype=y.dtype), y])
+        fit_chunk(X, y)
+
+    if classes is None:
+        raise ValueError("Training data must contain at least two classes")
+
+    training_seconds = time.time() - start_time
+    report = {
+        "feature_schema": FEATURE_SCHEMA_VERSION,
+        "feature_names": FEATURE_NAMES,
+        "n_rows": n_rows,
+        "n_chunks": n_chunks,
+        "n_estimators": model.n_estimators,
+        "n_jobs": n_jobs,
+        "classes": classes.tolist(),
+        "leading_rows_dropped": leading_rows - (0 if leading.rows is None else len(leading.rows)),
+        "training_seconds": round(training_seconds, 2),
+        "metrics": _evaluate(model, holdout.rows)
+    }
+    report["peak_memory_mb"] = round(_peak_memory_mb(), 1)
+    return model, report
+
+def _evaluate(model: RandomForestClassifier, holdout: Optional[np.ndarray]) -> Dict:
+    """Classification metrics on the holdout sample"""
+    if holdout is None or len(holdout) == 0:
+        return {}
+    X, y = holdout[:, :-1], holdout[:, -1].astype(model.classes_.dtype)
+    start = time.perf_counter()
+    y_pred = model.predict(X)
+    metrics = {
+        "holdout_rows": int(len(y)),
+        "predict_seconds": round(time.perf_counter() - start, 3),
+        "report": classification_report(y, y_pred, output_dict=True, zero_division=0)
+    }
+    if len(model.classes_) == 2 and len(np.unique(y)) == 2:
+        metrics["roc_auc"] = float(roc_auc_score(y, model.predict_proba(X)[:, 1]))
+    return metrics
+
+def save_model_version(model, report: Dict, root: Optional[str] = None, version: Optional[str] = None) -> str:
+    """Write a versioned artifact the model registry can load; returns the version directory"""
+    root = root or settings.model_path
+    version = version or datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    version_dir = os.path.join(root, version)
+    if os.path.exists(version_dir):
+        raise FileExistsError(f"Model version already exists: {version_dir}")
+
+    # Build in a hidden directory and rename, so the registry never sees a partial version
+    tmp_dir = os.path.join(root, f".{version}.{os.getpid()}.tmp")
+    os.makedirs(tmp_dir)
+    try:
+        # Uncompressed so the registry can memory-map the arrays
+        joblib.dump(model, os.path.join(tmp_dir, MODEL_FILE))
+        meta = {
+            "version": version,
+            "feature_schema": report["feature_schema"],
+            "trained_at": datetime.now(timezone.utc).isoformat()
+        }
+        with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+        with open(os.path.join(tmp_dir, REPORT_FILE), "w") as f:
+            json.dump({**meta, **report}, f, indent=2)
+        os.rename(tmp_dir, version_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return version_dir
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the fraud model from labeled feature files")
+    parser.add_argument("paths", nargs="+", help="Parquet or CSV files with feature columns and a label column")
+    parser.add_argument("--label", default="is_fraud", help="Label column name")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Rows per streamed chunk")
+    parser.add_argument("--trees-per-chunk", type=int, default=None, help="Trees added for each chunk")
+    parser.add_argument("--n-jobs", type=int, default=None, help="Cores used for training (-1 for all)")
+    parser.add_argument("--max-depth", type=int, default=None, help="Maximum tree depth")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="Share of rows held out for evaluation")
+    parser.add_argument("--output", default=None, help="Model registry root (default: settings.model_path)")
+    parser.add_argument("--version", default=None, help="Version name (default: UTC timestamp)")
+    parser.add_argument("--report", default=None, help="Also write the training report to this path")
+    args = parser.parse_args()
+
+    model, report = train_streaming_model(
+        lambda: iter_labeled_chunks(args.paths, args.label, args.chunk_size),
+        trees_per_chunk=args.trees_per_chunk,
+        n_jobs=args.n_jobs,
+        test_fraction=args.test_fraction,
+        max_depth=args.max_depth
+    )
+    version_dir = save_model_version(model, report, args.output, args.version)
+    report["artifact"] = version_dir
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    logger.info(
+        "Fraud model trained",
+        artifact=version_dir,
+        n_rows=report["n_rows"],
+        training_seconds=report["training_seconds"],
+        peak_memory_mb=report["peak_memory_mb"]
+    )
+    print(json.dumps({k: v for k, v in report.items() if k != "feature_names"}, indent=2))
+
+if __name__ == "__main__":
+    main()
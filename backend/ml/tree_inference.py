@@ -0,0 +1,163 @@
+import json
+import os
+import time
+import numpy as np
+
+ARRAY_NAMES = ("feature", "threshold", "children_left", "children_right", "value", "roots")
+
+class CompiledForest:
+    """
+    A fitted RandomForestClassifier flattened into NumPy arrays.
+
+    Every tree's nodes are concatenated into one set of arrays (feature,
+    threshold, children, value), so a batch of rows is evaluated by walking all
+    trees at once with vectorized indexing. This avoids sklearn's per-call input
+    validation and joblib dispatch, which dominate the cost of scoring a single
+    row. Leaves point to themselves, so a fixed number of steps (the deepest
+    tree's depth) lands every (row, tree) pair on its leaf.
+
+    The walk costs time per row where sklearn's cost is mostly per call, so it
+    loses on large batches. Batches above max_batch go to the fallback
+    estimator (the original sklearn model) when one is attached.
+    """
+
+    def __init__(self, feature, threshold, children_left, children_right, value, roots, classes, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.classes = classes
+        self.max_depth = int(max_depth)
+        self.is_leaf = children_left == np.arange(len(children_left))
+        self.n_features = None
+        self.fallback = None
+        self.max_batch = None
+
+    def with_fallback(self, model, max_batch: int) -> "CompiledForest":
+        """Route batches larger than max_batch to model.predict_proba"""
+        self.fallback = model
+        self.max_batch = max_batch
+        return self
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompiledForest":
+        """Export a fitted sklearn RandomForestClassifier"""
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests can be compiled")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count) + offset
+            leaf = tree.children_left == -1
+
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(leaf, node_ids, tree.children_left + offset))
+            rights.append(np.where(leaf, node_ids, tree.children_right + offset))
+
+            # Per-node class distribution, normalized like DecisionTreeClassifier.predict_proba
+            node_values = tree.value[:, 0, :].astype(np.float64)
+            totals = node_values.sum(axis=1, keepdims=True)
+            totals[totals == 0] = 1.0
+            values.append(node_values / totals)
+
+            roots.append(offset)
+            offset += tree.node_count
+
+        index_dtype = np.int32 if offset < np.iinfo(np.int32).max else np.int64
+        forest = cls(
+            feature=np.concatenate(features).astype(index_dtype),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children_left=np.concatenate(lefts).astype(index_dtype),
+            children_right=np.concatenate(rights).astype(index_dtype),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=index_dtype),
+            classes=np.asarray(model.classes_),
+            max_depth=max(estimator.tree_.max_depth for estimator in model.estimators_)
+        )
+        forest.n_features = model.n_features_in_
+        return forest
+
+    def save(self, directory: str):
+        """Write the arrays as .npy files so other processes can memory-map them"""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({
+                "max_depth": self.max_depth,
+                "n_features": self.n_features,
+                "classes": self.classes.tolist()
+            }, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str = "r") -> "CompiledForest":
+        """Load a saved forest; with mmap_mode the arrays are shared through the page cache"""
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        forest = cls(classes=np.asarray(meta["classes"]), max_depth=meta["max_depth"], **arrays)
+        forest.n_features = meta["n_features"]
+        return forest
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node index reached by every (row, tree) pair"""
+        nodes = np.repeat(self.roots[np.newaxis, :], X.shape[0], axis=0)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        for _ in range(self.max_depth):
+            if self.is_leaf[nodes].all():
+                break
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.children_left[nodes], self.children_right[nodes])
+        return nodes
+
+    def _validate(self, X) -> np.ndarray:
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if self.n_features is not None and X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but the forest expects {self.n_features}")
+        return X
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Class probabilities, matching RandomForestClassifier.predict_proba"""
+        X = self._validate(X)
+        if self.fallback is not None and len(X) > self.max_batch:
+            return self.fallback.predict_proba(X)
+        return self.value[self._leaves(X)].mean(axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        """Class labels, matching RandomForestClassifier.predict"""
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+def _benchmark(func, X, repeat: int) -> float:
+    """Mean seconds per call"""
+    func(X)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(X)
+    return (time.perf_counter() - start) / repeat
+
+# Benchmark against sklearn; parity is covered by tests/test_tree_inference.py
+if __name__ == "__main__":
+    from sklearn.datasets import make_classification
+    from sklearn.ensemble import RandomForestClassifier
+
+    X, y = make_classification(n_samples=5000, n_features=14, n_informative=8, random_state=42)
+    model = RandomForestClassifier(n_estimators=100, random_state=42)
+    model.fit(X, y)
+    forest = CompiledForest.from_sklearn(model)
+
+    for batch_size, repeat in ((1, 200), (32, 100), (128, 30), (1000, 10)):
+        batch = X[:batch_size]
+        sklearn_time = _benchmark(model.predict_proba, batch, repeat)
+        compiled_time = _benchmark(forest.predict_proba, batch, repeat)
+        print(
+            f"batch={batch_size:>4}  sklearn={sklearn_time * 1000:8.3f} ms  "
+            f"compiled={compiled_time * 1000:8.3f} ms  speedup={sklearn_time / compiled_time:6.1f}x"
+        )
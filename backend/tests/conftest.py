@@ -0,0 +1,26 @@
+"""Shared test setup: development settings and an in-memory Redis.
+
+Both are set before any application module is imported, since settings are
+validated and Redis clients are created at import time.
+"""
+import os
+
+os.environ.setdefault("ENVIRONMENT", "development")
+
+import fakeredis
+import pytest
+import redis
+
+_server = fakeredis.FakeServer()
+
+def _fake_from_url(url, **kwargs):
+    return fakeredis.FakeRedis(server=_server)
+
+redis.from_url = _fake_from_url
+
+@pytest.fixture
+def redis_client():
+    """The shared fake Redis, emptied before each test"""
+    client = fakeredis.FakeRedis(server=_server)
+    client.flushall()
+    return client
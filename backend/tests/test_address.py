@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from utils.address import (
+    AddressInterner, address_bytes, address_from_bytes, address_key, addresses_to_array,
+    canonical_address, is_valid_address, to_checksum
+)
+
+LOWER = "0x5aaeb6053f3e94c9b9a09f33669435e7ef1beaed"
+CHECKSUMMED = "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed"
+VARIANTS = [LOWER, CHECKSUMMED, LOWER.upper().replace("0X", "0x"), LOWER[2:]]
+
+@pytest.mark.parametrize("address", VARIANTS)
+def test_every_spelling_maps_to_one_key(address):
+    assert canonical_address(address) == LOWER
+    assert address_bytes(address) == bytes.fromhex(LOWER[2:])
+    assert len(address_bytes(address)) == 20
+    assert to_checksum(address) == CHECKSUMMED
+    assert address_key("wallet", "ethereum", address=address) == b"wallet:ethereum:" + bytes.fromhex(LOWER[2:])
+
+@pytest.mark.parametrize("address", ["", "0x", "0x1234", LOWER + "00", "0x" + "zz" * 20, "not an address"])
+def test_invalid_addresses_are_rejected(address):
+    assert not is_valid_address(address)
+    with pytest.raises(ValueError):
+        canonical_address(address)
+    with pytest.raises(ValueError):
+        address_bytes(address)
+
+def test_raw_bytes_round_trip():
+    raw = address_bytes(CHECKSUMMED)
+    assert address_from_bytes(raw) == LOWER
+    with pytest.raises(ValueError):
+        address_from_bytes(raw[:19])
+    array = addresses_to_array(VARIANTS)
+    assert array.dtype == np.dtype("S20")
+    assert len(set(array.tolist())) == 1
+
+def test_interner_ids_are_dense_and_case_insensitive():
+    interner = AddressInterner()
+    other = "0x" + "11" * 20
+    assert interner.intern_many([LOWER, other, CHECKSUMMED]).tolist() == [0, 1, 0]
+    assert len(interner) == 2
+    assert CHECKSUMMED in interner
+    assert interner.lookup("0x" + "22" * 20) == -1
+    assert interner.address(1) == other
+
+    rebuilt = AddressInterner.from_array(interner.to_array())
+    assert rebuilt.lookup(CHECKSUMMED) == 0
+    assert rebuilt.intern("0x" + "22" * 20) == 2
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from blockchain.aggregates import AggregateStream, WalletAggregate, load_wallet_aggregate, update_wallet_aggregate
+from config import settings
+
+OWNER = "0x" + "11" * 20
+
+def transactions(n, start_block=1000, per_block=3, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 5 * 10**18, size=n)
+    return [{
+        "hash": f"0x{seed:08x}{i:056x}",
+        "blockNumber": str(start_block + i // per_block),
+        "timeStamp": str(1_700_000_000 + i * 60),
+        "from": OWNER if i % 3 == 0 else f"0x{i % 11 + 1:040x}",
+        "to": f"0x{i % 13 + 100:040x}",
+        "value": str(values[i]),
+        "isError": "1" if i % 17 == 0 else "0",
+        "input": "0xa9059cbb" if i % 4 == 0 else "0x",
+    } for i in range(n)]
+
+def test_chunked_merges_match_numpy(monkeypatch):
+    # Chunks of 1000, so one update call merges several batches
+    monkeypatch.setattr(settings, "sketch_max_memory_mb", 0)
+    history = transactions(2600)
+    aggregate = WalletAggregate(OWNER)
+    for start, end in ((0, 1), (1, 700), (700, 2600)):
+        assert aggregate.update(history[start:end]) == end - start
+
+    values = np.array([float(tx["value"]) for tx in history])
+    assert aggregate.count == len(history)
+    assert aggregate.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert aggregate.std == pytest.approx(values.std(ddof=1), rel=1e-12)
+    assert aggregate.total_value == pytest.approx(values.sum(), rel=1e-12)
+    assert aggregate.max_value == values.max()
+    assert aggregate.outgoing == sum(tx["from"] == OWNER for tx in history)
+    assert aggregate.failed == sum(tx["isError"] == "1" for tx in history)
+    assert aggregate.contract_calls == sum(tx["input"] != "0x" for tx in history)
+    assert aggregate.span_seconds == 2599 * 60
+
+    # Same statistics as one batch over the whole history
+    whole = WalletAggregate(OWNER)
+    whole.update(history)
+    assert whole.mean == pytest.approx(aggregate.mean, rel=1e-12)
+    assert whole.m2 == pytest.approx(aggregate.m2, rel=1e-9)
+
+def test_overlapping_batches_are_not_double_counted():
+    history = transactions(30, per_block=3)
+    aggregate = WalletAggregate(OWNER)
+    # Stop halfway through a block: hashes 0..16 cover blocks 1000-1005, block 1005 only partly
+    assert aggregate.update(history[:17]) == 17
+    assert aggregate.last_block == 1005
+    assert len(aggregate.last_block_hashes) == 2
+
+    # A refetch overlapping what was applied only counts the rest of the last block and later
+    assert aggregate.update(history[10:]) == 13
+    assert aggregate.update(history) == 0
+    assert aggregate.count == 30
+
+    restored = WalletAggregate.from_dict(aggregate.to_dict())
+    assert restored.update(history[-3:]) == 0
+    assert restored.mean == aggregate.mean
+
+def test_concurrent_updates_are_both_kept(redis_client, monkeypatch):
+    first, second = transactions(10, start_block=1000, seed=1), transactions(10, start_block=5000, seed=2)
+    real_update = WalletAggregate.update
+    interleaved = []
+
+    def update_with_interleaving(self, batch):
+        # Another analysis of the wallet commits between this one's load and save
+        if not interleaved:
+            interleaved.append(True)
+            update_wallet_aggregate(OWNER, "ethereum", first)
+        return real_update(self, batch)
+
+    monkeypatch.setattr(WalletAggregate, "update", update_with_interleaving)
+    aggregate, applied = update_wallet_aggregate(OWNER, "ethereum", second)
+    assert applied == 10
+    assert aggregate.count == 20
+    assert load_wallet_aggregate(OWNER, "ethereum").count == 20
+
+def test_missing_aggregate_is_not_created_on_refresh(redis_client):
+    aggregate, applied = update_wallet_aggregate(OWNER, "ethereum", transactions(5), create=False)
+    assert aggregate is None and applied == 0
+    assert load_wallet_aggregate(OWNER, "ethereum") is None
+
+    aggregate, _ = update_wallet_aggregate(OWNER, "ethereum", transactions(5), save=False)
+    assert aggregate.count == 5
+    assert load_wallet_aggregate(OWNER, "ethereum") is None
+
+WALLET_DATA = {"summary": {"defi_transactions": 0}, "data_sources": {"balance": {"success": True, "native_balance": 1.0}}}
+
+def test_streamed_pages_match_one_update(redis_client):
+    # Pages arrive newest first, so each is deduplicated against the state before the fetch
+    update_wallet_aggregate(OWNER, "ethereum", transactions(20))
+    history = transactions(300, per_block=4)
+    stream = AggregateStream(OWNER, "ethereum")
+    for start in range(len(history), 0, -70):
+        stream.add(history[max(start - 70, 0):start])
+    stream.save(WALLET_DATA)
+
+    whole = WalletAggregate(OWNER)
+    whole.update(transactions(20))
+    whole.update(history)
+    saved = load_wallet_aggregate(OWNER, "ethereum")
+    assert stream.applied == whole.count - 20
+    assert saved.count == whole.count
+    assert saved.mean == pytest.approx(whole.mean, rel=1e-12)
+    assert saved.m2 == pytest.approx(whole.m2, rel=1e-9)
+
+def test_streamed_save_keeps_a_concurrent_save(redis_client):
+    stream = AggregateStream(OWNER, "ethereum")
+    stream.add(transactions(10))
+    # Another analysis of the same history saves first
+    update_wallet_aggregate(OWNER, "ethereum", transactions(10))
+    stream.save(WALLET_DATA)
+    assert load_wallet_aggregate(OWNER, "ethereum").count == 10
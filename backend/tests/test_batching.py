@@ -0,0 +1,64 @@
+import asyncio
+import math
+import time
+
+import numpy as np
+import pytest
+
+from ml.batching import MicroBatchPredictor
+
+class _Model:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batch_sizes = []
+
+    def __call__(self, features):
+        self.batch_sizes.append(len(features))
+        if self.fail:
+            raise RuntimeError("model exploded")
+        return features.sum(axis=1)
+
+@pytest.mark.parametrize("n_requests, max_size", [(10, 4), (32, 8), (5, 16)])
+def test_concurrent_requests_are_coalesced(n_requests, max_size):
+    model = _Model()
+    predictor = MicroBatchPredictor(model, max_batch_size=max_size, max_wait_ms=50)
+
+    async def run():
+        return await asyncio.gather(*(predictor.predict([i, 1.0]) for i in range(n_requests)))
+
+    results = asyncio.run(run())
+    assert [float(r) for r in results] == [i + 1.0 for i in range(n_requests)]
+    assert sum(model.batch_sizes) == n_requests
+    assert len(model.batch_sizes) <= math.ceil(n_requests / max_size)
+
+def test_lone_request_is_flushed_after_max_wait():
+    model = _Model()
+    predictor = MicroBatchPredictor(model, max_batch_size=64, max_wait_ms=20)
+
+    async def run():
+        started = time.perf_counter()
+        result = await asyncio.wait_for(predictor.predict([2.0, 3.0]), timeout=2)
+        return result, time.perf_counter() - started
+
+    result, elapsed = asyncio.run(run())
+    assert float(result) == 5.0
+    assert model.batch_sizes == [1]
+    assert elapsed >= 0.02
+
+def test_model_error_reaches_every_waiter():
+    model = _Model(fail=True)
+    predictor = MicroBatchPredictor(model, max_batch_size=8, max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(predictor.predict([float(i)]) for i in range(5)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert len(results) == 5
+    assert all(isinstance(r, RuntimeError) and str(r) == "model exploded" for r in results)
+    assert model.batch_sizes == [5]
+
+def test_predictor_survives_a_new_event_loop():
+    model = _Model()
+    predictor = MicroBatchPredictor(model, max_batch_size=4, max_wait_ms=5)
+    assert float(asyncio.run(predictor.predict(np.array([1.0])))) == 1.0
+    assert float(asyncio.run(predictor.predict(np.array([2.0])))) == 2.0
@@ -0,0 +1,79 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from blockchain.bulk_score import CHECKPOINT_FILE, SharedThrottle, run_bulk_score
+from blockchain.wallet_analyzer import WalletAnalyzer
+
+def _addresses(n):
+    return [f"0x{i:040x}" for i in range(1, n + 1)]
+
+@pytest.fixture
+def fake_analysis(monkeypatch):
+    # Patched before the pool forks, so workers inherit it
+    monkeypatch.setattr(WalletAnalyzer, "analyze_wallet", lambda self, address, network="ethereum", stages=None: {
+        "success": True,
+        "trust_score": int(address, 16) % 100,
+        "risk_score": {"risk_score": 10, "risk_level": "low"},
+        "summary": {"total_transactions": 0},
+        "anomalies": []
+    })
+
+def test_resume_skips_completed_chunks(tmp_path, fake_analysis):
+    input_path = tmp_path / "addresses.csv"
+    pd.DataFrame({"address": _addresses(10)}).to_csv(input_path, index=False)
+    output = tmp_path / "out"
+    output.mkdir()
+
+    # A previous run finished chunk 0 before stopping
+    (output / CHECKPOINT_FILE).write_text(json.dumps({
+        "input": os.path.abspath(input_path),
+        "network": "ethereum",
+        "chunk_size": 4,
+        "total_chunks": 3,
+        "completed": [0]
+    }))
+    pd.DataFrame({"address": ["from the first run"]}).to_parquet(output / "part-000000.parquet")
+
+    report = run_bulk_score(str(input_path), str(output), workers=2, chunk_size=4, requests_per_second=1000)
+    assert report["skipped_from_checkpoint"] == 4
+    assert report["scored"] == 6
+    assert pd.read_parquet(output / "part-000000.parquet")["address"].tolist() == ["from the first run"]
+    assert sorted(json.loads((output / CHECKPOINT_FILE).read_text())["completed"]) == [0, 1, 2]
+    scored = pd.concat(pd.read_parquet(output / f"part-{i:06d}.parquet") for i in (1, 2))
+    assert scored["address"].tolist() == _addresses(10)[4:]
+
+    # Everything is done: a rerun scores nothing
+    assert run_bulk_score(str(input_path), str(output), workers=2, chunk_size=4, requests_per_second=1000)["scored"] == 0
+
+def test_resume_refuses_a_different_run(tmp_path, fake_analysis):
+    input_path = tmp_path / "addresses.csv"
+    pd.DataFrame({"address": _addresses(4)}).to_csv(input_path, index=False)
+    run_bulk_score(str(input_path), str(tmp_path / "out"), workers=1, chunk_size=2, requests_per_second=1000)
+    with pytest.raises(ValueError):
+        run_bulk_score(str(input_path), str(tmp_path / "out"), workers=1, chunk_size=3, requests_per_second=1000)
+
+def _take_slots(throttle, calls, times):
+    for _ in range(calls):
+        throttle.wait()
+        times.put(time.time())
+
+def test_throttle_rate_is_shared_across_processes():
+    rate, calls = 50.0, 10
+    throttle = SharedThrottle(rate)
+    times = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_take_slots, args=(throttle, calls, times)) for _ in range(2)]
+    for process in processes:
+        process.start()
+    stamps = sorted(times.get(timeout=10) for _ in range(2 * calls))
+    for process in processes:
+        process.join()
+
+    # Two processes together get one quota, not one each
+    assert stamps[-1] - stamps[0] >= (2 * calls - 1) / rate * 0.9
+    gaps = [later - earlier for earlier, later in zip(stamps, stamps[1:])]
+    assert min(gaps) >= 0.5 / rate
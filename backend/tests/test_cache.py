@@ -0,0 +1,48 @@
+from prometheus_client import REGISTRY
+
+from utils.cache import KeyspaceReporter, RedisCache
+from utils.monitoring import system_monitor
+
+def requests_counted(namespace, result):
+    return REGISTRY.get_sample_value("cache_requests_total", {"namespace": namespace, "result": result}) or 0.0
+
+def test_raw_reads_count_hits_and_misses(redis_client):
+    cache = RedisCache()
+    redis_client.set(b"wallet_response:ethereum:identity", b"body")
+    before = {result: requests_counted("wallet_response", result) for result in ("hit", "miss")}
+    stats_before = system_monitor.cache_stats().get("wallet_response", {"hits": 0, "misses": 0})
+
+    assert cache.get_raw(b"wallet_response:ethereum:identity") == b"body"
+    assert cache.get_raw(b"wallet_response:ethereum:gzip") is None
+    # One lookup over several keys counts once, hit if any key is present
+    assert cache.get_first_raw(b"wallet_response:ethereum:zstd", b"wallet_response:ethereum:identity") == b"body"
+    assert cache.get_first_raw(b"wallet_response:ethereum:zstd", b"wallet_response:ethereum:gzip") is None
+
+    assert requests_counted("wallet_response", "hit") - before["hit"] == 2
+    assert requests_counted("wallet_response", "miss") - before["miss"] == 2
+    stats = system_monitor.cache_stats()["wallet_response"]
+    assert stats["hits"] - stats_before["hits"] == 2
+    assert stats["misses"] - stats_before["misses"] == 2
+
+def test_keyspace_report_on_an_empty_keyspace(redis_client):
+    report = KeyspaceReporter(redis_client, sample_size=10).report()
+    assert report["total_keys"] == 0 and report["sampled_keys"] == 0
+    assert report["namespaces"] == {}
+    assert REGISTRY.get_sample_value("cache_keys", {"namespace": "wallet_analysis"}) == 0
+
+def test_keyspace_report_when_keys_expire_before_sampling(redis_client, monkeypatch):
+    # DBSIZE still counts keys that are gone by the time RANDOMKEY runs
+    monkeypatch.setattr(redis_client, "dbsize", lambda: 5)
+    report = KeyspaceReporter(redis_client, sample_size=10).report()
+    assert report["total_keys"] == 5 and report["sampled_keys"] == 0
+    assert report["namespaces"] == {}
+
+def test_keyspace_report_scales_the_sample(redis_client):
+    for i in range(30):
+        redis_client.set(f"wallet_analysis:ethereum:{i}", b"x" * 100)
+    for i in range(10):
+        redis_client.set(f"unrelated:{i}", b"x")
+    report = KeyspaceReporter(redis_client, sample_size=200).report()
+    assert report["total_keys"] == 40 and report["sampled_keys"] == 200
+    assert set(report["namespaces"]) <= {"wallet_analysis", "other"}
+    assert sum(namespace["keys"] for namespace in report["namespaces"].values()) == 40
@@ -0,0 +1,89 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from config import settings
+from ml import clustering
+from ml.clustering import ClusterAssigner, save_clusters, train_streaming_clusters
+from ml.features import FEATURE_NAMES
+
+N_FEATURES = len(FEATURE_NAMES)
+
+def blobs(n_per_cluster=300, seed=0):
+    """Three well-separated groups of wallets in shuffled order, with their true labels"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=20, size=(3, N_FEATURES))
+    X = np.vstack([center + rng.normal(size=(n_per_cluster, N_FEATURES)) for center in centers])
+    order = rng.permutation(len(X))
+    return X[order], np.repeat(np.arange(3), n_per_cluster)[order]
+
+@pytest.fixture
+def trained(tmp_path):
+    X, labels = blobs()
+    path = str(tmp_path / "clusters.npz")
+    chunks = lambda: (X[i:i + 100] for i in range(0, len(X), 100))
+    meta = train_streaming_clusters(chunks, n_clusters=3, sample_size=500, output_path=path)
+    return X, labels, path, meta
+
+def test_assign_recovers_the_groups(trained):
+    X, labels, path, meta = trained
+    assigner = ClusterAssigner.load(path)
+    assigned = assigner.assign(X)
+
+    # Same partition as the true groups, whatever the cluster numbering
+    pairs = set(zip(labels.tolist(), assigned.tolist()))
+    assert len(pairs) == 3 and len({a for _, a in pairs}) == 3
+    assert meta["silhouette"] > 0.5
+
+    # The expanded distance matches a plain nearest-centroid search
+    scaled = (X - assigner.mean) / assigner.scale
+    brute = np.argmin(((scaled[:, None, :] - assigner.centroids[None]) ** 2).sum(axis=2), axis=1)
+    assert (assigned == brute).all()
+    assert assigner.assign(X[0]).shape == (1,)
+
+def test_describe(trained):
+    X, labels, path, _ = trained
+    assigner = ClusterAssigner.load(path)
+    cluster_id = int(assigner.assign(X[0])[0])
+    summary = assigner.describe(cluster_id)
+
+    assert summary["cluster_id"] == cluster_id
+    assert set(summary["centroid"]) == set(FEATURE_NAMES)
+    assert np.allclose([summary["centroid"][name] for name in FEATURE_NAMES], X[labels == labels[0]].mean(axis=0), atol=0.5)
+    assert len(summary["distinctive_features"]) == 3
+    with pytest.raises(ValueError):
+        assigner.describe(3)
+
+def test_other_feature_schema_is_rejected(tmp_path):
+    path = str(tmp_path / "old.npz")
+    save_clusters(path, np.zeros((2, N_FEATURES)), np.zeros(N_FEATURES), np.ones(N_FEATURES), {"feature_schema": "v0"})
+    with pytest.raises(ValueError):
+        ClusterAssigner.load(path)
+
+def test_file_is_only_checked_once_per_interval(trained, monkeypatch):
+    _, _, path, meta = trained
+    monkeypatch.setattr(settings, "cluster_path", path)
+    monkeypatch.setattr(settings, "cluster_check_interval", 3600.0)
+    monkeypatch.setattr(clustering, "_assigner", None)
+    monkeypatch.setattr(clustering, "_assigner_mtime", None)
+    monkeypatch.setattr(clustering, "_assigner_checked_at", float("-inf"))
+
+    first = clustering.get_cluster_assigner()
+    assert first is not None
+
+    retrained = dict(meta, trained_at="later")
+    save_clusters(path, first.centroids[::-1], first.mean, first.scale, retrained)
+    os.utime(path, (0, os.path.getmtime(path) + 10))
+    assert clustering.get_cluster_assigner() is first
+
+    # Once the interval has passed, the retrained file is picked up
+    monkeypatch.setattr(clustering, "_assigner_checked_at", float("-inf"))
+    reloaded = clustering.get_cluster_assigner()
+    assert reloaded is not first
+    assert reloaded.meta["trained_at"] == "later"
+
+    os.remove(path)
+    monkeypatch.setattr(clustering, "_assigner_checked_at", float("-inf"))
+    assert clustering.assign_cluster(np.zeros(N_FEATURES)) is None
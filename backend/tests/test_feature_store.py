@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+import pytest
+
+from config import settings
+from ml import feature_store as feature_store_module
+from ml.feature_store import INITIAL_CAPACITY, FeatureStore
+from ml.features import FEATURE_NAMES, fetch_wallet_features
+
+N_FEATURES = len(FEATURE_NAMES)
+
+def addresses(n, start=0):
+    return [f"0x{i:040x}" for i in range(start, start + n)]
+
+class CountingFetcher:
+    def __init__(self):
+        self.fetched = []
+
+    def fetch_from_etherscan(self, address):
+        self.fetched.append(address)
+        return {"success": True, "transactions": [{
+            "from": address, "to": "0x" + "ee" * 20, "value": str(10**18), "timeStamp": "1700000000",
+            "isError": "0", "input": "0x", "gasPrice": str(10**9)
+        }]}
+
+    def get_wallet_balance(self, address, network):
+        return {"success": True, "native_balance": "2.0"}
+
+def test_rows_survive_reopening(tmp_path):
+    wallets = addresses(INITIAL_CAPACITY + 10)
+    features = np.arange(len(wallets) * N_FEATURES, dtype=np.float64).reshape(len(wallets), N_FEATURES)
+    FeatureStore(str(tmp_path)).put("ethereum", wallets, features)
+
+    reopened = FeatureStore(str(tmp_path))
+    matrix, found = reopened.get_many("ethereum", wallets + addresses(1, start=10**6))
+    assert found.tolist() == [True] * len(wallets) + [False]
+    assert np.array_equal(matrix[:-1], features)
+    assert not matrix[-1].any()
+    assert np.array_equal(reopened.table("ethereum").matrix(), features)
+
+    # Overwriting keeps one row per wallet, whatever the address casing
+    reopened.put("ethereum", [wallets[3].upper().replace("0X", "0x")], np.ones((1, N_FEATURES)))
+    assert len(reopened.table("ethereum")) == len(wallets)
+    assert np.array_equal(FeatureStore(str(tmp_path)).get("ethereum", wallets[3]), np.ones(N_FEATURES))
+    assert reopened.get("polygon", wallets[3]) is None
+
+def test_stale_rows_are_recomputed(tmp_path, redis_client, monkeypatch):
+    store = FeatureStore(str(tmp_path))
+    monkeypatch.setattr(feature_store_module, "feature_store", store)
+    monkeypatch.setattr(settings, "feature_store_max_age", 3600)
+    fresh, stale = addresses(2)
+    store.put("ethereum", [fresh, stale], np.full((2, N_FEATURES), 7.0))
+    table = store.table("ethereum")
+    table._updated_at[table._row(stale)] = time.time() - 7200
+
+    fetcher = CountingFetcher()
+    matrix = fetch_wallet_features([fresh, stale], "ethereum", fetcher)
+    assert fetcher.fetched == [stale]
+    assert (matrix[0] == 7.0).all()
+    assert matrix[1, FEATURE_NAMES.index("tx_count")] == 1
+    assert matrix[1, FEATURE_NAMES.index("balance_eth")] == 2.0
+
+    # The recomputed row was written back and is fresh again
+    assert np.array_equal(store.get("ethereum", stale, max_age=3600), matrix[1])
+
+def test_other_schema_versions_are_ignored(tmp_path, redis_client, monkeypatch):
+    wallet = addresses(1)[0]
+    FeatureStore(str(tmp_path), schema_version="v0").put("ethereum", [wallet], np.full((1, N_FEATURES), 9.0))
+
+    store = FeatureStore(str(tmp_path))
+    assert store.get("ethereum", wallet) is None
+    monkeypatch.setattr(feature_store_module, "feature_store", store)
+    fetcher = CountingFetcher()
+    matrix = fetch_wallet_features([wallet], "ethereum", fetcher)
+    assert fetcher.fetched == [wallet]
+    assert not (matrix == 9.0).any()
+
+def test_put_rejects_mismatched_shapes(tmp_path):
+    with pytest.raises(ValueError):
+        FeatureStore(str(tmp_path)).put("ethereum", addresses(2), np.zeros((1, N_FEATURES)))
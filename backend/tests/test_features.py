@@ -0,0 +1,75 @@
+import numpy as np
+
+from ml.features import FEATURE_NAMES, extract_feature_matrix
+
+ALICE = "0x" + "a1" * 20
+BOB = "0x" + "B2" * 20
+CAROL = "0x" + "c3" * 20
+DAVE = "0x" + "d4" * 20
+
+def _tx(sender, receiver, value_eth, timestamp, is_error="0", data="0x", gas_gwei=20):
+    return {
+        "from": sender,
+        "to": receiver,
+        "value": str(int(value_eth * 10**18)),
+        "timeStamp": str(timestamp),
+        "isError": is_error,
+        "input": data,
+        "gasPrice": str(gas_gwei * 10**9),
+    }
+
+TRANSACTIONS = {
+    ALICE: [
+        _tx(ALICE, BOB, 1.5, 1_700_000_000),
+        _tx(BOB.lower(), ALICE.upper().replace("0X", "0x"), 0.25, 1_700_086_400, gas_gwei=35),
+        _tx(ALICE, CAROL, 3.0, 1_700_300_000, is_error="1", data="0xa9059cbb"),
+        _tx(ALICE, "", 0.0, 1_700_400_000, data="0x6080"),
+    ],
+    BOB: [_tx(CAROL, BOB.lower(), 2.0, 1_690_000_000, gas_gwei=12)],
+    CAROL: [],
+}
+BALANCES = {ALICE: 4.2, BOB: 0.1}
+
+def _reference_row(address, transactions, balance):
+    """Straightforward per-wallet computation the vectorized path must reproduce"""
+    row = dict.fromkeys(FEATURE_NAMES, 0.0)
+    row["balance_eth"] = balance
+    if not transactions:
+        return [row[name] for name in FEATURE_NAMES]
+
+    owner = address.lower()
+    values = np.array([int(tx["value"]) / 1e18 for tx in transactions])
+    timestamps = [int(tx["timeStamp"]) for tx in transactions]
+    span_days = (max(timestamps) - min(timestamps)) / 86400
+    count = len(transactions)
+    row.update(
+        tx_count=count,
+        total_value_eth=values.sum(),
+        avg_value_eth=values.mean(),
+        std_value_eth=values.std(ddof=1) if count > 1 else 0.0,
+        max_value_eth=values.max(),
+        active_span_days=span_days,
+        avg_daily_tx=count / (span_days + 1),
+        unique_to=len({(tx["to"] or "").lower() for tx in transactions}),
+        unique_from=len({(tx["from"] or "").lower() for tx in transactions}),
+        outgoing_ratio=sum(tx["from"].lower() == owner for tx in transactions) / count,
+        failed_ratio=sum(tx["isError"] == "1" for tx in transactions) / count,
+        contract_call_ratio=sum(tx["input"] not in ("", "0x") for tx in transactions) / count,
+        avg_gas_price_gwei=sum(int(tx["gasPrice"]) / 1e9 for tx in transactions) / count,
+    )
+    return [row[name] for name in FEATURE_NAMES]
+
+def test_vectorized_matrix_matches_per_wallet_features():
+    addresses = [ALICE, BOB, CAROL, DAVE]
+    matrix = extract_feature_matrix(addresses, TRANSACTIONS, BALANCES)
+
+    assert matrix.shape == (len(addresses), len(FEATURE_NAMES))
+    for i, address in enumerate(addresses):
+        expected = _reference_row(address, TRANSACTIONS.get(address, []), BALANCES.get(address, 0.0))
+        for name, got, want in zip(FEATURE_NAMES, matrix[i], expected):
+            assert np.isclose(got, want), (address, name, got, want)
+
+def test_rows_do_not_depend_on_batch_composition():
+    together = extract_feature_matrix([ALICE, BOB], TRANSACTIONS, BALANCES)
+    alone = np.vstack([extract_feature_matrix([address], TRANSACTIONS, BALANCES) for address in (ALICE, BOB)])
+    assert np.allclose(together, alone)
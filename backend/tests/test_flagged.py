@@ -0,0 +1,64 @@
+import pytest
+
+from blockchain import flagged
+from blockchain.flagged import build_index, get_flagged_index
+from config import settings
+
+BAD = "0x" + "ab" * 20
+WORSE = "0x" + "cd" * 20
+
+@pytest.fixture
+def flagged_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "flagged_path", str(tmp_path))
+    monkeypatch.setattr(flagged, "_index", None)
+    monkeypatch.setattr(flagged, "_index_version", None)
+    monkeypatch.setattr(flagged, "_pointer_stat", None)
+    monkeypatch.setattr(flagged, "_checked_at", float("-inf"))
+    return tmp_path
+
+def test_pointer_checked_once_per_interval(flagged_root, monkeypatch):
+    monkeypatch.setattr(settings, "flagged_check_interval", 60.0)
+    build_index({"scam": [BAD]}, version="v1")
+    stats = []
+    real_stat = flagged.os.stat
+    monkeypatch.setattr(flagged.os, "stat", lambda path: stats.append(path) or real_stat(path))
+
+    index = get_flagged_index()
+    for _ in range(1000):
+        assert get_flagged_index() is index
+    assert len(stats) == 1
+    assert index.lookup(BAD) == "scam"
+
+def test_new_version_picked_up_after_interval(flagged_root, monkeypatch):
+    monkeypatch.setattr(settings, "flagged_check_interval", 0.0)
+    build_index({"scam": [BAD]}, version="v1")
+    assert get_flagged_index().lookup(WORSE) is None
+
+    build_index({"scam": [BAD, WORSE]}, version="v2")
+    assert get_flagged_index().lookup(WORSE) == "scam"
+
+def test_unchanged_pointer_is_not_reread(flagged_root, monkeypatch):
+    monkeypatch.setattr(settings, "flagged_check_interval", 0.0)
+    build_index({"scam": [BAD]}, version="v1")
+    index = get_flagged_index()
+    opened = []
+    monkeypatch.setattr("builtins.open", lambda *args, **kwargs: opened.append(args) or pytest.fail("re-read"))
+    assert get_flagged_index() is index
+    assert opened == []
+
+def test_failed_load_is_retried(flagged_root, monkeypatch):
+    monkeypatch.setattr(settings, "flagged_check_interval", 0.0)
+    build_index({"scam": [BAD]}, version="v1")
+    index = get_flagged_index()
+
+    build_index({"scam": [BAD, WORSE]}, version="v2")
+    def unreadable(path):
+        raise OSError("partial copy")
+
+    with monkeypatch.context() as m:
+        m.setattr(flagged.FlaggedIndex, "load", unreadable)
+        assert get_flagged_index() is index
+
+    # Once the files are readable, the same pointer is loaded on the next check
+    assert get_flagged_index().lookup(WORSE) == "scam"
+    assert flagged._index_version == "v2"
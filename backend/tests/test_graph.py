@@ -0,0 +1,90 @@
+import os
+import threading
+
+import pytest
+
+from blockchain import graph as graph_module
+from blockchain.graph import TransferGraph, build_from_cache, get_transfer_graph
+from config import settings
+from utils.cache import cache_wallet_analysis
+
+def _address(i: int) -> str:
+    return "0x" + f"{i:040x}"
+
+def _tx(i: int, sender: int, receiver: int) -> dict:
+    return {"hash": "0x" + f"{i:064x}", "from": _address(sender), "to": _address(receiver)}
+
+@pytest.fixture
+def graph_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "graph_path", str(tmp_path))
+    graph_module._graphs.clear()
+    graph_module._graphs_checked.clear()
+    yield tmp_path
+    graph_module._graphs.clear()
+    graph_module._graphs_checked.clear()
+
+def test_queries_are_consistent_while_compacting():
+    graph = TransferGraph()
+    graph.add_transactions(_tx(i, 1, i + 2) for i in range(100))
+    errors = []
+    stop = threading.Event()
+
+    def ingest():
+        i = 1000
+        while not stop.is_set():
+            graph.add_transactions([_tx(i, i % 50, i + 7)])
+            graph.compact()
+            i += 1
+
+    def query():
+        try:
+            for _ in range(300):
+                graph.risk_features(_address(1))
+        except Exception as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=ingest)
+    readers = [threading.Thread(target=query) for _ in range(3)]
+    writer.start()
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    stop.set()
+    writer.join()
+    assert errors == []
+
+def test_build_from_cache_reads_cached_analyses(redis_client, graph_dir):
+    result = {"data_sources": {"etherscan": {"transactions": [_tx(1, 1, 2), _tx(2, 2, 3)]}}}
+    cache_wallet_analysis(_address(1), "ethereum", result)
+    graph = build_from_cache("ethereum")
+    assert graph.n_nodes == 3
+    assert graph.degree(_address(2)) == {"out_degree": 1, "in_degree": 1, "out_transfers": 1, "in_transfers": 1}
+
+def test_workers_reload_rebuilt_snapshot(graph_dir, monkeypatch):
+    monkeypatch.setattr(settings, "graph_reload_interval", 0.0)
+    snapshot = TransferGraph()
+    snapshot.add_transactions([_tx(1, 1, 2)])
+    snapshot.save(graph_module.graph_file("ethereum"))
+
+    graph = get_transfer_graph("ethereum")
+    assert graph.snapshot_nodes == 2
+    assert get_transfer_graph("ethereum") is graph
+
+    snapshot.add_transactions([_tx(2, 2, 3)])
+    snapshot.save(graph_module.graph_file("ethereum"))
+    # Force a distinct mtime on filesystems with coarse timestamps
+    path = graph_module.graph_file("ethereum")
+    os.utime(path, (graph.snapshot_mtime + 1, graph.snapshot_mtime + 1))
+    reloaded = get_transfer_graph("ethereum")
+    assert reloaded is not graph
+    assert reloaded.snapshot_nodes == 3
+
+def test_overlay_is_bounded(graph_dir, monkeypatch):
+    monkeypatch.setattr(settings, "graph_max_live_nodes", 10)
+    graph = get_transfer_graph("ethereum")
+    graph.add_transactions(_tx(i, i, i + 1000) for i in range(20))
+    assert graph.live_nodes > 10
+    fresh = get_transfer_graph("ethereum")
+    assert fresh is not graph
+    assert fresh.live_nodes == 0
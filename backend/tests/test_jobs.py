@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from config import settings
+from jobs import worker
+from jobs.queue import RedisJobQueue
+from jobs.worker import process_next_job
+
+ADDRESS = "0x" + "ab" * 20
+
+class _Analyzer:
+    def __init__(self, fail=False, delay=0.0):
+        self.fail = fail
+        self.delay = delay
+
+    def analyze_wallet(self, address, network):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return {"wallet_address": address, "network": network, "success": True}
+
+@pytest.fixture
+def queue(redis_client):
+    return RedisJobQueue(redis_client=redis_client, queue_name="test:jobs")
+
+def test_submit_and_reserve_leases_the_job(queue, redis_client):
+    job = queue.submit("wallet_analysis", {"address": ADDRESS, "network": "ethereum"})
+    assert queue.get(job["id"])["status"] == "queued"
+    assert redis_client.lrange(queue.queue_name, 0, -1) == [job["id"].encode()]
+
+    reserved = queue.reserve(timeout=1)
+    assert reserved["id"] == job["id"]
+    assert redis_client.llen(queue.queue_name) == 0
+    assert redis_client.lrange(queue.processing_name, 0, -1) == [job["id"].encode()]
+    assert redis_client.zscore(queue.leases_name, job["id"]) > time.time()
+
+    queue.finish(job["id"], "completed", result={"ok": True})
+    assert queue.get(job["id"])["status"] == "completed"
+    assert redis_client.llen(queue.processing_name) == 0
+    assert redis_client.zcard(queue.leases_name) == 0
+
+def test_expired_lease_is_reclaimed_once(queue, redis_client):
+    job = queue.submit("wallet_analysis", {"address": ADDRESS})
+    queue.reserve(timeout=1)
+    assert queue.reclaim_expired() == []
+
+    # The worker died: its lease runs out without a heartbeat
+    redis_client.zadd(queue.leases_name, {job["id"]: time.time() - 1})
+    assert queue.reclaim_expired() == [job["id"]]
+    assert queue.reclaim_expired() == []
+    assert redis_client.lrange(queue.queue_name, 0, -1) == [job["id"].encode()]
+    assert redis_client.llen(queue.processing_name) == 0
+    assert queue.get(job["id"])["status"] == "queued"
+
+def test_failing_job_is_retried_until_out_of_retries(queue):
+    job = queue.submit("wallet_analysis", {"address": ADDRESS}, max_retries=1)
+    analyzer = _Analyzer(fail=True)
+
+    assert process_next_job(queue, analyzer, timeout=1)
+    assert queue.get(job["id"])["status"] == "queued"
+    assert process_next_job(queue, analyzer, timeout=1)
+
+    final = queue.get(job["id"])
+    assert final["status"] == "failed"
+    assert final["attempts"] == 2
+    assert final["error"] == "upstream down"
+    assert not process_next_job(queue, analyzer, timeout=1)
+
+def test_cancel(queue):
+    queued = queue.submit("wallet_analysis", {"address": ADDRESS})
+    assert queue.cancel(queued["id"])["status"] == "cancelled"
+
+    running = queue.submit("wallet_analysis", {"address": ADDRESS})
+    queue.update(running["id"], status="running")
+    cancelled = queue.cancel(running["id"])
+    assert cancelled["status"] == "running"
+    assert cancelled["cancel_requested"] is True
+    assert queue.is_cancel_requested(running["id"])
+
+    done = queue.submit("wallet_analysis", {"address": ADDRESS})
+    queue.finish(done["id"], "completed")
+    assert queue.cancel(done["id"])["cancel_requested"] is False
+
+    assert queue.cancel("missing") is None
+
+def test_long_job_keeps_its_lease(queue, redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "job_visibility_timeout", 0.3)
+    monkeypatch.setattr(queue, "visibility_timeout", 0.3)
+    job = queue.submit("wallet_analysis", {"address": ADDRESS})
+    reserved = queue.reserve(timeout=1)
+
+    worker.execute_job(queue, reserved, _Analyzer(delay=0.6))
+    # Without heartbeats the lease would have lapsed halfway through the job
+    assert redis_client.zscore(queue.leases_name, job["id"]) > time.time()
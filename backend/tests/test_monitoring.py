@@ -0,0 +1,146 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+import joblib
+import numpy as np
+import requests
+from fastapi.testclient import TestClient
+from prometheus_client import CollectorRegistry, multiprocess
+from sklearn.ensemble import RandomForestClassifier
+
+from blockchain import data_fetcher as data_fetcher_module
+from blockchain.data_fetcher import DataFetcher
+from config import settings
+from ml.features import FEATURE_NAMES
+from ml.registry import MODEL_FILE
+from utils import monitoring
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_worker(metrics_dir, code):
+    """Run code in a fresh process that writes its metrics to metrics_dir"""
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(metrics_dir), ENVIRONMENT="development")
+    subprocess.run([sys.executable, "-c", textwrap.dedent(code)], cwd=BACKEND, env=env, check=True, timeout=120)
+
+def publish(root, version):
+    X = np.random.default_rng(0).normal(size=(200, len(FEATURE_NAMES)))
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, X[:, 0] > 0)
+    (root / version).mkdir(parents=True)
+    joblib.dump(model, str(root / version / MODEL_FILE))
+
+def scrape(metrics_dir):
+    """Aggregate every worker's files, as a multiprocess /metrics scrape does"""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=str(metrics_dir))
+    return registry
+
+def test_hot_swap_leaves_one_active_version_across_workers(tmp_path):
+    metrics_dir, root = tmp_path / "metrics", tmp_path / "models"
+    metrics_dir.mkdir()
+    publish(root, "v1")
+    swap = f"""
+        import shutil
+        from ml.registry import ModelRegistry
+        from utils.monitoring import MULTIPROCESS, _render_metrics
+
+        assert MULTIPROCESS
+        registry = ModelRegistry(root={str(root)!r})
+        registry.refresh()
+        if registry.version == "v1":
+            shutil.copytree({str(root / "v1")!r}, {str(root / "v2")!r})
+            assert registry.refresh()
+        assert registry.version == "v2"
+        assert b'model_active_version{{version="v1"}} 0.0' in _render_metrics()
+    """
+    # The first worker starts on v1 and swaps; the second starts on v2
+    run_worker(metrics_dir, swap)
+    run_worker(metrics_dir, swap)
+
+    registry = scrape(metrics_dir)
+    assert registry.get_sample_value("model_active_version", {"version": "v1"}) == 0
+    assert registry.get_sample_value("model_active_version", {"version": "v2"}) == 1
+
+def test_dead_worker_drops_live_gauges_but_keeps_counters(tmp_path):
+    run_worker(tmp_path, """
+        from utils.monitoring import MODEL_ACTIVE_VERSION, REQUEST_COUNT, mark_worker_dead
+
+        MODEL_ACTIVE_VERSION.labels(version="gone").set(1)
+        REQUEST_COUNT.labels(method="GET", endpoint="/health", status=200).inc(3)
+        mark_worker_dead()
+    """)
+    run_worker(tmp_path, """
+        from utils.monitoring import MODEL_ACTIVE_VERSION, REQUEST_COUNT
+
+        MODEL_ACTIVE_VERSION.labels(version="alive").set(1)
+        REQUEST_COUNT.labels(method="GET", endpoint="/health", status=200).inc(2)
+    """)
+
+    registry = scrape(tmp_path)
+    assert registry.get_sample_value("model_active_version", {"version": "gone"}) is None
+    assert registry.get_sample_value("model_active_version", {"version": "alive"}) == 1
+    labels = {"method": "GET", "endpoint": "/health", "status": "200"}
+    assert registry.get_sample_value("http_requests_total", labels) == 5
+
+def test_back_to_back_scrapes_share_one_rendering(monkeypatch):
+    renders = []
+    monkeypatch.setattr(monitoring, "_render_metrics", lambda: renders.append(1) or b"metric 1\n")
+    monkeypatch.setattr(monitoring, "_scrape_cache", (0.0, b""))
+
+    monkeypatch.setattr(settings, "metrics_scrape_cache_seconds", 60.0)
+    first, second = monitoring.get_metrics(), monitoring.get_metrics()
+    assert first.body == second.body == b"metric 1\n"
+    assert len(renders) == 1
+
+    monkeypatch.setattr(settings, "metrics_scrape_cache_seconds", 0.0)
+    monitoring.get_metrics()
+    assert len(renders) == 2
+
+def test_stale_snapshot_makes_the_worker_not_ready(redis_client, monkeypatch):
+    # Without the lifespan, no sampler thread replaces the snapshot set here
+    from main import app
+    client = TestClient(app)
+    checks = {"redis": {"status": "healthy"}}
+    monkeypatch.setattr(monitoring.health_sampler, "_snapshot", {"timestamp": time.time(), "checks": checks})
+    assert client.get("/health/ready").status_code == 200
+
+    stale = time.time() - settings.health_stale_after - 1
+    monkeypatch.setattr(monitoring.health_sampler, "_snapshot", {"timestamp": stale, "checks": checks})
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["reason"] == "health sample is stale"
+
+def test_upstream_status_follows_the_fetcher_calls(monkeypatch):
+    monkeypatch.setattr(monitoring, "upstream_monitor", monitoring.UpstreamMonitor())
+    monkeypatch.setattr(settings, "upstream_failure_threshold", 2)
+    configured = {"etherscan": True, "alchemy": False}
+    fetcher = DataFetcher()
+    fetcher.etherscan_api_key = "test"
+    fetcher.min_request_interval = 0
+    assert monitoring.upstream_monitor.status(configured)["etherscan"]["status"] == "unknown"
+
+    def unreachable(*args, **kwargs):
+        raise requests.exceptions.ConnectionError("connection refused")
+
+    monkeypatch.setattr(data_fetcher_module.requests, "get", unreachable)
+    statuses = []
+    for _ in range(2):
+        fetcher.fetch_from_etherscan("0x" + "11" * 20)
+        statuses.append(monitoring.upstream_monitor.status(configured)["etherscan"])
+    assert [status["status"] for status in statuses] == ["degraded", "failing"]
+    assert "connection refused" in statuses[-1]["last_error"]
+    # Unconfigured upstreams are not called, and say so
+    assert monitoring.upstream_monitor.status(configured)["alchemy"] == {"status": "not_configured"}
+
+    class OnePage:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"status": "1", "message": "OK", "result": [{"hash": "0x1", "blockNumber": "1"}]}
+
+    monkeypatch.setattr(data_fetcher_module.requests, "get", lambda *args, **kwargs: OnePage())
+    assert fetcher.fetch_from_etherscan("0x" + "11" * 20)["success"]
+    assert monitoring.upstream_monitor.status(configured)["etherscan"]["status"] == "healthy"
@@ -0,0 +1,48 @@
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from utils.rate_limiter import RateLimiter
+
+def make_request(ip="203.0.113.7", user_agent="pytest", forwarded_for=None):
+    headers = [(b"user-agent", user_agent.encode())]
+    if forwarded_for:
+        headers.append((b"x-forwarded-for", forwarded_for.encode()))
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "client": (ip, 12345)})
+
+def test_client_ids_are_stable_digests():
+    limiter = RateLimiter()
+    client_id = limiter._get_client_id(make_request())
+    assert client_id == hashlib.blake2b(b"203.0.113.7:pytest", digest_size=16).digest()
+    assert limiter._get_client_id(make_request()) == client_id
+    assert limiter._get_client_id(make_request(user_agent="curl")) != client_id
+    # Behind a proxy the forwarded address identifies the client
+    assert limiter._get_client_id(make_request(ip="10.0.0.1", forwarded_for="203.0.113.7")) == client_id
+
+def test_keys_embed_the_raw_digest_and_window(monkeypatch):
+    limiter = RateLimiter()
+    client_id = limiter._get_client_id(make_request())
+    monkeypatch.setattr("utils.rate_limiter.time.time", lambda: 7200.0 + 59)
+    minute_key, hour_key = limiter._get_rate_limit_keys(client_id)
+    assert minute_key == b"rate_limit:minute:" + client_id + b":120"
+    assert hour_key == b"rate_limit:hour:" + client_id + b":2"
+    assert limiter._get_rate_limit_keys(client_id) == (minute_key, hour_key)
+
+def test_requests_over_the_limit_are_rejected(redis_client):
+    limiter = RateLimiter()
+    limiter.minute_limit = 3
+    request = make_request()
+    for _ in range(3):
+        limiter.check_rate_limit(request)
+        limiter.increment_rate_limit(request)
+
+    info = limiter.get_rate_limit_info(request)
+    assert info["minute_count"] == 3
+    assert info["minute_remaining"] == 0
+    with pytest.raises(HTTPException) as excinfo:
+        limiter.check_rate_limit(request)
+    assert excinfo.value.status_code == 429
+    # Other clients have their own counters
+    assert limiter.check_rate_limit(make_request(ip="198.51.100.1"))["minute_count"] == 0
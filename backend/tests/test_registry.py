@@ -0,0 +1,70 @@
+import json
+import os
+
+import joblib
+import numpy as np
+import pytest
+from prometheus_client import REGISTRY
+from sklearn.ensemble import RandomForestClassifier
+
+from ml.features import FEATURE_NAMES
+from ml.registry import ACTIVE_FILE, META_FILE, MODEL_FILE, ModelRegistry
+
+def publish(root, version, random_state=0, feature_schema=None):
+    """Write a small model artifact the way training does"""
+    rng = np.random.default_rng(random_state)
+    X = rng.normal(size=(200, len(FEATURE_NAMES)))
+    y = (X[:, 0] > 0).astype(int)
+    model = RandomForestClassifier(n_estimators=5, random_state=random_state).fit(X, y)
+    version_dir = os.path.join(root, version)
+    os.makedirs(version_dir)
+    joblib.dump(model, os.path.join(version_dir, MODEL_FILE))
+    if feature_schema:
+        with open(os.path.join(version_dir, META_FILE), "w") as f:
+            json.dump({"feature_schema": feature_schema}, f)
+
+def active_gauge(version):
+    return REGISTRY.get_sample_value("model_active_version", {"version": version})
+
+def test_loads_lazily_and_hot_swaps(tmp_path):
+    root = str(tmp_path)
+    publish(root, "reg-test-1")
+    registry = ModelRegistry(root=root)
+    assert registry.version is None
+
+    loaded = registry.active()
+    assert loaded.version == "reg-test-1"
+    assert loaded.compiled is not None
+    assert active_gauge("reg-test-1") == 1
+
+    assert not registry.refresh()
+    publish(root, "reg-test-2", random_state=1)
+    assert registry.refresh()
+    assert registry.version == "reg-test-2"
+    # The previous snapshot stays usable for requests already holding it
+    assert loaded.model.predict(np.zeros((1, len(FEATURE_NAMES)))).shape == (1,)
+    assert active_gauge("reg-test-1") == 0
+    assert active_gauge("reg-test-2") == 1
+
+def test_pinned_version_wins(tmp_path):
+    root = str(tmp_path)
+    publish(root, "reg-pin-1")
+    publish(root, "reg-pin-2")
+    with open(os.path.join(root, ACTIVE_FILE), "w") as f:
+        f.write("reg-pin-1\n")
+    registry = ModelRegistry(root=root)
+    assert registry.target_version() == "reg-pin-1"
+    assert registry.refresh()
+    assert registry.version == "reg-pin-1"
+
+def test_failed_load_keeps_the_serving_model(tmp_path):
+    root = str(tmp_path)
+    publish(root, "reg-fail-1")
+    registry = ModelRegistry(root=root)
+    assert registry.refresh()
+
+    publish(root, "reg-fail-2", feature_schema="v0")
+    assert not registry.refresh()
+    assert registry.version == "reg-fail-1"
+    assert active_gauge("reg-fail-1") == 1
+    assert active_gauge("reg-fail-2") is None
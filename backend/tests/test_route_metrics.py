@@ -0,0 +1,48 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from blockchain.wallet_analyzer import WalletAnalyzer
+from main import app
+from ml import feature_store as feature_store_module
+from ml.feature_store import FeatureStore
+from utils import monitoring
+
+ADDRESS = "0x" + "ab" * 20
+
+@pytest.fixture
+def client(redis_client, tmp_path, monkeypatch):
+    # Analyses write features; keep them out of the source tree
+    monkeypatch.setattr(feature_store_module, "feature_store", FeatureStore(str(tmp_path / "features")))
+    with TestClient(app) as client:
+        yield client
+
+def _request_series(name: str) -> set:
+    return {
+        tuple(sorted(sample.labels.items()))
+        for metric in REGISTRY.collect()
+        for sample in metric.samples
+        if sample.name == name
+    }
+
+def test_per_address_paths_share_one_series(client, monkeypatch):
+    monkeypatch.setattr(WalletAnalyzer, "analyze_wallet", lambda self, address, *args, **kwargs: {
+        "wallet_address": address, "trust_score": 50, "summary": {}, "data_sources": {}
+    })
+    templates = []
+    template = monitoring.route_template
+    monkeypatch.setattr(monitoring, "route_template", lambda request: templates.append(template(request)) or templates[-1])
+
+    client.get(f"/api/wallet/{ADDRESS}")
+    series_before = len(_request_series("http_requests_total"))
+    for _ in range(100):
+        client.get(f"/api/wallet/0x{os.urandom(20).hex()}")
+        client.get(f"/api/no-such-route/{os.urandom(8).hex()}")
+
+    assert set(templates) == {"/api/wallet/{address}", monitoring.UNMATCHED_ENDPOINT}
+    # One new series at most: the unmatched 404s
+    assert len(_request_series("http_requests_total")) <= series_before + 1
+    endpoints = {dict(labels)["endpoint"] for labels in _request_series("http_requests_total")}
+    assert not any("0x" in endpoint or "no-such-route" in endpoint for endpoint in endpoints)
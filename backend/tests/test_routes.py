@@ -0,0 +1,148 @@
+import base64
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from api.pagination import encode_cursor
+from api.responses import store_wallet_response
+from blockchain import graph as graph_module
+from blockchain.aggregates import load_wallet_aggregate
+from blockchain.data_fetcher import DataFetcher
+from blockchain.wallet_analyzer import WalletAnalyzer
+from config import settings
+from main import app
+from ml import feature_store as feature_store_module
+from ml.feature_store import FeatureStore
+from utils.cache import _response_key, cache_transaction_data
+
+ADDRESS = "0x" + "ab" * 20
+
+@pytest.fixture
+def client(redis_client, tmp_path, monkeypatch):
+    # Analyses write features; keep them out of the source tree
+    monkeypatch.setattr(feature_store_module, "feature_store", FeatureStore(str(tmp_path / "features")))
+    with TestClient(app) as client:
+        yield client
+
+def test_cached_hit_has_the_same_shape_as_a_miss(client):
+    miss = client.get(f"/api/wallet/{ADDRESS}")
+    hit = client.get(f"/api/wallet/{ADDRESS}")
+    assert miss.status_code == hit.status_code == 200
+    assert miss.json()["cached"] is False and hit.json()["cached"] is True
+    assert miss.json().keys() == hit.json().keys()
+    assert "request_id" not in miss.json()
+    assert miss.headers["X-Request-ID"] != hit.headers["X-Request-ID"]
+
+def test_small_bodies_are_stored_once(client, redis_client):
+    result = {"wallet_address": ADDRESS, "trust_score": 70, "summary": {}, "data_sources": {}}
+    body = store_wallet_response(ADDRESS, "ethereum", result)
+    assert len(body) < settings.response_compress_min_bytes
+    assert [redis_client.exists(_response_key(ADDRESS, "ethereum", encoding)) for encoding in ("identity", "gzip", "zstd")] == [1, 0, 0]
+
+    # Clients accepting compression get the uncompressed body
+    response = client.get(f"/api/wallet/{ADDRESS}", headers={"Accept-Encoding": "zstd, gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json()["data"]["score"] == 70
+
+def test_large_bodies_replaced_by_small_drop_compressed_variants(client, redis_client, monkeypatch):
+    result = {"wallet_address": ADDRESS, "trust_score": 10, "summary": {}, "data_sources": {}}
+    monkeypatch.setattr(settings, "response_compress_min_bytes", 0)
+    store_wallet_response(ADDRESS, "ethereum", result)
+    assert redis_client.exists(_response_key(ADDRESS, "ethereum", "gzip"))
+
+    monkeypatch.setattr(settings, "response_compress_min_bytes", 1024)
+    store_wallet_response(ADDRESS, "ethereum", dict(result, trust_score=20))
+    assert not redis_client.exists(_response_key(ADDRESS, "ethereum", "gzip"))
+    response = client.get(f"/api/wallet/{ADDRESS}", headers={"Accept-Encoding": "gzip"})
+    assert response.json()["data"]["score"] == 20
+
+def _cursor(*fields) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(list(fields))).decode().rstrip("=")
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    _cursor("defi_transactions", -5, "0x1"),
+    _cursor("transactions", "-5", -1, "0x1"),
+    _cursor("transactions", -5, None, "0x1"),
+    _cursor("transactions", -5, -1, 7),
+    _cursor("transactions", True, -1, "0x1"),
+    _cursor("transactions", -5, -1),
+])
+def test_malformed_cursors_are_rejected_with_400(client, cursor):
+    transactions = [{"hash": f"0x{i}", "blockNumber": str(i), "transactionIndex": "0"} for i in range(5)]
+    cache_transaction_data(ADDRESS, "ethereum", {"success": True, "transactions": transactions})
+    response = client.get(f"/api/wallet/{ADDRESS}/transactions", params={"limit": 2, "cursor": cursor})
+    assert response.status_code == 400
+
+    valid = encode_cursor("transactions", (-4, 0, "0x4"))
+    response = client.get(f"/api/wallet/{ADDRESS}/transactions", params={"limit": 2, "cursor": valid})
+    assert [tx["hash"] for tx in response.json()["data"]["transactions"]] == ["0x3", "0x2"]
+
+def test_failed_projected_analysis_is_a_400(client, monkeypatch):
+    monkeypatch.setattr(WalletAnalyzer, "analyze_wallet", lambda self, *args, **kwargs: {"success": False, "error": "No data"})
+    response = client.get(f"/api/wallet/{ADDRESS}", params={"fields": "score"})
+    assert response.status_code == 400
+    assert client.get(f"/api/wallet/{ADDRESS}", params={"fields": "nope"}).status_code == 400
+
+@pytest.fixture
+def upstream_calls(tmp_path, monkeypatch):
+    """Upstream sources answered from memory, recording which ones were fetched"""
+    monkeypatch.setattr(settings, "graph_path", str(tmp_path / "graph"))
+    graph_module._graphs.clear()
+    graph_module._graphs_checked.clear()
+    calls = []
+    transactions = [{
+        "hash": f"0x{i:064x}", "blockNumber": str(1000 - i), "timeStamp": str(1_700_000_000 - i * 600),
+        "from": ADDRESS if i % 2 else f"0x{i + 1:040x}", "to": f"0x{i + 100:040x}" if i % 2 else ADDRESS,
+        "value": str((i + 1) * 10**16), "isError": "0", "input": "0x", "gasPrice": str(20 * 10**9)
+    } for i in range(10)]
+
+    def answer(source, data):
+        def fetch(self, *args, **kwargs):
+            calls.append(source)
+            return data
+        return fetch
+
+    monkeypatch.setattr(DataFetcher, "get_wallet_balance", answer("balance", {"success": True, "native_balance": "1.5"}))
+    monkeypatch.setattr(DataFetcher, "stream_from_etherscan", answer("etherscan", {"success": True, "transactions": transactions}))
+    monkeypatch.setattr(DataFetcher, "fetch_from_the_graph", answer("the_graph", {"success": True, "defi_transactions": []}))
+    monkeypatch.setattr(DataFetcher, "fetch_from_alchemy", answer("alchemy", {"success": True, "transfers": []}))
+    yield calls
+    graph_module._graphs.clear()
+    graph_module._graphs_checked.clear()
+
+def test_projected_analysis_fetches_only_what_the_fields_need(client, upstream_calls):
+    response = client.get(f"/api/wallet/{ADDRESS}", params={"fields": "address,transactionCount"})
+    assert response.json()["data"] == {"address": ADDRESS, "transactionCount": 10}
+    assert upstream_calls == ["etherscan"]
+
+    upstream_calls.clear()
+    response = client.get(f"/api/wallet/{ADDRESS}", params={"fields": "address"})
+    assert response.json()["data"] == {"address": ADDRESS}
+    assert upstream_calls == []
+
+    upstream_calls.clear()
+    response = client.get(f"/api/wallet/{ADDRESS}", params={"fields": "score"})
+    assert response.status_code == 200
+    assert sorted(upstream_calls) == ["balance", "etherscan", "the_graph"]
+
+def test_projected_analysis_leaves_shared_state_alone(client, upstream_calls):
+    assert client.get(f"/api/wallet/{ADDRESS}", params={"fields": "score,clusterId"}).status_code == 200
+    assert graph_module.get_transfer_graph("ethereum").live_transfers == 0
+    assert load_wallet_aggregate(ADDRESS, "ethereum") is None
+    assert not feature_store_module.feature_store.get_many("ethereum", [ADDRESS])[1].any()
+
+    # A full analysis records the wallet
+    assert client.get(f"/api/wallet/{ADDRESS}").status_code == 200
+    assert sorted(upstream_calls[-4:]) == ["alchemy", "balance", "etherscan", "the_graph"]
+    assert load_wallet_aggregate(ADDRESS, "ethereum").count == 10
+
+def test_streamed_analysis_warms_the_body_cache(client, redis_client):
+    with client.stream("GET", f"/api/wallet/{ADDRESS}/stream") as response:
+        events = "".join(response.iter_text())
+    assert "event: result" in events
+    assert redis_client.exists(_response_key(ADDRESS, "ethereum", "identity"))
+
+    hit = client.get(f"/api/wallet/{ADDRESS}")
+    assert hit.json()["cached"] is True
@@ -0,0 +1,26 @@
+import numpy as np
+from shap import TreeExplainer
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+
+from ml.shap_explain import explain_model_predictions
+
+def _model():
+    X, y = make_classification(n_samples=300, n_features=6, random_state=0)
+    return X, RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+
+def test_unversioned_call_keeps_all_classes():
+    X, model = _model()
+    names = [f"f{i}" for i in range(X.shape[1])]
+    shap_values, importance = explain_model_predictions(model, X[:20], names)
+    expected = TreeExplainer(model).shap_values(X[:20])
+    assert np.shape(shap_values) == np.shape(expected)
+    assert np.allclose(shap_values, expected)
+    assert np.allclose(importance, np.abs(expected).mean(axis=0))
+
+def test_versioned_call_returns_positive_class():
+    X, model = _model()
+    names = [f"f{i}" for i in range(X.shape[1])]
+    shap_values, importance = explain_model_predictions(model, X[:20], names, model_version="v1")
+    assert shap_values.shape == (20, X.shape[1])
+    assert importance.shape == (X.shape[1],)
@@ -0,0 +1,81 @@
+import time
+
+import orjson
+import pytest
+
+from config import settings
+from utils import tracing
+from utils.tracing import SpanExporter, span, traced
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch):
+    """An active exporter whose thread never starts, so finished spans stay queued"""
+    monkeypatch.setattr(settings, "tracing_enabled", True)
+    exporter = SpanExporter(path=str(tmp_path / "spans.jsonl"))
+    monkeypatch.setattr(exporter, "_ensure_started", lambda: None)
+    monkeypatch.setattr(tracing, "exporter", exporter)
+    return exporter
+
+def drain(exporter):
+    spans = []
+    while not exporter._queue.empty():
+        spans.append(exporter._queue.get_nowait())
+    return {otlp_span["name"]: otlp_span for otlp_span in spans}
+
+def test_nested_spans_share_a_trace(exported):
+    @traced("fetch.etherscan")
+    def fetch():
+        pass
+
+    with span("analysis", network="ethereum"):
+        with span("risk") as risk:
+            risk.set_attribute("transactions", 3)
+        fetch()
+    with span("other"):
+        pass
+
+    spans = drain(exported)
+    root = spans["analysis"]
+    assert root["parentSpanId"] == ""
+    for name in ("risk", "fetch.etherscan"):
+        assert spans[name]["traceId"] == root["traceId"]
+        assert spans[name]["parentSpanId"] == root["spanId"]
+    assert spans["other"]["traceId"] != root["traceId"]
+    assert spans["risk"]["attributes"] == [{"key": "transactions", "value": {"intValue": "3"}}]
+    assert root["attributes"] == [{"key": "network", "value": {"stringValue": "ethereum"}}]
+
+    # Exported batches are OTLP/JSON lines
+    exported.export(list(spans.values()))
+    with open(exported.path, "rb") as f:
+        payload = orjson.loads(f.readline())
+    assert len(payload["resourceSpans"][0]["scopeSpans"][0]["spans"]) == 4
+
+def test_failed_stage_is_marked_as_an_error(exported):
+    with pytest.raises(ValueError):
+        with span("risk"):
+            raise ValueError("bad data")
+    status = drain(exported)["risk"]["status"]
+    assert status == {"code": tracing.STATUS_ERROR, "message": "bad data"}
+
+def test_disabled_tracing_returns_the_shared_noop(exported, monkeypatch):
+    monkeypatch.setattr(settings, "tracing_enabled", False)
+    first, second = span("risk"), span("patterns", network="ethereum")
+    assert first is second is tracing._NOOP_SPAN
+    with first as active:
+        active.set_attribute("transactions", 3)
+    assert exported._queue.empty()
+
+def test_full_queue_drops_spans_without_blocking(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "tracing_enabled", True)
+    monkeypatch.setattr(settings, "tracing_queue_size", 2)
+    exporter = SpanExporter(path=str(tmp_path / "spans.jsonl"))
+    monkeypatch.setattr(exporter, "_ensure_started", lambda: None)
+    monkeypatch.setattr(tracing, "exporter", exporter)
+
+    started = time.perf_counter()
+    for _ in range(5):
+        with span("risk"):
+            pass
+    assert time.perf_counter() - started < 1.0
+    assert exporter._queue.qsize() == 2
+    assert exporter.dropped == 3
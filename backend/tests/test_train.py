@@ -0,0 +1,38 @@
+import numpy as np
+
+from ml.features import FEATURE_NAMES
+from ml.train import train_streaming_model
+
+def _class_sorted_chunks(n_chunks=12, chunk_size=500, seed=0):
+    """All-negative chunks first, then mixed chunks: the worst case for buffering"""
+    rng = np.random.default_rng(seed)
+    n_features = len(FEATURE_NAMES)
+    for i in range(n_chunks):
+        X = rng.normal(size=(chunk_size, n_features)).astype(np.float32)
+        if i < n_chunks - 2:
+            y = np.zeros(chunk_size, dtype=np.int64)
+        else:
+            y = (X[:, 0] > 0).astype(np.int64)
+        yield X, y
+
+def test_class_sorted_input_buffers_at_most_the_limit():
+    model, report = train_streaming_model(
+        _class_sorted_chunks, trees_per_chunk=2, n_jobs=1, test_fraction=0.0, leading_limit=800
+    )
+    leading_rows = 10 * 500
+    assert report["leading_rows_dropped"] == leading_rows - 800
+    assert report["classes"] == [0, 1]
+    # Only chunks after the second class appears add trees
+    assert model.n_estimators == 2 * 2
+
+def test_mixed_input_drops_nothing():
+    def chunks():
+        rng = np.random.default_rng(1)
+        for _ in range(3):
+            X = rng.normal(size=(300, len(FEATURE_NAMES))).astype(np.float32)
+            yield X, (X[:, 0] > 0).astype(np.int64)
+
+    model, report = train_streaming_model(chunks, trees_per_chunk=2, n_jobs=1, test_fraction=0.2)
+    assert report["leading_rows_dropped"] == 0
+    assert model.n_estimators == 6
+    assert "report" in report["metrics"]
@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+
+from blockchain import data_fetcher as data_fetcher_module
+from blockchain.aggregates import WalletAggregate
+from blockchain.data_fetcher import DataFetcher
+from blockchain.transaction_sketch import HistoryStream, TransactionSketch
+from config import settings
+from ml.features import FEATURE_NAMES, extract_feature_matrix, features_from_sketch
+
+OWNER = "0x" + "11" * 20
+
+def _history(n: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    return [{
+        "hash": f"0x{i:064x}",
+        "blockNumber": str(1_000_000 - i // 3),
+        "timeStamp": str(1_700_000_000 - i * 40),
+        "from": OWNER if i % 3 else f"0x{int(rng.integers(1, 500)):040x}",
+        "to": f"0x{int(rng.integers(1, 500)):040x}" if i % 3 else OWNER,
+        "value": str(int(rng.integers(0, 5 * 10**18))),
+        "isError": "1" if i % 17 == 0 else "0",
+        "input": "0xa9059cbb" if i % 5 == 0 else "0x",
+        "gasPrice": str(int(rng.integers(10**9, 10**11)))
+    } for i in range(n)]
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Force many chunks on a small history
+    monkeypatch.setattr(settings, "sketch_max_memory_mb", 1)
+    monkeypatch.setattr("blockchain.transaction_sketch.MIN_CHUNK_SIZE", 500)
+    monkeypatch.setattr("blockchain.transaction_sketch.BYTES_PER_TRANSACTION", 1024 * 1024 // 500)
+
+def test_sketch_features_match_exact_features(small_chunks):
+    transactions = _history(3000)
+    exact = extract_feature_matrix([OWNER], {OWNER: transactions}, {OWNER: 2.5})[0]
+    sketched = features_from_sketch(TransactionSketch.from_transactions(transactions, OWNER), 2.5)[0]
+
+    approximate = [FEATURE_NAMES.index("unique_to"), FEATURE_NAMES.index("unique_from")]
+    exact_columns = np.setdiff1d(np.arange(len(FEATURE_NAMES)), approximate)
+    np.testing.assert_allclose(sketched[exact_columns], exact[exact_columns], rtol=1e-9)
+    np.testing.assert_allclose(sketched[approximate], exact[approximate], rtol=0.1)
+
+def test_chunked_aggregate_update_matches_single_batch(small_chunks):
+    transactions = _history(3000)
+    chunked = WalletAggregate(OWNER)
+    assert chunked.update(transactions) == 3000
+    assert chunked.update(transactions) == 0
+
+    sketch = TransactionSketch.from_transactions(transactions, OWNER)
+    assert chunked.count == sketch.count
+    assert chunked.outgoing == sketch.outgoing
+    assert chunked.max_value == sketch.max_value
+    assert chunked.std == pytest.approx(sketch.std)
+
+class Response:
+    def __init__(self, result):
+        self.result = result
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"status": "1" if self.result else "0", "message": "OK", "result": self.result}
+
+def serve_etherscan(monkeypatch, transactions):
+    """Answer txlist requests from transactions (newest first); returns the params seen"""
+    requests_seen = []
+
+    def get(url, params, timeout):
+        requests_seen.append(params)
+        matching = [tx for tx in transactions if int(tx["blockNumber"]) <= params["endblock"]]
+        return Response(matching[:params["offset"]])
+
+    monkeypatch.setattr(data_fetcher_module.requests, "get", get)
+    return requests_seen
+
+def test_etherscan_fetch_pages_past_the_query_cap(monkeypatch):
+    monkeypatch.setattr(settings, "etherscan_page_size", 100)
+    transactions = _history(950)
+    requests_seen = serve_etherscan(monkeypatch, transactions)
+    fetcher = DataFetcher()
+    fetcher.etherscan_api_key = "test"
+    fetcher.min_request_interval = 0
+
+    result = fetcher.fetch_from_etherscan(OWNER)
+    assert result["success"]
+    assert [tx["hash"] for tx in result["transactions"]] == [tx["hash"] for tx in transactions]
+    assert len(requests_seen) > 950 // 100
+
+def test_one_pass_unusual_values_match_the_exact_count(small_chunks):
+    transactions = _history(3000)
+    for i in range(0, 3000, 97):
+        transactions[i]["value"] = str(int(transactions[i]["value"]) * 20)
+    sketch = TransactionSketch.from_transactions(transactions, OWNER)
+
+    values = np.array([float(tx["value"]) for tx in transactions])
+    threshold = values.mean() + 2 * values.std(ddof=1)
+    exact = int((values > threshold).sum())
+    assert abs(sketch.unusual_values - exact) <= sketch.values.rank_error * len(values)
+    assert sketch.unusual_examples
+    assert all(float(tx["value"]) > threshold for tx in sketch.unusual_examples)
+    assert float(sketch.unusual_examples[0]["value"]) == values.max()
+
+def test_long_histories_are_sketched_page_by_page(monkeypatch, small_chunks):
+    monkeypatch.setattr(settings, "etherscan_page_size", 100)
+    monkeypatch.setattr(settings, "sketch_threshold", 250)
+    transactions = _history(950)
+    serve_etherscan(monkeypatch, transactions)
+    fetcher = DataFetcher()
+    fetcher.etherscan_api_key = "test"
+    fetcher.min_request_interval = 0
+
+    chunks, held = [], []
+    history = HistoryStream(OWNER, on_chunk=lambda chunk: chunks.append(len(chunk)))
+    original_add = history.add
+    history.add = lambda page: (original_add(page), held.append(len(history.transactions)))
+    result = fetcher.stream_from_etherscan(OWNER, history)
+
+    assert result["success"] and result["sketched"]
+    assert result["count"] == 950 and result["transactions"] == []
+    # Pages were kept only until the threshold was crossed, then recorded and dropped
+    assert max(held) <= 250 and held[-1] == 0
+    assert sum(chunks) == 950
+    exact = TransactionSketch.from_transactions(transactions, OWNER)
+    assert history.sketch.count == exact.count
+    assert history.sketch.std == pytest.approx(exact.std)
+    assert history.sketch.pattern_summary()["total_value_eth"] == pytest.approx(exact.pattern_summary()["total_value_eth"])
+
+def test_short_histories_are_kept(monkeypatch):
+    monkeypatch.setattr(settings, "etherscan_page_size", 100)
+    transactions = _history(150)
+    serve_etherscan(monkeypatch, transactions)
+    fetcher = DataFetcher()
+    fetcher.etherscan_api_key = "test"
+    fetcher.min_request_interval = 0
+
+    history = HistoryStream(OWNER)
+    result = fetcher.stream_from_etherscan(OWNER, history)
+    assert not result["sketched"] and history.sketch is None
+    assert [tx["hash"] for tx in result["transactions"]] == [tx["hash"] for tx in transactions]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+
+from ml.tree_inference import CompiledForest
+
+@pytest.fixture(scope="module")
+def fitted():
+    X, y = make_classification(n_samples=3000, n_features=14, n_informative=8, random_state=42)
+    model = RandomForestClassifier(n_estimators=50, random_state=42).fit(X, y)
+    return X, model
+
+def test_parity_with_sklearn(fitted):
+    X, model = fitted
+    forest = CompiledForest.from_sklearn(model)
+    X_check = X[:2000]
+    assert np.allclose(forest.predict_proba(X_check), model.predict_proba(X_check))
+    assert (forest.predict(X_check) == model.predict(X_check)).all()
+
+def test_single_row_parity(fitted):
+    X, model = fitted
+    forest = CompiledForest.from_sklearn(model)
+    assert np.allclose(forest.predict_proba(X[0]), model.predict_proba(X[:1]))
+
+def test_saved_forest_parity(fitted, tmp_path):
+    X, model = fitted
+    CompiledForest.from_sklearn(model).save(str(tmp_path / "compiled"))
+    forest = CompiledForest.load(str(tmp_path / "compiled"))
+    assert np.allclose(forest.predict_proba(X[:500]), model.predict_proba(X[:500]))
+
+def test_large_batches_use_fallback(fitted):
+    X, model = fitted
+
+    class Recorder:
+        calls = 0
+
+        def predict_proba(self, batch):
+            Recorder.calls += 1
+            return model.predict_proba(batch)
+
+    forest = CompiledForest.from_sklearn(model).with_fallback(Recorder(), max_batch=64)
+    forest.predict_proba(X[:64])
+    assert Recorder.calls == 0
+    assert np.allclose(forest.predict_proba(X[:65]), model.predict_proba(X[:65]))
+    assert Recorder.calls == 1
+
+def test_feature_count_checked(fitted):
+    _, model = fitted
+    forest = CompiledForest.from_sklearn(model)
+    with pytest.raises(ValueError):
+        forest.predict_proba(np.zeros((1, 3)))
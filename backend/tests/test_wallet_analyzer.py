@@ -0,0 +1,103 @@
+import pytest
+
+from blockchain import graph as graph_module
+from blockchain.aggregates import load_wallet_aggregate, update_wallet_aggregate
+from blockchain.data_fetcher import DataFetcher
+from blockchain.wallet_analyzer import WalletAnalyzer
+from config import settings
+from ml import feature_store as feature_store_module
+from ml.feature_store import FeatureStore
+
+OWNER = "0x" + "11" * 20
+
+def _history(n, start_block=1000):
+    return [{
+        "hash": f"0x{start_block + i:064x}",
+        "blockNumber": str(start_block + i),
+        "timeStamp": str(1_700_000_000 + i * 600),
+        "from": OWNER if i % 2 else f"0x{i % 7 + 1:040x}",
+        "to": f"0x{i % 5 + 100:040x}" if i % 2 else OWNER,
+        "value": str((i + 1) * 10**16),
+        "isError": "0",
+        "input": "0x",
+        "gasPrice": str(20 * 10**9)
+    } for i in range(n)]
+
+class FakeFetcher(DataFetcher):
+    """Upstream sources answered from memory, counting the calls"""
+
+    def __init__(self, transactions, page_size=1000):
+        super().__init__()
+        self.etherscan_api_key = "test"
+        self.transactions = transactions
+        self.page_size = page_size
+        self.calls = []
+
+    def get_wallet_balance(self, address, network="ethereum"):
+        self.calls.append("balance")
+        return {"success": True, "native_balance": 1.5}
+
+    def iter_etherscan_pages(self, address, start_block=0, end_block=99999999):
+        self.calls.append("etherscan")
+        for start in range(0, len(self.transactions), self.page_size):
+            yield self.transactions[start:start + self.page_size]
+
+    def fetch_from_the_graph(self, address):
+        self.calls.append("the_graph")
+        return {"success": True, "defi_transactions": []}
+
+    def fetch_from_alchemy(self, address):
+        self.calls.append("alchemy")
+        return {"success": True, "transfers": []}
+
+@pytest.fixture
+def isolated_state(redis_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "graph_path", str(tmp_path / "graph"))
+    graph_module._graphs.clear()
+    graph_module._graphs_checked.clear()
+    store = FeatureStore(str(tmp_path / "features"))
+    monkeypatch.setattr(feature_store_module, "feature_store", store)
+    yield store
+    graph_module._graphs.clear()
+    graph_module._graphs_checked.clear()
+
+def test_analysis_without_recording_leaves_shared_state_alone(isolated_state):
+    result = WalletAnalyzer(data_fetcher=FakeFetcher(_history(20)), record=False).analyze_wallet(OWNER)
+    assert result["success"] and result["risk_score"]["risk_score"] is not None
+
+    assert graph_module.get_transfer_graph("ethereum").live_transfers == 0
+    assert load_wallet_aggregate(OWNER, "ethereum") is None
+    assert not isolated_state.get_many("ethereum", [OWNER])[1].any()
+
+def test_recording_analysis_updates_shared_state(isolated_state):
+    WalletAnalyzer(data_fetcher=FakeFetcher(_history(20))).analyze_wallet(OWNER)
+
+    assert graph_module.get_transfer_graph("ethereum").live_transfers == 20
+    assert load_wallet_aggregate(OWNER, "ethereum").count == 20
+    assert isolated_state.get_many("ethereum", [OWNER])[1].all()
+
+def test_risk_is_exact_when_the_history_is_in_hand(isolated_state):
+    # An aggregate built from other, older activity must not stand in for the fetched history
+    update_wallet_aggregate(OWNER, "ethereum", _history(50, start_block=1))
+    result = WalletAnalyzer(data_fetcher=FakeFetcher(_history(20))).analyze_wallet(OWNER)
+
+    patterns = result["risk_score"]["pattern_analysis"]
+    assert patterns == DataFetcher().analyze_transaction_patterns(_history(20))
+    assert "unique_count_relative_error" not in patterns
+    assert load_wallet_aggregate(OWNER, "ethereum").count == 70
+
+def test_long_histories_are_streamed_without_keeping_transactions(isolated_state, monkeypatch):
+    monkeypatch.setattr(settings, "sketch_threshold", 100)
+    # Etherscan returns the newest transactions first
+    history = _history(1000)[::-1]
+    result = WalletAnalyzer(data_fetcher=FakeFetcher(history, page_size=90)).analyze_wallet(OWNER)
+    assert result["success"]
+
+    etherscan = result["data_sources"]["etherscan"]
+    assert etherscan["sketched"] and etherscan["transactions"] == []
+    assert result["summary"]["total_transactions"] == 1000
+    assert result["risk_score"]["pattern_analysis"]["approximate"]
+
+    assert graph_module.get_transfer_graph("ethereum").live_transfers == 1000
+    assert load_wallet_aggregate(OWNER, "ethereum").count == 1000
+    assert isolated_state.get_many("ethereum", [OWNER])[1].all()
@@ -0,0 +1,35 @@
+from prometheus_client import REGISTRY
+
+from jobs.warmer import LEADER_KEY, CacheWarmer
+
+class _Analyzer:
+    def analyze_wallet(self, address, network):
+        return {"wallet_address": address, "network": network, "success": True}
+
+def _warmer(redis_client):
+    return CacheWarmer(["ethereum"], analyzer=_Analyzer(), redis_client=redis_client)
+
+def test_only_the_holder_renews_or_releases_the_lock(redis_client):
+    first, second = _warmer(redis_client), _warmer(redis_client)
+    assert first.acquire_leadership()
+    assert not second.acquire_leadership()
+    assert first.acquire_leadership()
+    assert redis_client.ttl(LEADER_KEY) == first.lock_ttl
+
+    # The lock lapses and the other replica takes it over
+    redis_client.delete(LEADER_KEY)
+    assert second.acquire_leadership()
+    redis_client.expire(LEADER_KEY, 5)
+    assert not first.acquire_leadership()
+    assert redis_client.ttl(LEADER_KEY) == 5
+
+    first.release_leadership()
+    assert redis_client.get(LEADER_KEY).decode() == second.token
+    second.release_leadership()
+    assert redis_client.get(LEADER_KEY) is None
+
+def test_warming_is_counted(redis_client):
+    warmer = _warmer(redis_client)
+    before = REGISTRY.get_sample_value("cache_warmed_total", {"network": "ethereum"}) or 0.0
+    assert warmer.warm("0x" + "ab" * 20, "ethereum")
+    assert REGISTRY.get_sample_value("cache_warmed_total", {"network": "ethereum"}) == before + 1
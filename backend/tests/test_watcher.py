@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from config import settings
+from jobs.watcher import TRANSFER_TOPIC, BlockWatcher
+from utils.cache import get_tracked_wallets, track_wallet
+
+NETWORK = "watchertest"
+ALICE = "0x" + "a1" * 20
+BOB = "0x" + "b2" * 20
+
+class FakeChain:
+    """Block source answering the watcher's JSON-RPC calls from in-memory blocks"""
+
+    def __init__(self):
+        self.blocks = {}
+        self.logs = {}
+        self.requested = []
+
+    def set_block(self, number, senders=(), token_receivers=()):
+        self.blocks[number] = {
+            "number": hex(number),
+            "transactions": [{"from": sender, "to": "0x" + "00" * 19 + "01"} for sender in senders]
+        }
+        self.logs[number] = [
+            {"topics": [TRANSFER_TOPIC, "0x" + "00" * 12 + "99" * 20, "0x" + "00" * 12 + receiver[2:]]}
+            for receiver in token_receivers
+        ]
+
+    @property
+    def head(self):
+        return max(self.blocks)
+
+    async def call(self, method, params=None):
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getBlockByNumber":
+            number = int(params[0], 16)
+            self.requested.append(number)
+            return self.blocks.get(number)
+        if method == "eth_getLogs":
+            return self.logs.get(int(params[0]["fromBlock"], 16), [])
+        raise AssertionError(f"unexpected RPC call {method}")
+
+    async def close(self):
+        pass
+
+def _blocks_processed():
+    return REGISTRY.get_sample_value("watcher_blocks_processed_total", {"network": NETWORK}) or 0.0
+
+def _invalidated():
+    return REGISTRY.get_sample_value(
+        "watcher_wallets_invalidated_total", {"network": NETWORK, "mode": "invalidate"}
+    ) or 0.0
+
+@pytest.fixture
+def chain(redis_client):
+    chain = FakeChain()
+    for number in range(100, 103):
+        chain.set_block(number)
+    return chain
+
+@pytest.fixture
+def watcher(chain):
+    watcher = BlockWatcher(NETWORK, rpc_url="http://unused", ws_url="", mode="invalidate")
+    watcher.rpc = chain
+    watcher.tracked.refresh_interval = 0
+    return watcher
+
+def test_follows_head_and_invalidates_touched_wallets(chain, watcher):
+    track_wallet(ALICE, NETWORK)
+    track_wallet(BOB, NETWORK)
+    processed, invalidated = _blocks_processed(), _invalidated()
+
+    # The first head seen is scanned alone; earlier history is not replayed
+    asyncio.run(watcher.advance_to(chain.head))
+    assert chain.requested == [102]
+
+    chain.set_block(103, senders=[ALICE])
+    chain.set_block(104, token_receivers=[BOB])
+    asyncio.run(watcher.advance_to(chain.head))
+    assert chain.requested == [102, 103, 104]
+    assert get_tracked_wallets(NETWORK) == set()
+
+    assert _blocks_processed() - processed == 3
+    assert _invalidated() - invalidated == 2
+
+def test_reorg_rescans_the_replaced_head(chain, watcher):
+    track_wallet(ALICE, NETWORK)
+    asyncio.run(watcher.advance_to(chain.head))
+
+    # Block 102 is replaced by one touching ALICE, at the same height
+    chain.set_block(102, senders=[ALICE])
+    asyncio.run(watcher.advance_to(102))
+    assert chain.requested == [102, 102]
+    assert get_tracked_wallets(NETWORK) == set()
+
+    # A shorter chain wins: its head is rescanned rather than ignored
+    track_wallet(BOB, NETWORK)
+    chain.set_block(101, token_receivers=[BOB])
+    asyncio.run(watcher.advance_to(101))
+    assert chain.requested == [102, 102, 101]
+    assert watcher.last_block == 101
+    assert get_tracked_wallets(NETWORK) == set()
+
+def test_lag_beyond_max_catchup_skips_to_recent_blocks(chain, watcher, monkeypatch):
+    monkeypatch.setattr(settings, "watcher_max_catchup", 4)
+    asyncio.run(watcher.advance_to(chain.head))
+    for number in range(103, 120):
+        chain.set_block(number)
+    processed = _blocks_processed()
+
+    asyncio.run(watcher.advance_to(chain.head))
+    assert chain.requested == [102, 116, 117, 118, 119]
+    assert watcher.last_block == 119
+    assert _blocks_processed() - processed == 4
+
+def test_block_not_yet_available_is_retried(chain, watcher):
+    asyncio.run(watcher.advance_to(chain.head))
+    # The node reports a head it cannot serve yet
+    with pytest.raises(Exception):
+        asyncio.run(watcher.advance_to(103))
+    assert watcher.last_block == 102
+
+    chain.set_block(103)
+    asyncio.run(watcher.advance_to(103))
+    assert watcher.last_block == 103
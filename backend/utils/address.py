@@ -0,0 +1,113 @@
+"""Canonical wallet addresses.
+
+Clients send addresses in any case (lowercase, checksummed, mixed). Everything
+that keys on an address — caches, stores, in-memory indexes — goes through this
+module, so the same wallet always maps to the same key. Validation and checksum
+results are memoized, since hot wallets are looked up over and over.
+"""
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+import numpy as np
+from web3 import Web3
+
+from config import settings
+
+ADDRESS_BYTES = 20
+
+@lru_cache(maxsize=settings.address_cache_size)
+def is_valid_address(address: str) -> bool:
+    """Whether address is a well-formed 20-byte hex address"""
+    return Web3.is_address(address)
+
+@lru_cache(maxsize=settings.address_cache_size)
+def to_checksum(address: str) -> str:
+    """EIP-55 checksummed form, for display and upstream APIs"""
+    return Web3.to_checksum_address(canonical_address(address))
+
+@lru_cache(maxsize=settings.address_cache_size)
+def canonical_address(address: str) -> str:
+    """Lowercase 0x-prefixed form; raises ValueError for invalid addresses"""
+    if not is_valid_address(address):
+        raise ValueError(f"Invalid wallet address: {address!r}")
+    address = address.lower()
+    return address if address.startswith("0x") else f"0x{address}"
+
+@lru_cache(maxsize=settings.address_cache_size)
+def address_bytes(address: str) -> bytes:
+    """The 20 raw address bytes, a compact key for Redis and on-disk indexes"""
+    return bytes.fromhex(canonical_address(address)[2:])
+
+def address_from_bytes(raw: bytes) -> str:
+    """Canonical string form of 20 raw address bytes"""
+    if len(raw) != ADDRESS_BYTES:
+        raise ValueError(f"Expected {ADDRESS_BYTES} address bytes, got {len(raw)}")
+    return f"0x{raw.hex()}"
+
+def address_key(prefix: str, *parts: str, address: str) -> bytes:
+    """Binary cache key: prefix and parts separated by ':', then the raw address bytes"""
+    return ":".join((prefix, *parts, "")).encode() + address_bytes(address)
+
+def addresses_to_array(addresses: Iterable[str]) -> np.ndarray:
+    """Fixed-width S20 array of raw address bytes, for sorted or memory-mapped indexes"""
+    return np.array([address_bytes(address) for address in addresses], dtype=f"S{ADDRESS_BYTES}")
+
+class AddressInterner:
+    """
+    Maps addresses to dense integer ids and back.
+
+    Ids are assigned in first-seen order and never reused, so they can index
+    NumPy arrays and sparse matrices directly instead of carrying 42-character
+    strings through every row.
+    """
+
+    def __init__(self):
+        self._ids: Dict[bytes, int] = {}
+        self._addresses: List[bytes] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._addresses)
+
+    def __contains__(self, address: str) -> bool:
+        return address_bytes(address) in self._ids
+
+    def intern(self, address: str) -> int:
+        """The id for address, assigning the next id if it is new"""
+        key = address_bytes(address)
+        address_id = self._ids.get(key)
+        if address_id is None:
+            with self._lock:
+                address_id = self._ids.get(key)
+                if address_id is None:
+                    address_id = len(self._addresses)
+                    self._addresses.append(key)
+                    self._ids[key] = address_id
+        return address_id
+
+    def intern_many(self, addresses: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.intern(address) for address in addresses), dtype=np.int64)
+
+    def lookup(self, address: str) -> int:
+        """The id for a known address, or -1"""
+        return self._ids.get(address_bytes(address), -1)
+
+    def address(self, address_id: int) -> str:
+        return address_from_bytes(self._addresses[address_id])
+
+    def raw(self, ids: np.ndarray) -> np.ndarray:
+        """Raw addresses for ids, as an S20 array"""
+        return np.array([self._addresses[i] for i in ids], dtype=f"S{ADDRESS_BYTES}")
+
+    def to_array(self) -> np.ndarray:
+        """Raw addresses in id order, as an S20 array"""
+        return np.array(self._addresses, dtype=f"S{ADDRESS_BYTES}")
+
+    @classmethod
+    def from_array(cls, raw: np.ndarray) -> "AddressInterner":
+        """Rebuild an interner from to_array() output, preserving ids"""
+        interner = cls()
+        interner._addresses = [bytes(key) for key in raw]
+        interner._ids = {key: i for i, key in enumerate(interner._addresses)}
+        return interner
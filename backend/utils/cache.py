@@ -1,60 +1,206 @@
 import redis
 import json
 import pickle
-from typing import Any, Optional, Union
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Union
 from datetime import timedelta
 from config import settings
+from utils.address import address_bytes, address_key
 from utils.logger import get_logger
+from utils.monitoring import (
+    CACHE_ERRORS, CACHE_KEYS, CACHE_MEMORY_BYTES, CACHE_OPERATION_DURATION, CACHE_PAYLOAD_BYTES,
+    system_monitor
+)
+from utils.tracing import traced
 
 logger = get_logger(__name__)
 
+# Keys are str, or bytes for keys that embed raw 20-byte addresses
+KeyT = Union[str, bytes]
+
+# Content encodings cached response bodies are stored in
+RESPONSE_ENCODINGS = ("identity", "gzip", "zstd")
+
+# Key prefixes reported as their own namespace; anything else is "other"
+CACHE_NAMESPACES = frozenset({
+    "wallet_analysis", "wallet_response", "transactions", "defi_activity", "rate_limit",
+    "ml_score", "aggregate", "tracked_wallets", "hotkeys", "job", "jobs"
+})
+
+def key_namespace(key: KeyT) -> str:
+    """Metric namespace of a key: its prefix before the first ':'"""
+    if isinstance(key, bytes):
+        prefix = key.split(b":", 1)[0].decode("ascii", "replace")
+    else:
+        prefix = key.split(":", 1)[0]
+    return prefix if prefix in CACHE_NAMESPACES else "other"
+
+def _observe(namespace: str, operation: str, started: float, payload: Optional[bytes] = None):
+    CACHE_OPERATION_DURATION.labels(namespace=namespace, operation=operation).observe(time.perf_counter() - started)
+    if payload is not None:
+        CACHE_PAYLOAD_BYTES.labels(namespace=namespace, operation=operation).observe(len(payload))
+
 class RedisCache:
     def __init__(self):
         self.redis_client = redis.from_url(settings.redis_url)
         self.default_ttl = settings.cache_ttl
     
-    def get(self, key: str) -> Optional[Any]:
-        """Get value from cache"""
+    def _get_bytes(self, key: KeyT) -> Optional[bytes]:
+        """GET with hit/miss, latency and size recorded under the key's namespace"""
+        namespace = key_namespace(key)
+        started = time.perf_counter()
         try:
             value = self.redis_client.get(key)
-            if value:
-                return pickle.loads(value)
+        except Exception as e:
+            CACHE_ERRORS.labels(namespace=namespace, operation="get").inc()
+            logger.error("Cache get error", key=key, error=str(e))
+            return None
+        _observe(namespace, "get", started, value)
+        if value is None:
+            system_monitor.record_cache_miss(namespace)
+        else:
+            system_monitor.record_cache_hit(namespace)
+        return value
+    
+    @traced("cache.get")
+    def get(self, key: KeyT) -> Optional[Any]:
+        """Get value from cache"""
+        value = self._get_bytes(key)
+        if not value:
             return None
+        try:
+            return pickle.loads(value)
         except Exception as e:
+            CACHE_ERRORS.labels(namespace=key_namespace(key), operation="get").inc()
             logger.error("Cache get error", key=key, error=str(e))
             return None
     
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+    @traced("cache.set")
+    def set(self, key: KeyT, value: Any, ttl: Optional[int] = None) -> bool:
         """Set value in cache with TTL"""
+        namespace = key_namespace(key)
+        started = time.perf_counter()
         try:
             serialized_value = pickle.dumps(value)
             ttl = ttl or self.default_ttl
-            return self.redis_client.setex(key, ttl, serialized_value)
+            stored = self.redis_client.setex(key, ttl, serialized_value)
+            _observe(namespace, "set", started, serialized_value)
+            return stored
         except Exception as e:
+            CACHE_ERRORS.labels(namespace=namespace, operation="set").inc()
             logger.error("Cache set error", key=key, error=str(e))
             return False
     
-    def delete(self, key: str) -> bool:
-        """Delete key from cache"""
+    @traced("cache.get")
+    def get_raw(self, key: KeyT) -> Optional[bytes]:
+        """Get stored bytes as-is, without unpickling"""
+        return self._get_bytes(key)
+    
+    @traced("cache.set")
+    def set_many_raw(self, values: Dict[KeyT, bytes], ttl: Optional[int] = None, delete: Iterable[KeyT] = ()) -> bool:
+        """Store several byte values as-is in one round trip, deleting the keys in delete"""
+        if not values:
+            return True
+        namespace = key_namespace(next(iter(values)))
+        started = time.perf_counter()
+        try:
+            ttl = ttl or self.default_ttl
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.setex(key, ttl, value)
+            delete = list(delete)
+            if delete:
+                pipe.delete(*delete)
+            stored = all(pipe.execute()[:len(values)])
+        except Exception as e:
+            CACHE_ERRORS.labels(namespace=namespace, operation="set").inc()
+            logger.error("Cache set error", keys=len(values), error=str(e))
+            return False
+        _observe(namespace, "set", started)
+        for value in values.values():
+            CACHE_PAYLOAD_BYTES.labels(namespace=namespace, operation="set").observe(len(value))
+        return stored
+    
+    @traced("cache.get")
+    def get_first_raw(self, *keys: KeyT) -> Optional[bytes]:
+        """Stored bytes of the first key present, in one round trip (MGET); one hit or miss is recorded"""
+        namespace = key_namespace(keys[0])
+        started = time.perf_counter()
+        try:
+            values = self.redis_client.mget(keys)
+        except Exception as e:
+            CACHE_ERRORS.labels(namespace=namespace, operation="get").inc()
+            logger.error("Cache get error", key=keys[0], error=str(e))
+            return None
+        value = next((value for value in values if value is not None), None)
+        _observe(namespace, "get", started, value)
+        if value is None:
+            system_monitor.record_cache_miss(namespace)
+        else:
+            system_monitor.record_cache_hit(namespace)
+        return value
+    
+    def update(self, key: KeyT, modify: Callable[[Optional[Any]], Any], ttl: Optional[int] = None, attempts: int = 5) -> Any:
+        """Read-modify-write a value under WATCH, retrying when another writer commits first.
+
+        modify gets the current value (None if missing) and returns the value to
+        store, or None to store nothing. It is called again on each retry, so it
+        must only depend on its argument. Returns the last value modify produced.
+        """
+        namespace = key_namespace(key)
+        started = time.perf_counter()
+        value = None
+        try:
+            with self.redis_client.pipeline() as pipe:
+                for _ in range(attempts):
+                    try:
+                        pipe.watch(key)
+                        current = pipe.get(key)
+                        value = modify(pickle.loads(current) if current else None)
+                        if value is None:
+                            pipe.unwatch()
+                            return None
+                        pipe.multi()
+                        pipe.setex(key, ttl or self.default_ttl, pickle.dumps(value))
+                        pipe.execute()
+                        _observe(namespace, "update", started)
+                        return value
+                    except redis.WatchError:
+                        continue
+            CACHE_ERRORS.labels(namespace=namespace, operation="update").inc()
+            logger.warning("Cache update kept conflicting", key=key, attempts=attempts)
+            return value
+        except redis.RedisError as e:
+            CACHE_ERRORS.labels(namespace=namespace, operation="update").inc()
+            logger.error("Cache update error", key=key, error=str(e))
+            return modify(None) if value is None else value
+    
+    def delete(self, *keys: KeyT) -> bool:
+        """Delete one or more keys from cache"""
         try:
-            return bool(self.redis_client.delete(key))
+            return bool(self.redis_client.delete(*keys))
         except Exception as e:
-            logger.error("Cache delete error", key=key, error=str(e))
+            CACHE_ERRORS.labels(namespace=key_namespace(keys[0]), operation="delete").inc()
+            logger.error("Cache delete error", key=keys[0] if len(keys) == 1 else keys, error=str(e))
             return False
     
-    def exists(self, key: str) -> bool:
+    def exists(self, key: KeyT) -> bool:
         """Check if key exists in cache"""
         try:
             return bool(self.redis_client.exists(key))
         except Exception as e:
+            CACHE_ERRORS.labels(namespace=key_namespace(key), operation="exists").inc()
             logger.error("Cache exists error", key=key, error=str(e))
             return False
     
-    def get_ttl(self, key: str) -> int:
+    def get_ttl(self, key: KeyT) -> int:
         """Get remaining TTL for key"""
         try:
             return self.redis_client.ttl(key)
         except Exception as e:
+            CACHE_ERRORS.labels(namespace=key_namespace(key), operation="ttl").inc()
             logger.error("Cache TTL error", key=key, error=str(e))
             return -1
     
@@ -74,41 +220,203 @@ cache = RedisCache()
 
 def cache_wallet_analysis(wallet_address: str, network: str, data: dict, ttl: int = 3600):
     """Cache wallet analysis results"""
-    key = f"wallet_analysis:{network}:{wallet_address}"
+    key = address_key("wallet_analysis", network, address=wallet_address)
+    track_wallet(wallet_address, network)
     return cache.set(key, data, ttl)
 
 def get_cached_wallet_analysis(wallet_address: str, network: str) -> Optional[dict]:
     """Get cached wallet analysis results"""
-    key = f"wallet_analysis:{network}:{wallet_address}"
+    key = address_key("wallet_analysis", network, address=wallet_address)
     return cache.get(key)
 
+def _response_key(wallet_address: str, network: str, encoding: str) -> bytes:
+    return address_key("wallet_response", network, encoding, address=wallet_address)
+
+def cache_wallet_response(wallet_address: str, network: str, bodies: Dict[str, bytes], ttl: int = 3600) -> bool:
+    """Cache ready-to-send response bodies, one per content encoding; encodings not given are dropped"""
+    return cache.set_many_raw(
+        {_response_key(wallet_address, network, encoding): body for encoding, body in bodies.items()},
+        ttl,
+        delete=[_response_key(wallet_address, network, encoding) for encoding in RESPONSE_ENCODINGS if encoding not in bodies]
+    )
+
+def get_cached_wallet_response(wallet_address: str, network: str, encoding: str) -> Optional[bytes]:
+    """Get a cached response body in one encoding, or the identity body if that encoding is not stored"""
+    if encoding == "identity":
+        return cache.get_raw(_response_key(wallet_address, network, encoding))
+    return cache.get_first_raw(
+        _response_key(wallet_address, network, encoding),
+        _response_key(wallet_address, network, "identity")
+    )
+
+def get_wallet_analysis_ttl(wallet_address: str, network: str) -> int:
+    """Seconds until a cached wallet analysis expires; -2 if it is not cached"""
+    return cache.get_ttl(address_key("wallet_analysis", network, address=wallet_address))
+
 def cache_transaction_data(wallet_address: str, network: str, data: dict, ttl: int = 1800):
     """Cache transaction data"""
-    key = f"transactions:{network}:{wallet_address}"
+    key = address_key("transactions", network, address=wallet_address)
     return cache.set(key, data, ttl)
 
 def get_cached_transaction_data(wallet_address: str, network: str) -> Optional[dict]:
     """Get cached transaction data"""
-    key = f"transactions:{network}:{wallet_address}"
+    key = address_key("transactions", network, address=wallet_address)
     return cache.get(key)
 
 def cache_defi_data(wallet_address: str, data: dict, ttl: int = 1800):
     """Cache DeFi activity data"""
-    key = f"defi_activity:{wallet_address}"
+    key = address_key("defi_activity", address=wallet_address)
     return cache.set(key, data, ttl)
 
 def get_cached_defi_data(wallet_address: str) -> Optional[dict]:
     """Get cached DeFi activity data"""
-    key = f"defi_activity:{wallet_address}"
+    key = address_key("defi_activity", address=wallet_address)
+    return cache.get(key)
+
+def cache_ml_score(model_version: str, network: str, wallet_address: str, score, ttl: int = 3600):
+    """Cache an ML score; keyed by model version so a new model never serves stale scores"""
+    key = address_key("ml_score", model_version, network, address=wallet_address)
+    return cache.set(key, score, ttl)
+
+def get_cached_ml_score(model_version: str, network: str, wallet_address: str):
+    """Get a cached ML score for the given model version"""
+    key = address_key("ml_score", model_version, network, address=wallet_address)
     return cache.get(key)
 
+def cache_wallet_aggregate(wallet_address: str, network: str, state: dict, ttl: int = None):
+    """Cache a wallet's streaming aggregate state"""
+    key = address_key("aggregate", network, address=wallet_address)
+    return cache.set(key, state, ttl or settings.aggregate_ttl)
+
+def get_cached_wallet_aggregate(wallet_address: str, network: str) -> Optional[dict]:
+    """Get a wallet's streaming aggregate state"""
+    key = address_key("aggregate", network, address=wallet_address)
+    return cache.get(key)
+
+def update_cached_wallet_aggregate(wallet_address: str, network: str, modify: Callable[[Optional[dict]], Optional[dict]], ttl: int = None):
+    """Atomically read, modify and store a wallet's streaming aggregate state"""
+    key = address_key("aggregate", network, address=wallet_address)
+    return cache.update(key, modify, ttl or settings.aggregate_ttl)
+
+def _tracked_key(network: str) -> str:
+    return f"tracked_wallets:{network}"
+
+def track_wallet(wallet_address: str, network: str):
+    """Add a wallet to the set the block watcher invalidates when it transacts"""
+    try:
+        cache.redis_client.sadd(_tracked_key(network), address_bytes(wallet_address))
+    except Exception as e:
+        logger.error("Failed to track wallet", wallet_address=wallet_address, network=network, error=str(e))
+
+def get_tracked_wallets(network: str) -> Set[bytes]:
+    """Raw 20-byte addresses of tracked wallets"""
+    try:
+        return set(cache.redis_client.smembers(_tracked_key(network)))
+    except Exception as e:
+        logger.error("Failed to load tracked wallets", network=network, error=str(e))
+        return set()
+
+def untrack_wallets(network: str, raw_addresses: Iterable[bytes]):
+    """Remove wallets from the tracked set; they are added back when next cached"""
+    raw_addresses = list(raw_addresses)
+    if not raw_addresses:
+        return
+    try:
+        cache.redis_client.srem(_tracked_key(network), *raw_addresses)
+    except Exception as e:
+        logger.error("Failed to untrack wallets", network=network, error=str(e))
+
 def invalidate_wallet_cache(wallet_address: str, network: str):
     """Invalidate all cache entries for a wallet"""
-    patterns = [
-        f"wallet_analysis:{network}:{wallet_address}",
-        f"transactions:{network}:{wallet_address}",
-        f"defi_activity:{wallet_address}"
+    keys = [
+        address_key("wallet_analysis", network, address=wallet_address),
+        address_key("transactions", network, address=wallet_address),
+        address_key("defi_activity", address=wallet_address),
+        *(_response_key(wallet_address, network, encoding) for encoding in RESPONSE_ENCODINGS)
     ]
     
-    for pattern in patterns:
-        cache.clear_pattern(pattern) 
\ No newline at end of file
+    # Exact deletes: raw address bytes may contain glob metacharacters
+    cache.delete(*keys)
+
+class KeyspaceReporter:
+    """
+    Periodic sampled report of keys and memory per namespace.
+
+    Samples random keys (RANDOMKEY) and their MEMORY USAGE, and scales each
+    namespace's share of the sample by DBSIZE. Cost is fixed by the sample
+    size whatever the keyspace size, and nothing like KEYS or a full SCAN
+    runs against production Redis. Estimates are published as the cache_keys
+    and cache_memory_bytes gauges.
+    """
+
+    def __init__(self, redis_client=None, sample_size: Optional[int] = None, interval: Optional[float] = None):
+        self.redis_client = redis_client or cache.redis_client
+        self.sample_size = sample_size or settings.cache_keyspace_sample_size
+        self.interval = settings.cache_keyspace_report_interval if interval is None else interval
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def report(self) -> Dict[str, Any]:
+        """Sample the keyspace once and publish the estimates"""
+        total_keys = self.redis_client.dbsize()
+        keys = []
+        if total_keys:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for _ in range(self.sample_size):
+                pipe.randomkey()
+            keys = [key for key in pipe.execute() if key is not None]
+
+        memory = []
+        if keys:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.memory_usage(key, samples=0)
+            memory = pipe.execute(raise_on_error=False)
+
+        counts: Counter = Counter()
+        sizes: Counter = Counter()
+        for key, usage in zip(keys, memory):
+            namespace = key_namespace(key)
+            counts[namespace] += 1
+            # Keys that expired between the two round trips report None
+            if isinstance(usage, int):
+                sizes[namespace] += usage
+
+        scale = total_keys / len(keys) if keys else 0
+        namespaces = {
+            namespace: {
+                "keys": round(counts[namespace] * scale),
+                "memory_bytes": round(sizes[namespace] * scale)
+            }
+            for namespace in sorted(counts)
+        }
+        for namespace in CACHE_NAMESPACES | {"other"}:
+            estimate = namespaces.get(namespace, {"keys": 0, "memory_bytes": 0})
+            CACHE_KEYS.labels(namespace=namespace).set(estimate["keys"])
+            CACHE_MEMORY_BYTES.labels(namespace=namespace).set(estimate["memory_bytes"])
+
+        self.last_report = {
+            "timestamp": time.time(),
+            "total_keys": total_keys,
+            "sampled_keys": len(keys),
+            "namespaces": namespaces
+        }
+        logger.info("Cache keyspace report", total_keys=total_keys, sampled_keys=len(keys), namespaces=namespaces)
+        return self.last_report
+
+    def start(self):
+        """Report every interval in a daemon thread"""
+        if self._thread is not None or self.interval <= 0:
+            return
+        def report_loop():
+            while True:
+                try:
+                    self.report()
+                except Exception as e:
+                    logger.error("Cache keyspace report error", error=str(e))
+                time.sleep(self.interval)
+        self._thread = threading.Thread(target=report_loop, name="keyspace-reporter", daemon=True)
+        self._thread.start()
+
+# Global keyspace reporter instance
+keyspace_reporter = KeyspaceReporter()
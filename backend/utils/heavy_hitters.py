@@ -0,0 +1,146 @@
+"""Per-wallet request frequency, shared across workers through Redis.
+
+Counts go into a Count-Min sketch stored as a Redis bitfield of u32 counters
+(hotkeys_cms_depth rows of hotkeys_cms_width), one per network and counting
+window. Estimates never undercount and overcount by at most
+e / width * total requests with probability 1 - exp(-depth). Wallets whose
+estimate makes the top hotkeys_top_k are kept in a sorted set beside it.
+
+Each worker batches its increments locally and writes them in one pipeline
+every hotkeys_flush_interval seconds, so the request path costs a dict
+update rather than a Redis round trip.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import redis
+
+from config import settings
+from utils.address import address_bytes, address_from_bytes, is_valid_address
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class HeavyHitterTracker:
+    """Windowed Count-Min sketch plus top-k sorted set per network"""
+
+    def __init__(
+        self,
+        redis_client=None,
+        width: Optional[int] = None,
+        depth: Optional[int] = None,
+        top_k: Optional[int] = None,
+        window: Optional[int] = None,
+        flush_interval: Optional[float] = None
+    ):
+        self._redis_client = redis_client
+        self.width = width or settings.hotkeys_cms_width
+        self.depth = depth or settings.hotkeys_cms_depth
+        self.top_k = top_k or settings.hotkeys_top_k
+        self.window = window or settings.hotkeys_window
+        self.flush_interval = settings.hotkeys_flush_interval if flush_interval is None else flush_interval
+        self._pending: Counter = Counter()
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = redis.from_url(settings.redis_url)
+        return self._redis_client
+
+    def _window_id(self, now: Optional[float] = None) -> int:
+        return int((now or time.time()) // self.window)
+
+    def _keys(self, network: str, window_id: int) -> Tuple[str, str]:
+        return f"hotkeys:cms:{network}:{window_id}", f"hotkeys:top:{network}:{window_id}"
+
+    def _cells(self, raw: bytes) -> List[int]:
+        """Counter index in each row for a raw address"""
+        digest = hashlib.blake2b(raw, digest_size=8 * self.depth).digest()
+        columns = np.frombuffer(digest, dtype="<u8") % np.uint64(self.width)
+        return [row * self.width + int(column) for row, column in enumerate(columns)]
+
+    def record(self, wallet_address: str, network: str):
+        """Count one request for a wallet; written to Redis on the next flush"""
+        if not is_valid_address(wallet_address):
+            return
+        with self._lock:
+            self._pending[(network, address_bytes(wallet_address))] += 1
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write batched counts to the shared sketch and update the top-k sets"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        window_id = self._window_id()
+        items = list(pending.items())
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for (network, raw), count in items:
+                cms_key, _ = self._keys(network, window_id)
+                bitfield = pipe.bitfield(cms_key, default_overflow="SAT")
+                for cell in self._cells(raw):
+                    bitfield.incrby("u32", f"#{cell}", count)
+                bitfield.execute()
+            results = pipe.execute()
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            networks = set()
+            for ((network, raw), _), counters in zip(items, results):
+                _, top_key = self._keys(network, window_id)
+                pipe.zadd(top_key, {raw: min(counters)}, gt=True)
+                networks.add(network)
+            for network in networks:
+                cms_key, top_key = self._keys(network, window_id)
+                pipe.zremrangebyrank(top_key, 0, -(self.top_k + 1))
+                # The previous window is still read for sliding estimates
+                pipe.expire(cms_key, 2 * self.window)
+                pipe.expire(top_key, 2 * self.window)
+            pipe.execute()
+        except Exception as e:
+            logger.error("Failed to flush request counts", wallets=len(items), error=str(e))
+
+    def top(self, network: str, k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Most requested wallets over the last window, highest first.
+
+        Sliding-window estimate: the current window's count plus the previous
+        window's, weighted by how much of it still lies inside the last window.
+        """
+        k = k or self.top_k
+        now = time.time()
+        window_id = self._window_id(now)
+        previous_weight = 1 - (now % self.window) / self.window
+        estimates: Dict[bytes, float] = {}
+        try:
+            for wid, weight in ((window_id, 1.0), (window_id - 1, previous_weight)):
+                _, top_key = self._keys(network, wid)
+                for raw, score in self.redis_client.zrevrange(top_key, 0, -1, withscores=True):
+                    estimates[raw] = estimates.get(raw, 0.0) + weight * score
+        except Exception as e:
+            logger.error("Failed to read heavy hitters", network=network, error=str(e))
+            return []
+        ranked = sorted(estimates.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(address_from_bytes(raw), count) for raw, count in ranked]
+
+    def estimate(self, wallet_address: str, network: str) -> int:
+        """Count-Min estimate of a wallet's requests in the current window"""
+        cms_key, _ = self._keys(network, self._window_id())
+        bitfield = self.redis_client.bitfield(cms_key)
+        for cell in self._cells(address_bytes(wallet_address)):
+            bitfield.get("u32", f"#{cell}")
+        return min(bitfield.execute())
+
+# Global tracker instance
+heavy_hitters = HeavyHitterTracker()
@@ -1,11 +1,13 @@
+from utils.address import canonical_address, is_valid_address
+
 def format_wallet_address(address):
-    return address.lower()
+    return canonical_address(address)
 
 def calculate_transaction_fee(gas_price, gas_used):
     return gas_price * gas_used
 
 def is_valid_wallet_address(address):
-    return len(address) == 42 and address.startswith('0x')
+    return is_valid_address(address)
 
 def parse_transaction_data(txn_data):
     return {
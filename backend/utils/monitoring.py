@@ -1,14 +1,28 @@
+import functools
+import os
+import socket
 import time
 import psutil
 import threading
-from typing import Dict, Any
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, Gauge, generate_latest, multiprocess, start_http_server,
+    CONTENT_TYPE_LATEST, REGISTRY
+)
 from fastapi import Request, Response
 from config import settings
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# With several uvicorn workers, each one writes its samples to files in
+# PROMETHEUS_MULTIPROC_DIR and a scrape on any worker aggregates them all.
+# The directory must be emptied before the workers start (see the Dockerfile).
+# Gauges say how per-worker values combine through multiprocess_mode.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir"))
+
 # Prometheus metrics
 REQUEST_COUNT = Counter(
     'http_requests_total',
@@ -48,37 +62,163 @@ API_CALL_DURATION = Histogram(
 
 SYSTEM_MEMORY_USAGE = Gauge(
     'system_memory_usage_bytes',
-    'System memory usage in bytes'
+    'System memory usage in bytes',
+    # Host-wide; every worker samples the same value
+    multiprocess_mode='mostrecent'
 )
 
 SYSTEM_CPU_USAGE = Gauge(
     'system_cpu_usage_percent',
-    'System CPU usage percentage'
+    'System CPU usage percentage',
+    multiprocess_mode='mostrecent'
+)
+
+MODEL_BATCH_SIZE = Histogram(
+    'model_batch_size',
+    'Rows per batched model prediction',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+MODEL_BATCH_QUEUE_WAIT = Histogram(
+    'model_batch_queue_wait_seconds',
+    'Time a prediction request waited for its batch to run',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+
+MODEL_ACTIVE_VERSION = Gauge(
+    'model_active_version',
+    'Active ML model version (1 for the version currently served)',
+    ['version'],
+    # Every version some live worker serves, e.g. mid-rollout
+    multiprocess_mode='livemax'
+)
+
+MODEL_LOAD_DURATION = Gauge(
+    'model_load_duration_seconds',
+    'Time taken to load the active ML model',
+    multiprocess_mode='livemax'
+)
+
+MODEL_LOADED_AT = Gauge(
+    'model_loaded_timestamp_seconds',
+    'Unix time the active ML model was loaded',
+    # The live worker with the oldest model
+    multiprocess_mode='livemin'
+)
+
+WATCHER_BLOCKS_PROCESSED = Counter(
+    'watcher_blocks_processed_total',
+    'Blocks scanned by the block watcher',
+    ['network']
+)
+
+WATCHER_WALLETS_INVALIDATED = Counter(
+    'watcher_wallets_invalidated_total',
+    'Tracked wallets invalidated because they appeared in a new block',
+    ['network', 'mode']
+)
+
+CACHE_WARMED = Counter(
+    'cache_warmed_total',
+    'Wallet analyses re-cached by the warmer before expiry',
+    ['network']
+)
+
+CACHE_WARM_HITS = Counter(
+    'cache_warm_hits_total',
+    'Cache hits served by entries the warmer wrote',
+    ['network']
+)
+
+STAGE_DURATION = Histogram(
+    'analysis_stage_duration_seconds',
+    'Duration of data fetching, analysis and cache stages',
+    ['stage'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
 )
 
 CACHE_HIT_RATIO = Gauge(
     'cache_hit_ratio',
-    'Cache hit ratio'
+    'Cache hit ratio',
+    # A ratio cannot be summed across workers: one series per live worker (pid label);
+    # cache_requests_total gives the aggregate ratio
+    multiprocess_mode='liveall'
+)
+
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'Cache lookups by key namespace and result',
+    ['namespace', 'result']
+)
+
+CACHE_OPERATION_DURATION = Histogram(
+    'cache_operation_duration_seconds',
+    'Cache get/set latency by key namespace',
+    ['namespace', 'operation'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+
+CACHE_PAYLOAD_BYTES = Histogram(
+    'cache_payload_bytes',
+    'Serialized size of values read from or written to the cache',
+    ['namespace', 'operation'],
+    buckets=(64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+)
+
+CACHE_ERRORS = Counter(
+    'cache_errors_total',
+    'Failed cache operations by key namespace',
+    ['namespace', 'operation']
+)
+
+CACHE_KEYS = Gauge(
+    'cache_keys',
+    'Estimated keys per namespace, from the sampled keyspace report',
+    ['namespace'],
+    # Every worker samples the same Redis
+    multiprocess_mode='mostrecent'
+)
+
+CACHE_MEMORY_BYTES = Gauge(
+    'cache_memory_bytes',
+    'Estimated Redis memory per namespace, from the sampled keyspace report',
+    ['namespace'],
+    multiprocess_mode='mostrecent'
 )
 
 class SystemMonitor:
     def __init__(self):
         self.cache_hits = 0
         self.cache_misses = 0
+        # namespace -> [hits, misses]
+        self.cache_namespaces: Dict[str, List[int]] = {}
         self._lock = threading.Lock()
     
-    def record_cache_hit(self):
+    def record_cache_hit(self, namespace: str = "other"):
         """Record a cache hit"""
+        CACHE_REQUESTS.labels(namespace=namespace, result="hit").inc()
         with self._lock:
             self.cache_hits += 1
+            self.cache_namespaces.setdefault(namespace, [0, 0])[0] += 1
             self._update_cache_metrics()
     
-    def record_cache_miss(self):
+    def record_cache_miss(self, namespace: str = "other"):
         """Record a cache miss"""
+        CACHE_REQUESTS.labels(namespace=namespace, result="miss").inc()
         with self._lock:
             self.cache_misses += 1
+            self.cache_namespaces.setdefault(namespace, [0, 0])[1] += 1
             self._update_cache_metrics()
     
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hits, misses and hit ratio per namespace"""
+        with self._lock:
+            counts = {namespace: tuple(hm) for namespace, hm in self.cache_namespaces.items()}
+        return {
+            namespace: {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses)}
+            for namespace, (hits, misses) in counts.items()
+        }
+    
     def _update_cache_metrics(self):
         """Update cache hit ratio metric"""
         total = self.cache_hits + self.cache_misses
@@ -93,8 +233,8 @@ class SystemMonitor:
             memory = psutil.virtual_memory()
             SYSTEM_MEMORY_USAGE.set(memory.used)
             
-            # CPU usage
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU usage since the previous call; non-blocking
+            cpu_percent = psutil.cpu_percent(interval=None)
             SYSTEM_CPU_USAGE.set(cpu_percent)
             
         except Exception as e:
@@ -103,6 +243,117 @@ class SystemMonitor:
 # Global monitor instance
 system_monitor = SystemMonitor()
 
+class UpstreamMonitor:
+    """
+    Outcome of this process's calls to each upstream API.
+
+    The data fetcher records every call (see tracks_upstream). After
+    settings.upstream_failure_threshold failures in a row an upstream is
+    reported failing, until a call to it succeeds again.
+    """
+
+    def __init__(self):
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, api_name: str, success: bool, error: Optional[str] = None):
+        """Record one call's outcome"""
+        now = time.time()
+        with self._lock:
+            state = self._state.setdefault(api_name, {
+                "consecutive_failures": 0, "last_success_at": None, "last_failure_at": None, "last_error": None
+            })
+            if success:
+                state["consecutive_failures"] = 0
+                state["last_success_at"] = now
+            else:
+                state["consecutive_failures"] += 1
+                state["last_failure_at"] = now
+                state["last_error"] = error
+
+    def status(self, configured: Dict[str, bool]) -> Dict[str, Dict[str, Any]]:
+        """Each upstream's status (not_configured, unknown before any call, healthy, degraded or failing) and counts"""
+        with self._lock:
+            states = {name: dict(state) for name, state in self._state.items()}
+        report = {}
+        for name, is_configured in configured.items():
+            state = states.get(name)
+            if not is_configured:
+                status = "not_configured"
+            elif state is None:
+                status = "unknown"
+            elif state["consecutive_failures"] == 0:
+                status = "healthy"
+            elif state["consecutive_failures"] >= settings.upstream_failure_threshold:
+                status = "failing"
+            else:
+                status = "degraded"
+            report[name] = {"status": status, **(state or {})}
+        return report
+
+# Global upstream monitor instance
+upstream_monitor = UpstreamMonitor()
+
+def tracks_upstream(api_name: str):
+    """Record each call's result with the upstream monitor; results without "success" (not configured) are skipped"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            if "success" in result:
+                upstream_monitor.record(api_name, result["success"], result.get("error"))
+            return result
+        return wrapper
+    return decorator
+
+def _configured_upstreams() -> Dict[str, bool]:
+    return {
+        "etherscan": bool(settings.etherscan_api_key),
+        "alchemy": bool(settings.alchemy_api_key),
+        "the_graph": bool(settings.the_graph_api_key),
+        "openai": bool(settings.openai_api_key)
+    }
+
+HTTP_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"}
+UNMATCHED_ENDPOINT = "unmatched"
+OVERFLOW_LABEL = "other"
+
+class LabelGuard:
+    """
+    Caps the distinct values one metric label may take.
+
+    Values seen before the cap keep their own series; later ones are folded
+    into OVERFLOW_LABEL, so a metric's series count stays bounded whatever
+    clients send.
+    """
+
+    def __init__(self, max_values: int):
+        self.max_values = max_values
+        self._values = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __call__(self, value: str) -> str:
+        if value in self._values:
+            return value
+        with self._lock:
+            if value in self._values:
+                return value
+            if len(self._values) >= self.max_values:
+                return OVERFLOW_LABEL
+            self._values.add(value)
+            return value
+
+endpoint_labels = LabelGuard(settings.metrics_max_endpoints)
+
+def route_template(request: Request) -> str:
+    """Path template of the matched route (e.g. /api/wallet/{address}), or UNMATCHED_ENDPOINT"""
+    route = request.scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path else UNMATCHED_ENDPOINT
+
 async def metrics_middleware(request: Request, call_next):
     """FastAPI middleware for metrics collection"""
     start_time = time.time()
@@ -110,47 +361,150 @@ async def metrics_middleware(request: Request, call_next):
     # Process request
     response = await call_next(request)
     
-    # Record metrics
+    # Record metrics, labelled by route template so per-address paths share one series
     duration = time.time() - start_time
-    endpoint = request.url.path
+    endpoint = endpoint_labels(route_template(request))
+    method = request.method if request.method in HTTP_METHODS else OVERFLOW_LABEL
     
     REQUEST_COUNT.labels(
-        method=request.method,
+        method=method,
         endpoint=endpoint,
         status=response.status_code
     ).inc()
     
     REQUEST_DURATION.labels(
-        method=request.method,
+        method=method,
         endpoint=endpoint
     ).observe(duration)
     
     return response
 
+_scrape_lock = threading.Lock()
+_scrape_cache: Tuple[float, bytes] = (0.0, b"")
+
+def _render_metrics() -> bytes:
+    if not MULTIPROCESS:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
 def get_metrics():
     """Get Prometheus metrics"""
+    global _scrape_cache
+    # Aggregating every worker's files costs more with each worker (and each
+    # restart), so concurrent or back-to-back scrapes share one rendering
+    with _scrape_lock:
+        rendered_at, content = _scrape_cache
+        if time.monotonic() - rendered_at >= settings.metrics_scrape_cache_seconds or not content:
+            content = _render_metrics()
+            _scrape_cache = (time.monotonic(), content)
     return Response(
-        content=generate_latest(),
+        content=content,
         media_type=CONTENT_TYPE_LATEST
     )
 
-def get_health_status() -> Dict[str, Any]:
-    """Get comprehensive health status"""
-    try:
-        # System health
+def start_metrics_server(port: Optional[int] = None):
+    """Serve /metrics from a background service (job workers, watcher, warmer) that has no API.
+
+    Under PROMETHEUS_MULTIPROC_DIR the endpoint aggregates every process
+    writing to that directory, so one server in a parent process covers the
+    children it spawns.
+    """
+    port = settings.service_metrics_port if port is None else port
+    if not port:
+        return
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    start_http_server(port, registry=registry)
+    logger.info("Metrics server started", port=port, multiprocess=MULTIPROCESS)
+
+def mark_worker_dead():
+    """Drop this worker's live gauges; its counters and histograms stay in the totals"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+class HealthSampler:
+    """
+    Samples system and dependency health in a background thread.
+
+    Health endpoints only read the latest snapshot, so a probe never blocks
+    on psutil or a dependency. Each dependency check runs with its own
+    timeout, and its last result is kept with when it was taken. Upstream
+    APIs are not probed: the snapshot reports the outcome of the calls this
+    process made (see UpstreamMonitor). A failing upstream degrades the
+    status but not readiness, since every worker shares it.
+    """
+
+    def __init__(self, interval: Optional[float] = None, check_timeout: Optional[float] = None):
+        self.interval = interval or settings.health_sample_interval
+        self.check_timeout = check_timeout or settings.health_check_timeout
+        self.checks: Dict[str, Callable[[], str]] = {
+            "redis": self._check_redis,
+            "database": self._check_database
+        }
+        self._executor = ThreadPoolExecutor(max_workers=len(self.checks), thread_name_prefix="health-check")
+        self._redis_client = None
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # Primes psutil so the first non-blocking sample has a baseline
+        psutil.cpu_percent(interval=None)
+
+    def _check_redis(self) -> str:
+        """PING on a client with short socket timeouts"""
+        if self._redis_client is None:
+            import redis
+            self._redis_client = redis.from_url(
+                settings.redis_url,
+                socket_timeout=self.check_timeout,
+                socket_connect_timeout=self.check_timeout
+            )
+        return "healthy" if self._redis_client.ping() else "unhealthy"
+
+    def _check_database(self) -> str:
+        """TCP reachability of the database server"""
+        url = urlparse(settings.database_url)
+        with socket.create_connection((url.hostname or "localhost", url.port or 5432), timeout=self.check_timeout):
+            return "healthy"
+
+    def _run_checks(self) -> Dict[str, Dict[str, Any]]:
+        futures = {name: (self._executor.submit(check), time.time()) for name, check in self.checks.items()}
+        results = {}
+        for name, (future, started) in futures.items():
+            remaining = max(0.0, started + self.check_timeout - time.time())
+            try:
+                results[name] = {"status": future.result(timeout=remaining)}
+            except FutureTimeoutError:
+                results[name] = {"status": "unhealthy", "error": "timeout"}
+            except Exception as e:
+                results[name] = {"status": "unhealthy", "error": str(e)}
+            results[name]["latency_ms"] = round((time.time() - started) * 1000, 1)
+            results[name]["checked_at"] = started
+        return results
+
+    def sample(self) -> Dict[str, Any]:
+        """Take a fresh snapshot and publish it"""
         memory = psutil.virtual_memory()
-        cpu_percent = psutil.cpu_percent(interval=1)
+        cpu_percent = psutil.cpu_percent(interval=None)
         disk = psutil.disk_usage('/')
+        SYSTEM_MEMORY_USAGE.set(memory.used)
+        SYSTEM_CPU_USAGE.set(cpu_percent)
         
-        # Cache health
-        cache_total = system_monitor.cache_hits + system_monitor.cache_misses
-        cache_hit_ratio = system_monitor.cache_hits / cache_total if cache_total > 0 else 0
+        checks = self._run_checks()
+        upstreams = upstream_monitor.status(_configured_upstreams())
+        status = "healthy"
+        if (memory.percent > 90 or cpu_percent > 90 or
+                any(check["status"] == "unhealthy" for check in checks.values()) or
+                any(upstream["status"] == "failing" for upstream in upstreams.values())):
+            status = "degraded"
         
-        health_status = {
-            "status": "healthy",
+        snapshot = {
+            "status": status,
             "timestamp": time.time(),
-            "version": settings.app_version,
-            "environment": settings.environment,
             "system": {
                 "memory_usage_percent": memory.percent,
                 "cpu_usage_percent": cpu_percent,
@@ -158,93 +512,87 @@ def get_health_status() -> Dict[str, Any]:
                 "memory_available_gb": memory.available / (1024**3),
                 "disk_available_gb": disk.free / (1024**3)
             },
-            "cache": {
-                "hits": system_monitor.cache_hits,
-                "misses": system_monitor.cache_misses,
-                "hit_ratio": cache_hit_ratio
-            },
-            "dependencies": {
-                "redis": _check_redis_health(),
-                "database": _check_database_health(),
-                "external_apis": _check_external_apis_health()
-            }
+            "checks": checks,
+            "upstreams": upstreams
         }
-        
-        # Determine overall health
-        if (memory.percent > 90 or cpu_percent > 90 or 
-            health_status["dependencies"]["redis"] == "unhealthy" or
-            health_status["dependencies"]["database"] == "unhealthy"):
-            health_status["status"] = "degraded"
-        
-        return health_status
-        
-    except Exception as e:
-        logger.error("Health check failed", error=str(e))
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._snapshot
+
+    def start(self):
+        """Sample every interval in a daemon thread"""
+        if self._thread is not None:
+            return
+        def sample_loop():
+            while True:
+                try:
+                    self.sample()
+                except Exception as e:
+                    logger.error("Health sampling error", error=str(e))
+                time.sleep(self.interval)
+        self._thread = threading.Thread(target=sample_loop, name="health-sampler", daemon=True)
+        self._thread.start()
+
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        """Whether this worker should receive traffic: fresh snapshot and required dependencies healthy"""
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return False, {"status": "not_ready", "reason": "no health sample yet"}
+        age = time.time() - snapshot["timestamp"]
+        failing = [
+            name for name in settings.health_required_dependencies
+            if snapshot["checks"].get(name, {}).get("status") != "healthy"
+        ]
+        ready = age <= settings.health_stale_after and not failing
+        body = {"status": "ready" if ready else "not_ready", "sample_age_seconds": round(age, 3)}
+        if failing:
+            body["failing"] = failing
+        if age > settings.health_stale_after:
+            body["reason"] = "health sample is stale"
+        return ready, body
+
+# Global health sampler instance
+health_sampler = HealthSampler()
+
+def get_health_status() -> Dict[str, Any]:
+    """Get comprehensive health status from the latest background sample"""
+    snapshot = health_sampler.snapshot()
+    if snapshot is None:
         return {
-            "status": "unhealthy",
-            "error": str(e),
-            "timestamp": time.time()
+            "status": "starting",
+            "timestamp": time.time(),
+            "version": settings.app_version,
+            "environment": settings.environment
         }
-
-def _check_redis_health() -> str:
-    """Check Redis health"""
-    try:
-        from utils.cache import cache
-        # Try a simple operation
-        test_key = "health_check_test"
-        cache.set(test_key, "test", 10)
-        result = cache.get(test_key)
-        cache.delete(test_key)
-        
-        if result == "test":
-            return "healthy"
-        else:
-            return "unhealthy"
-    except Exception:
-        return "unhealthy"
-
-def _check_database_health() -> str:
-    """Check database health"""
-    try:
-        # TODO: Implement actual database health check
-        # For now, return healthy
-        return "healthy"
-    except Exception:
-        return "unhealthy"
-
-def _check_external_apis_health() -> Dict[str, str]:
-    """Check external APIs health"""
-    api_status = {}
     
-    # Check if API keys are configured
-    if settings.etherscan_api_key:
-        api_status["etherscan"] = "configured"
-    else:
-        api_status["etherscan"] = "not_configured"
+    # Cache health
+    cache_total = system_monitor.cache_hits + system_monitor.cache_misses
+    cache_hit_ratio = system_monitor.cache_hits / cache_total if cache_total > 0 else 0
     
-    if settings.alchemy_api_key:
-        api_status["alchemy"] = "configured"
-    else:
-        api_status["alchemy"] = "not_configured"
-    
-    if settings.openai_api_key:
-        api_status["openai"] = "configured"
-    else:
-        api_status["openai"] = "not_configured"
-    
-    return api_status
+    return {
+        "status": snapshot["status"],
+        "timestamp": snapshot["timestamp"],
+        "version": settings.app_version,
+        "environment": settings.environment,
+        "system": snapshot["system"],
+        "cache": {
+            "hits": system_monitor.cache_hits,
+            "misses": system_monitor.cache_misses,
+            "hit_ratio": cache_hit_ratio,
+            "namespaces": system_monitor.cache_stats()
+        },
+        "dependencies": {
+            **{name: check["status"] for name, check in snapshot["checks"].items()},
+            "external_apis": snapshot["upstreams"]
+        },
+        "checks": snapshot["checks"]
+    }
 
 def start_system_monitoring():
     """Start background system monitoring"""
-    def monitor_loop():
-        while True:
-            try:
-                system_monitor.update_system_metrics()
-                time.sleep(60)  # Update every minute
-            except Exception as e:
-                logger.error("System monitoring error", error=str(e))
-                time.sleep(60)
-    
-    monitor_thread = threading.Thread(target=monitor_loop, daemon=True)
-    monitor_thread.start()
-    logger.info("System monitoring started") 
\ No newline at end of file
+    health_sampler.start()
+    logger.info("System monitoring started", interval=health_sampler.interval)
@@ -13,7 +13,7 @@ class RateLimiter:
         self.minute_limit = settings.rate_limit_per_minute
         self.hour_limit = settings.rate_limit_per_hour
     
-    def _get_client_id(self, request: Request) -> str:
+    def _get_client_id(self, request: Request) -> bytes:
         """Get unique client identifier"""
         # Try to get from X-Forwarded-For header first (for proxy setups)
         client_ip = request.headers.get("X-Forwarded-For")
@@ -23,17 +23,17 @@ class RateLimiter:
         # Add user agent for additional uniqueness
         user_agent = request.headers.get("User-Agent", "")
         
-        # Create hash for privacy
-        client_id = hashlib.sha256(f"{client_ip}:{user_agent}".encode()).hexdigest()
+        # Hash for privacy; the raw 16-byte digest keeps Redis keys short
+        client_id = hashlib.blake2b(f"{client_ip}:{user_agent}".encode(), digest_size=16).digest()
         return client_id
     
-    def _get_rate_limit_keys(self, client_id: str) -> Tuple[str, str]:
+    def _get_rate_limit_keys(self, client_id: bytes) -> Tuple[bytes, bytes]:
         """Get rate limit keys for minute and hour windows"""
         current_minute = int(time.time() // 60)
         current_hour = int(time.time() // 3600)
         
-        minute_key = f"rate_limit:minute:{client_id}:{current_minute}"
-        hour_key = f"rate_limit:hour:{client_id}:{current_hour}"
+        minute_key = b"rate_limit:minute:" + client_id + b":%d" % current_minute
+        hour_key = b"rate_limit:hour:" + client_id + b":%d" % current_hour
         
         return minute_key, hour_key
     
@@ -48,7 +48,7 @@ class RateLimiter:
         
         # Check limits
         if minute_count >= self.minute_limit:
-            logger.warning("Rate limit exceeded (minute)", client_id=client_id, count=minute_count)
+            logger.warning("Rate limit exceeded (minute)", client_id=client_id.hex(), count=minute_count)
             raise HTTPException(
                 status_code=429,
                 detail={
@@ -59,7 +59,7 @@ class RateLimiter:
             )
         
         if hour_count >= self.hour_limit:
-            logger.warning("Rate limit exceeded (hour)", client_id=client_id, count=hour_count)
+            logger.warning("Rate limit exceeded (hour)", client_id=client_id.hex(), count=hour_count)
             raise HTTPException(
                 status_code=429,
                 detail={
@@ -0,0 +1,195 @@
+"""Streaming sketches with fixed memory.
+
+HyperLogLog (distinct counts) and KLL (quantiles) are updated in vectorized
+batches and can be merged across partial states; Reservoir keeps a uniform
+sample of examples. Each sketch documents its error bound so results computed
+from it can report one.
+"""
+import math
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from utils.address import ADDRESS_BYTES, addresses_to_array, is_valid_address
+
+def mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: spreads any uint64 input uniformly over 64 bits"""
+    with np.errstate(over="ignore"):
+        x = x ^ (x >> np.uint64(30))
+        x = x * np.uint64(0xBF58476D1CE4E5B9)
+        x = x ^ (x >> np.uint64(27))
+        x = x * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+def address_words(raw: np.ndarray) -> np.ndarray:
+    """(n, 3) uint64 view of S20 addresses: bytes 0-7, 8-15 and 16-19"""
+    record = np.zeros((len(raw), 24), dtype=np.uint8)
+    record[:, :ADDRESS_BYTES] = np.ascontiguousarray(raw, dtype=f"S{ADDRESS_BYTES}").view(np.uint8).reshape(-1, ADDRESS_BYTES)
+    return record.view("<u8")
+
+def hash_addresses(raw: np.ndarray) -> np.ndarray:
+    """64-bit hash of each S20 address"""
+    words = address_words(raw)
+    with np.errstate(over="ignore"):
+        return mix64(words[:, 0] ^ mix64(words[:, 1] ^ mix64(words[:, 2] + np.uint64(0x9E3779B97F4A7C15))))
+
+class HyperLogLog:
+    """
+    Distinct-count sketch with 2^precision one-byte registers.
+
+    Relative standard error is 1.04 / sqrt(2^precision): 1.6% for the default
+    precision of 12 (4 KB). Small cardinalities use linear counting and are
+    effectively exact.
+    """
+
+    def __init__(self, precision: int = 12, registers: np.ndarray = None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def add_hashes(self, hashes: np.ndarray):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) == 0:
+            return
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        remaining = (hashes << np.uint64(self.precision)) | np.uint64(1 << (self.precision - 1))
+        # Rank of the first set bit; float64 log2 is exact enough for a leading-zero count
+        rank = (64 - np.floor(np.log2(remaining.astype(np.float64)))).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add_addresses(self, addresses: Iterable[str]):
+        """Add valid addresses, case-insensitively"""
+        valid = [address for address in addresses if address and is_valid_address(address)]
+        if valid:
+            self.add_hashes(hash_addresses(addresses_to_array(valid)))
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> float:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m ** 2 / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            return self.m * math.log(self.m / zeros)
+        return float(estimate)
+
+    def to_dict(self) -> Dict:
+        return {"precision": self.precision, "registers": self.registers.tobytes()}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "HyperLogLog":
+        return cls(data["precision"], np.frombuffer(data["registers"], dtype=np.uint8).copy())
+
+class KLLSketch:
+    """
+    Quantile sketch (Karnin, Lang, Liberty) keeping about 3k values.
+
+    Each level holds values of weight 2^level; a full level is sorted and every
+    other value is promoted, so memory is O(k) however many values are added.
+    The normalized rank error at 99% confidence is 2.296 / k^0.9723: 1.3% for
+    the default k of 200.
+    """
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        self.k = k
+        self.count = 0
+        self.levels: List[np.ndarray] = [np.zeros(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def rank_error(self) -> float:
+        return 2.296 / self.k ** 0.9723
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(level.nbytes for level in self.levels)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.zeros(0))
+            items = np.sort(items)
+            # An odd value out stays at this level, so total weight is preserved exactly
+            keep = items[len(items) - len(items) % 2:]
+            promoted = items[self._rng.integers(2):len(items) - len(items) % 2:2]
+            self.levels[level] = keep
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            # Capacities shrink as levels are added, so rescan from the bottom
+            level = 0
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.zeros(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+
+    def quantiles(self, qs: Iterable[float]) -> List[float]:
+        """Approximate value at each quantile in [0, 1]"""
+        qs = list(qs)
+        if self.count == 0:
+            return [float("nan")] * len(qs)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        values, cumulative = values[order], np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side="left")
+        return values[np.minimum(positions, len(values) - 1)].tolist()
+
+    def quantile(self, q: float) -> float:
+        return self.quantiles([q])[0]
+
+    def rank(self, value: float) -> float:
+        """Approximate fraction of values at or below value"""
+        if self.count == 0:
+            return 0.0
+        weights = [np.count_nonzero(items <= value) * 2.0 ** level for level, items in enumerate(self.levels)]
+        return float(sum(weights) / self.count)
+
+class Reservoir:
+    """Uniform random sample of at most size items from a stream (algorithm R)"""
+
+    def __init__(self, size: int, seed: Optional[int] = None):
+        self.size = size
+        self.seen = 0
+        self.items: List[Any] = []
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, item: Any):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            slot = self._rng.integers(self.seen)
+            if slot < self.size:
+                self.items[slot] = item
+
+    def extend(self, items: Iterable[Any]):
+        for item in items:
+            self.add(item)
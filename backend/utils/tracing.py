@@ -0,0 +1,217 @@
+"""Per-stage latency spans for the analysis pipeline.
+
+Wrap a stage in span() (or decorate it with traced()) and its duration is
+observed in the analysis_stage_duration_seconds histogram, labelled by stage
+name. Stage names are fixed strings such as "fetch.etherscan" or "risk";
+per-call details go in span attributes, never in the name.
+
+When tracing_export_path or tracing_otlp_endpoint is set, finished spans are
+also exported in OTLP/JSON form (one ResourceSpans object per line in the
+file, or POSTed to <endpoint>/v1/traces), so any OpenTelemetry collector or
+viewer can read them. Nested spans share a trace and point at their parent.
+Export happens on a background thread; spans that would overflow its queue
+are dropped rather than slowing requests down.
+
+With tracing_enabled off, span() hands back one shared no-op object.
+
+Do not hold a span open across a generator's yield: streaming consumers may
+resume the generator in another context.
+"""
+import contextvars
+import functools
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import orjson
+import requests
+
+from config import settings
+from utils.logger import get_logger
+from utils.monitoring import STAGE_DURATION
+
+logger = get_logger(__name__)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class Span:
+    """One timed stage; exported as an OTLP span when an exporter is configured"""
+
+    __slots__ = ("name", "attributes", "trace_id", "span_id", "parent_id", "_start", "_start_ns", "_token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = self.span_id = self.parent_id = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        if exporter.active:
+            parent = _current_span.get()
+            self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+            self.parent_id = parent.span_id if parent is not None else ""
+            self.span_id = os.urandom(8).hex()
+            self._start_ns = time.time_ns()
+            self._token = _current_span.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        _stage_histogram(self.name).observe(duration)
+        if self._token is not None:
+            _current_span.reset(self._token)
+            exporter.submit(self._otlp(duration, exc))
+        return False
+
+    def _otlp(self, duration: float, exc: Optional[BaseException]) -> Dict[str, Any]:
+        status = {"code": STATUS_OK} if exc is None else {"code": STATUS_ERROR, "message": str(exc)}
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self._start_ns),
+            "endTimeUnixNano": str(self._start_ns + int(duration * 1e9)),
+            "attributes": [{"key": key, "value": _attribute_value(value)} for key, value in self.attributes.items()],
+            "status": status
+        }
+
+_histograms: Dict[str, Any] = {}
+
+def _stage_histogram(name: str):
+    """Labelled histogram child, cached so observing skips the label lookup"""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = STAGE_DURATION.labels(stage=name)
+    return histogram
+
+def span(name: str, **attributes):
+    """Time a stage: `with span("risk", network=network): ...`"""
+    if not settings.tracing_enabled:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+def traced(name: str):
+    """Decorator form of span() for a whole function"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class SpanExporter:
+    """Batches finished spans to a JSONL file and/or an OTLP/HTTP collector"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        endpoint: Optional[str] = None,
+        service_name: Optional[str] = None
+    ):
+        self.path = path
+        self.endpoint = endpoint.rstrip("/") + "/v1/traces" if endpoint else None
+        self.service_name = service_name or settings.app_name
+        self.active = bool(settings.tracing_enabled and (self.path or self.endpoint))
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=settings.tracing_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, otlp_span: Dict[str, Any]):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(otlp_span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_started(self):
+        # Started lazily so forked workers each get their own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + settings.tracing_flush_interval
+            while len(batch) < settings.tracing_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.export(batch)
+
+    def export(self, spans: List[Dict[str, Any]]):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": self.service_name}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}}
+                ]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}]
+            }]
+        }
+        body = orjson.dumps(payload)
+        if self.path:
+            try:
+                with open(self.path, "ab") as f:
+                    f.write(body + b"\n")
+            except OSError as e:
+                logger.error("Failed to write spans", path=self.path, spans=len(spans), error=str(e))
+        if self.endpoint:
+            try:
+                requests.post(
+                    self.endpoint, data=body, timeout=5,
+                    headers={"Content-Type": "application/json"}
+                ).raise_for_status()
+            except requests.exceptions.RequestException as e:
+                logger.error("Failed to send spans", endpoint=self.endpoint, spans=len(spans), error=str(e))
+
+# Global exporter instance
+exporter = SpanExporter(
+    settings.tracing_export_path,
+    settings.tracing_otlp_endpoint,
+    settings.tracing_service_name
+)